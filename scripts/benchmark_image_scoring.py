@@ -0,0 +1,274 @@
+"""
+EverLiving Image Scoring Benchmark
+Đo tốc độ AI chấm điểm ảnh trên bộ ảnh tổng hợp (tạo offline, cố định theo seed)
+
+Cách dùng:
+    python scripts/benchmark_image_scoring.py --count 8 --output bench.json
+
+Kết quả JSON (so sánh được giữa các commit):
+    {
+        'meta':   {commit, scorer_version, seed, ...},
+        'stages': {tên_stage: {images, total_s, images_per_sec, p50_ms, p95_ms}},
+        'sharpness': {'WxH': {'k0': điểm_độ_rõ, 'k25': ...}},   # ảnh nhoè phải điểm thấp
+        'peak_rss_mb': ...
+    }
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+import cv2
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+
+import video_processor  # noqa: E402
+
+# ================= CẤU HÌNH BENCHMARK =================
+BENCHMARK_RESOLUTIONS = [       # (W, H) - từ ảnh nhỏ tới ảnh điện thoại 12MP
+    (640, 480),
+    (1920, 1080),
+    (3024, 4032),
+    (4032, 3024),
+]
+BENCHMARK_SEED = 1234           # Seed cố định → bộ ảnh giống hệt nhau giữa các lần chạy
+JPEG_QUALITY = 90
+STAGES = ('header', 'decode', 'quality', 'faces', 'total', 'batch')
+BLUR_KERNELS = (0, 5, 11, 25, 61)  # Gaussian blur (kernel) khi kiểm tra điểm độ rõ
+
+
+# ================= TẠO BỘ ẢNH TỔNG HỢP =================
+def draw_face_pattern(img, center, radius, rng):
+    """Vẽ hình giống khuôn mặt: oval màu da, 2 mắt, mũi, miệng"""
+    cx, cy = center
+    skin = tuple(int(c) for c in rng.integers(120, 200, size=3))
+    cv2.ellipse(img, (cx, cy), (radius, int(radius * 1.3)), 0, 0, 360, skin, -1)
+
+    eye_dx, eye_dy = int(radius * 0.4), int(radius * 0.3)
+    eye_r = max(2, radius // 8)
+    for side in (-1, 1):
+        cv2.circle(img, (cx + side * eye_dx, cy - eye_dy), eye_r, (40, 30, 30), -1)
+        cv2.ellipse(img, (cx + side * eye_dx, cy - eye_dy - eye_r * 2), (eye_r * 2, eye_r // 2 + 1),
+                    0, 0, 360, (50, 40, 40), -1)
+
+    cv2.line(img, (cx, cy - eye_r), (cx, cy + int(radius * 0.3)), (90, 80, 110), max(1, radius // 20))
+    cv2.ellipse(img, (cx, cy + int(radius * 0.6)), (int(radius * 0.4), int(radius * 0.15)),
+                0, 0, 180, (60, 50, 150), max(1, radius // 15))
+
+
+def generate_synthetic_image(width, height, with_faces, rng):
+    """Ảnh BGR: nền gradient + nhiễu + vài khối hình học, tuỳ chọn có khuôn mặt giả"""
+    x = np.linspace(0, 1, width, dtype=np.float32)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    base = rng.uniform(60, 180, size=3).astype(np.float32)
+    tilt = rng.uniform(-60, 60, size=3).astype(np.float32)
+    img = base + (x[None, :, None] * tilt + y[..., None] * tilt[::-1])
+    img = img + rng.normal(0, 8, size=(height, width, 1)).astype(np.float32)
+    img = np.clip(img, 0, 255).astype(np.uint8)
+
+    for _ in range(6):
+        color = tuple(int(c) for c in rng.integers(0, 255, size=3))
+        x1, y1 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        x2, y2 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        cv2.rectangle(img, (min(x1, x2), min(y1, y2)), (max(x1, x2), max(y1, y2)), color, -1)
+
+    if with_faces:
+        num_faces = int(rng.integers(1, 4))
+        for index in range(num_faces):
+            radius = int(min(width, height) * rng.uniform(0.08, 0.15))
+            cx = int(width * (index + 1) / (num_faces + 1))
+            cy = int(height * rng.uniform(0.35, 0.6))
+            draw_face_pattern(img, (cx, cy), radius, rng)
+
+    return img
+
+
+def build_corpus(corpus_dir, count, seed=BENCHMARK_SEED):
+    """
+    Tạo (hoặc dùng lại) bộ ảnh tổng hợp: count ảnh cho mỗi (độ phân giải × có/không mặt)
+
+    Returns:
+        list: [(đường_dẫn, thông_tin), ...]
+    """
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    corpus = []
+
+    for width, height in BENCHMARK_RESOLUTIONS:
+        for with_faces in (False, True):
+            for index in range(count):
+                filename = f"synthetic_{width}x{height}_{'faces' if with_faces else 'plain'}_{index:03d}.jpg"
+                path = os.path.join(corpus_dir, filename)
+                # Luôn sinh ảnh để chuỗi random không phụ thuộc file nào đã có sẵn
+                img = generate_synthetic_image(width, height, with_faces, rng)
+                if not os.path.exists(path):
+                    cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                corpus.append((path, {'width': width, 'height': height, 'faces': with_faces}))
+
+    return corpus
+
+
+# ================= ĐO THỜI GIAN =================
+def get_peak_rss_mb():
+    """Peak RSS của process hiện tại (MB)"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về bytes
+        return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+    except ImportError:
+        try:
+            import psutil
+            memory = psutil.Process().memory_info()
+            return round(getattr(memory, 'peak_wset', memory.rss) / (1024 * 1024), 1)
+        except ImportError:
+            return None
+
+
+def summarize_latencies(latencies):
+    """Thống kê images/sec, p50, p95 từ danh sách latency (giây/ảnh)"""
+    if not latencies:
+        return {'images': 0, 'total_s': 0.0, 'images_per_sec': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0}
+    values = np.array(latencies)
+    total = float(values.sum())
+    return {
+        'images': len(latencies),
+        'total_s': round(total, 4),
+        'images_per_sec': round(len(latencies) / total, 2) if total > 0 else 0.0,
+        'p50_ms': round(float(np.percentile(values, 50)) * 1000, 2),
+        'p95_ms': round(float(np.percentile(values, 95)) * 1000, 2),
+    }
+
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run_stage_benchmarks(corpus, stages, repeat):
+    """Chạy từng stage chấm điểm trên toàn bộ corpus, trả về latency theo stage"""
+    latencies = {stage: [] for stage in stages}
+    image_paths = [path for path, _ in corpus]
+
+    for _ in range(repeat):
+        for image_path in image_paths:
+            if 'header' in stages or 'decode' in stages or 'quality' in stages or 'faces' in stages:
+                elapsed, context = time_call(video_processor.read_image_header, image_path)
+                if 'header' in stages:
+                    latencies['header'].append(elapsed)
+
+                elapsed, _ = time_call(video_processor.decode_image_context, context)
+                if 'decode' in stages:
+                    latencies['decode'].append(elapsed)
+
+                if 'quality' in stages:
+                    elapsed, _ = time_call(video_processor.calculate_image_quality_score, image_path, context)
+                    latencies['quality'].append(elapsed)
+
+                if 'faces' in stages:
+                    elapsed, _ = time_call(video_processor.detect_faces_and_score, image_path, context)
+                    latencies['faces'].append(elapsed)
+
+            if 'total' in stages:
+                elapsed, _ = time_call(video_processor.calculate_total_image_score, image_path)
+                latencies['total'].append(elapsed)
+
+        if 'batch' in stages:
+            # Batch: latency mỗi ảnh = thời gian cả batch / số ảnh trong batch
+            for start in range(0, len(image_paths), video_processor.SCORING_BATCH_SIZE):
+                batch = image_paths[start:start + video_processor.SCORING_BATCH_SIZE]
+                elapsed, _ = time_call(video_processor.measure_image_scores_batch, batch, video_processor.RESOLUTION)
+                latencies['batch'].extend([elapsed / len(batch)] * len(batch))
+
+    return latencies
+
+
+def run_sharpness_check(corpus, corpus_dir):
+    """Điểm độ rõ của 1 ảnh mỗi độ phân giải sau khi Gaussian blur (kiểm tra ảnh nhoè vẫn điểm thấp)"""
+    report = {}
+    for path, info in corpus:
+        key = f"{info['width']}x{info['height']}"
+        if key in report or info['faces']:
+            continue
+        img = cv2.imread(path)
+        report[key] = {}
+        for kernel in BLUR_KERNELS:
+            blurred = cv2.GaussianBlur(img, (kernel, kernel), 0) if kernel else img
+            blurred_path = os.path.join(corpus_dir, f"blur_{key}_k{kernel}.jpg")
+            cv2.imwrite(blurred_path, blurred, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            context = video_processor.load_image_context(blurred_path)
+            report[key][f"k{kernel}"] = round(video_processor.measure_sharpness(context['img']) /
+                                              video_processor.SHARPNESS_VAR_DIVISOR, 2)
+    return {key: {k: min(video_processor.SHARPNESS_MAX_SCORE, v) for k, v in values.items()}
+            for key, values in report.items()}
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark AI chấm điểm ảnh trên bộ ảnh tổng hợp')
+    parser.add_argument('--count', type=int, default=4, help='Số ảnh mỗi (độ phân giải × có/không mặt)')
+    parser.add_argument('--repeat', type=int, default=1, help='Số lần lặp toàn bộ corpus')
+    parser.add_argument('--seed', type=int, default=BENCHMARK_SEED)
+    parser.add_argument('--corpus-dir', default=None, help='Thư mục chứa corpus (mặc định: thư mục tạm)')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"Các stage cần đo: {','.join(STAGES)}")
+    parser.add_argument('--output', default=None, help='Ghi kết quả JSON ra file (mặc định: stdout)')
+    args = parser.parse_args()
+
+    stages = [stage for stage in args.stages.split(',') if stage in STAGES]
+    corpus_dir = args.corpus_dir or os.path.join(tempfile.gettempdir(), f'everliving_bench_corpus_{args.seed}')
+
+    corpus_start = time.perf_counter()
+    corpus = build_corpus(corpus_dir, args.count, args.seed)
+    corpus_seconds = time.perf_counter() - corpus_start
+    print(f"📁 Corpus: {len(corpus)} ảnh tại {corpus_dir} ({corpus_seconds:.1f}s)", file=sys.stderr)
+
+    # Warm detector trước để stage đầu tiên không bị tính thời gian khởi tạo model
+    video_processor.warm_up_face_detectors()
+
+    latencies = run_stage_benchmarks(corpus, stages, args.repeat)
+
+    report = {
+        'meta': {
+            'commit': get_git_commit(),
+            'scorer_version': video_processor.SCORER_VERSION,
+            'seed': args.seed,
+            'count_per_variant': args.count,
+            'repeat': args.repeat,
+            'corpus_images': len(corpus),
+            'resolutions': [f"{w}x{h}" for w, h in BENCHMARK_RESOLUTIONS],
+            'target_resolution': list(video_processor.RESOLUTION),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'cpu_count': os.cpu_count(),
+        },
+        'stages': {stage: summarize_latencies(latencies[stage]) for stage in stages},
+        'sharpness': run_sharpness_check(corpus, corpus_dir),
+        'peak_rss_mb': get_peak_rss_mb(),
+    }
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"✅ Đã ghi kết quả: {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
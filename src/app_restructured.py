@@ -40,6 +40,7 @@ except ImportError:
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 STORAGE_DIR = os.path.join(PROJECT_ROOT, 'storage')
 os.makedirs(STORAGE_DIR, exist_ok=True)
+MAX_SCORE_IMAGES_PER_REQUEST = 1000  # /api/score_images batch limit
 
 # Change working directory to project root
 os.chdir(PROJECT_ROOT)
@@ -976,6 +977,13 @@ def upload_memory():
         file_path = os.path.join(target_dir, unique_filename)
         file.save(file_path)
         
+        # For images, queue AI scoring in background so render time only reads precomputed scores
+        if is_image:
+            try:
+                video_processor.enqueue_background_scoring(file_path, os.path.join(STORAGE_DIR, current_user))
+            except Exception as e:
+                print(f'⚠️ Could not queue background scoring: {e}')
+        
         # For videos, generate preview
         preview_url = None
         if is_video:
@@ -1182,6 +1190,62 @@ def get_images():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/api/score_images', methods=['POST'])
+@require_auth
+def score_images():
+    """Get AI scores for a list of images (cached scores, missing ones are scored in background)"""
+    try:
+        current_user = get_current_user()
+        data = request.get_json(silent=True) or {}
+        filenames = data.get('filenames')
+        
+        if not isinstance(filenames, list) or not filenames:
+            return jsonify({'success': False, 'message': 'Thiếu danh sách filenames'}), 400
+        
+        if len(filenames) > MAX_SCORE_IMAGES_PER_REQUEST:
+            return jsonify({
+                'success': False,
+                'message': f'Tối đa {MAX_SCORE_IMAGES_PER_REQUEST} ảnh mỗi lần'
+            }), 400
+        
+        # Optional video format to score resolution against
+        target_resolution = {
+            'horizontal': video_processor.RESOLUTION_HORIZONTAL,
+            'vertical': video_processor.RESOLUTION_VERTICAL,
+            'square': video_processor.RESOLUTION_SQUARE
+        }.get(data.get('format'))
+        
+        library_folder = os.path.join(STORAGE_DIR, current_user)
+        images_dir = os.path.join(library_folder, 'images')
+        
+        scores = {}
+        image_paths = {}
+        for filename in filenames:
+            if not isinstance(filename, str):
+                continue
+            safe_name = secure_filename(filename)
+            file_path = os.path.join(images_dir, safe_name)
+            if safe_name != filename or not os.path.isfile(file_path):
+                scores[filename] = {'status': 'not_found'}
+            else:
+                image_paths[file_path] = filename
+        
+        # Only reads the score index - AI scoring never runs on the request thread
+        results = video_processor.lookup_image_scores(list(image_paths), library_folder, target_resolution)
+        for file_path, result in results.items():
+            scores[image_paths[file_path]] = result
+        
+        pending_count = sum(1 for result in scores.values() if result['status'] == 'pending')
+        
+        return jsonify({
+            'success': True,
+            'scores': scores,
+            'pending': pending_count
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/api/get_videos')
 @require_auth
 def get_videos():
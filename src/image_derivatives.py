@@ -0,0 +1,126 @@
+"""
+EverLiving Image Derivatives
+Tạo và chọn bản thu nhỏ (derivative pyramid) cho ảnh trong thư viện user
+
+Mỗi ảnh upload được lưu kèm các bản cạnh dài 360 / 720 / 1280 px (đã xoay theo EXIF):
+    images/<tên_file>
+    images/derivatives/360/<tên_file>
+    images/derivatives/720/<tên_file>
+    images/derivatives/1280/<tên_file>
+
+Lúc render, chấm điểm / collage / smart crop chọn bản nhỏ nhất vẫn phủ kín ô đích
+→ decode nhanh hơn, ít RAM và ít đọc đĩa hơn so với luôn mở ảnh gốc.
+"""
+
+import os
+import tempfile
+
+from PIL import Image, ImageOps
+
+DERIVATIVE_SIZES = (360, 720, 1280)        # Cạnh dài của các bản thu nhỏ (tăng dần)
+DERIVATIVES_DIRNAME = 'derivatives'        # Thư mục con nằm cạnh ảnh gốc
+DERIVATIVE_JPEG_QUALITY = 88
+
+
+def get_derivative_path(image_path, size):
+    """Đường dẫn bản thu nhỏ cạnh dài `size` của ảnh"""
+    images_dir, filename = os.path.split(image_path)
+    return os.path.join(images_dir, DERIVATIVES_DIRNAME, str(size), filename)
+
+
+def generate_derivatives(image_path, sizes=DERIVATIVE_SIZES):
+    """
+    Tạo các bản thu nhỏ cho ảnh (bỏ qua size ≥ cạnh dài ảnh gốc hoặc đã có sẵn và mới hơn ảnh gốc)
+
+    Returns:
+        list: các size đã có bản thu nhỏ
+    """
+    source_mtime = os.path.getmtime(image_path)
+    pending = [
+        size for size in sizes
+        if not (os.path.exists(get_derivative_path(image_path, size)) and
+                os.path.getmtime(get_derivative_path(image_path, size)) >= source_mtime)
+    ]
+    available = [size for size in sizes if size not in pending]
+    if not pending:
+        return available
+
+    with Image.open(image_path) as img:
+        img = ImageOps.exif_transpose(img)
+        long_side = max(img.size)
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+
+        # Tạo từ lớn xuống nhỏ, mỗi bản resize từ bản lớn hơn liền trước
+        current = img
+        for size in sorted(pending, reverse=True):
+            if size >= long_side:
+                continue
+            scale = size / max(current.size)
+            resized = current.resize(
+                (max(1, round(current.size[0] * scale)), max(1, round(current.size[1] * scale))),
+                Image.LANCZOS
+            )
+            _save_atomic(resized, get_derivative_path(image_path, size), has_alpha)
+            available.append(size)
+            current = resized
+
+    return sorted(available)
+
+
+def _save_atomic(img, output_path, has_alpha):
+    """Ghi ảnh ra file tạm rồi rename (tránh render đọc phải file đang ghi dở)"""
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    ext = os.path.splitext(output_path)[1].lower()
+    fd, temp_path = tempfile.mkstemp(prefix='.derivative_', suffix=ext, dir=output_dir)
+    os.close(fd)
+    try:
+        if ext in ('.jpg', '.jpeg') and not has_alpha:
+            img.save(temp_path, 'JPEG', quality=DERIVATIVE_JPEG_QUALITY, optimize=True)
+        else:
+            img.save(temp_path, Image.registered_extensions().get(ext, 'PNG'))
+        os.replace(temp_path, output_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def select_image_source(image_path, target_size=None, min_long_side=None):
+    """
+    Chọn bản nhỏ nhất vẫn phủ kín ô đích (fill/crop), không có thì trả về ảnh gốc
+
+    Args:
+        image_path: đường dẫn ảnh gốc
+        target_size: (w, h) của ô đích - bản được chọn phải có w ≥ ô.w và h ≥ ô.h
+        min_long_side: hoặc yêu cầu cạnh dài tối thiểu (vd: proxy chấm điểm)
+
+    Returns:
+        str: đường dẫn ảnh nên decode
+    """
+    if target_size is None and min_long_side is None:
+        return image_path
+
+    try:
+        source_mtime = os.path.getmtime(image_path)
+    except OSError:
+        return image_path
+
+    for size in DERIVATIVE_SIZES:
+        derivative_path = get_derivative_path(image_path, size)
+        try:
+            # Bỏ qua bản thu nhỏ chưa có hoặc cũ hơn ảnh gốc (ảnh bị ghi đè)
+            if not os.path.exists(derivative_path) or os.path.getmtime(derivative_path) < source_mtime:
+                continue
+            if min_long_side is not None:
+                if size >= min_long_side:
+                    return derivative_path
+                continue
+            with Image.open(derivative_path) as img:
+                width, height = img.size
+            if target_size is None or (width >= target_size[0] and height >= target_size[1]):
+                return derivative_path
+        except Exception:
+            continue
+    return image_path
@@ -0,0 +1,286 @@
+"""
+EverLiving Image Score Cache
+Lưu trữ bền vững kết quả AI chấm điểm ảnh (content-addressed)
+
+Key = hash nội dung file + phiên bản scorer, nên:
+- Ảnh đổi tên / di chuyển vẫn dùng lại được điểm cũ
+- Đổi thuật toán chấm điểm (tăng SCORER_VERSION) tự động vô hiệu hoá điểm cũ
+- Điểm được giữ lại qua các lần restart server
+
+Index còn lưu perceptual hash (dHash) của từng file để gộp ảnh gần trùng
+(ảnh chụp liên tiếp, ảnh upload lại) thành cụm.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+from PIL import Image, ImageOps
+
+SCORE_INDEX_FILENAME = 'ai_scores.json'   # File index nằm trong thư mục thư viện của user
+HASH_CHUNK_SIZE = 1024 * 1024              # Đọc 1MB mỗi lần khi hash file
+INDEX_FORMAT_VERSION = 1
+DHASH_SIZE = 8                             # dHash 8x8 = 64 bit
+DHASH_DRAFT_SIZE = (64, 64)                # Decode JPEG ở độ phân giải rút gọn (PIL draft) trước khi hash
+
+# Mỗi index file chỉ có 1 instance trong process (dùng chung giữa các thread)
+_cache_instances = {}
+_cache_instances_lock = threading.Lock()
+
+
+def compute_file_hash(file_path):
+    """Tính SHA-1 của nội dung file (chỉ đọc bytes, không decode ảnh)"""
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def compute_dhash(file_path):
+    """
+    Tính dHash 64 bit trên thumbnail rất nhỏ (PIL draft: JPEG chỉ decode ở 1/8 độ phân giải)
+    
+    Returns:
+        str: hash dạng hex 16 ký tự
+    """
+    with Image.open(file_path) as img:
+        img.draft('L', DHASH_DRAFT_SIZE)
+        img = ImageOps.exif_transpose(img).convert('L')
+        img = img.resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS)
+        pixels = list(img.getdata())
+    
+    bits = 0
+    for row in range(DHASH_SIZE):
+        for col in range(DHASH_SIZE):
+            left = pixels[row * (DHASH_SIZE + 1) + col]
+            right = pixels[row * (DHASH_SIZE + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:0{DHASH_SIZE * DHASH_SIZE // 4}x}"
+
+
+def hamming_distance(hash_a, hash_b):
+    """Số bit khác nhau giữa 2 dHash hex"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+
+def cluster_near_duplicates(hashes, max_distance):
+    """
+    Gộp các ảnh có dHash gần nhau (Hamming ≤ max_distance) thành cụm
+    
+    Args:
+        hashes: dict {key: dhash_hex hoặc None}, theo thứ tự ưu tiên
+        max_distance: khoảng cách Hamming tối đa để coi là gần trùng
+    
+    Returns:
+        list: các cụm [key, ...]; key không có hash đứng 1 mình
+    """
+    clusters = []
+    cluster_hashes = []
+    for key, dhash in hashes.items():
+        if dhash is not None:
+            value = int(dhash, 16)
+            for index, cluster_value in enumerate(cluster_hashes):
+                if cluster_value is not None and bin(value ^ cluster_value).count('1') <= max_distance:
+                    clusters[index].append(key)
+                    break
+            else:
+                clusters.append([key])
+                cluster_hashes.append(value)
+        else:
+            clusters.append([key])
+            cluster_hashes.append(None)
+    return clusters
+
+
+class ImageScoreCache:
+    """
+    Index điểm ảnh lưu dưới dạng JSON:
+        {
+            'format': 1,
+            'files':  {đường_dẫn: {'size', 'mtime', 'hash', 'dhash', 'failures'}},   # tránh hash lại file chưa đổi
+            'scores': {'<hash>:<scorer_version>': {...record...}}
+        }
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._data = {'format': INDEX_FORMAT_VERSION, 'files': {}, 'scores': {}}
+        self._load()
+
+    def _load(self):
+        """Đọc index từ disk (bỏ qua nếu file hỏng hoặc khác format)"""
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict) and data.get('format') == INDEX_FORMAT_VERSION:
+                self._data['files'] = data.get('files', {})
+                self._data['scores'] = data.get('scores', {})
+        except Exception as e:
+            print(f"⚠️ Không đọc được score index {self.index_path}: {e}")
+
+    def get_content_hash(self, file_path):
+        """Lấy hash nội dung, dùng lại hash cũ nếu size + mtime không đổi"""
+        file_key = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+
+        with self._lock:
+            entry = self._data['files'].get(file_key)
+            if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+                return entry['hash']
+
+        content_hash = compute_file_hash(file_path)
+
+        with self._lock:
+            self._data['files'][file_key] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'hash': content_hash
+            }
+            self._dirty = True
+        return content_hash
+
+    def _current_entry(self, file_path):
+        """Entry của file trong index nếu file chưa đổi (size + mtime), None nếu chưa có / đã đổi - không đọc nội dung file"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        with self._lock:
+            entry = self._data['files'].get(os.path.abspath(file_path))
+            if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+                return entry
+            return None
+
+    def has_perceptual_hash(self, file_path):
+        """dHash của file đã có trong index và file chưa đổi (size + mtime) - không đọc nội dung file"""
+        entry = self._current_entry(file_path)
+        return bool(entry and 'dhash' in entry)
+
+    def get_perceptual_hash(self, file_path):
+        """Lấy dHash của file, dùng lại dHash cũ nếu size + mtime không đổi (None nếu không đọc được)"""
+        file_key = os.path.abspath(file_path)
+        try:
+            self.get_content_hash(file_path)
+        except OSError:
+            return None
+
+        with self._lock:
+            entry = self._data['files'].get(file_key)
+            if entry and 'dhash' in entry:
+                return entry['dhash']
+
+        try:
+            dhash = compute_dhash(file_path)
+        except Exception:
+            dhash = None
+
+        with self._lock:
+            entry = self._data['files'].get(file_key)
+            if entry is not None:
+                entry['dhash'] = dhash
+                self._dirty = True
+        return dhash
+
+    def get(self, file_path, scorer_version):
+        """Trả về record đã lưu hoặc None nếu chưa chấm với scorer_version này"""
+        try:
+            content_hash = self.get_content_hash(file_path)
+        except OSError:
+            return None
+
+        with self._lock:
+            record = self._data['scores'].get(f"{content_hash}:{scorer_version}")
+            return dict(record) if record is not None else None
+
+    def put(self, file_path, scorer_version, record):
+        """Lưu record cho file (chỉ trong memory, gọi save() để ghi xuống disk)"""
+        try:
+            content_hash = self.get_content_hash(file_path)
+        except OSError:
+            return False
+
+        with self._lock:
+            self._data['scores'][f"{content_hash}:{scorer_version}"] = dict(record)
+            self._dirty = True
+        return True
+
+    def get_indexed(self, file_path, scorer_version):
+        """
+        Như get() nhưng chỉ tra index theo đường dẫn + size + mtime, không hash file
+        (dùng trên request thread; file chưa có trong index / đã đổi → None)
+        """
+        entry = self._current_entry(file_path)
+        if entry is None:
+            return None
+
+        with self._lock:
+            record = self._data['scores'].get(f"{entry['hash']}:{scorer_version}")
+            return dict(record) if record is not None else None
+
+    def put_failure(self, file_path, scorer_version, record):
+        """
+        Ghi nhận lần chấm lỗi của file (record có 'error' / 'exception') với scorer_version này
+        Lưu trong entry của file nên tự mất khi file đổi (size + mtime) - không chấm lại file hỏng mãi
+        """
+        try:
+            self.get_content_hash(file_path)
+        except OSError:
+            return False
+
+        with self._lock:
+            entry = self._data['files'].get(os.path.abspath(file_path))
+            if entry is None:
+                return False
+            entry.setdefault('failures', {})[str(scorer_version)] = dict(record)
+            self._dirty = True
+        return True
+
+    def get_failure(self, file_path, scorer_version):
+        """Record lỗi đã ghi bằng put_failure() nếu file chưa đổi, ngược lại None (không đọc nội dung file)"""
+        entry = self._current_entry(file_path)
+        if entry is None:
+            return None
+
+        with self._lock:
+            record = entry.get('failures', {}).get(str(scorer_version))
+            return dict(record) if record is not None else None
+
+    def save(self):
+        """Ghi index xuống disk (atomic: ghi file tạm rồi rename)"""
+        with self._lock:
+            if not self._dirty:
+                return True
+            try:
+                index_dir = os.path.dirname(self.index_path) or '.'
+                os.makedirs(index_dir, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(prefix='.ai_scores_', suffix='.tmp', dir=index_dir)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, ensure_ascii=False)
+                os.replace(temp_path, self.index_path)
+                self._dirty = False
+                return True
+            except Exception as e:
+                print(f"⚠️ Không ghi được score index {self.index_path}: {e}")
+                return False
+
+
+def get_score_cache(library_folder):
+    """Lấy (hoặc tạo) score cache cho thư mục thư viện ảnh của user"""
+    index_path = os.path.abspath(os.path.join(library_folder, SCORE_INDEX_FILENAME))
+    with _cache_instances_lock:
+        cache = _cache_instances.get(index_path)
+        if cache is None:
+            cache = ImageScoreCache(index_path)
+            _cache_instances[index_path] = cache
+        return cache
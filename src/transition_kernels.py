@@ -0,0 +1,572 @@
+"""
+EverLiving Transition Kernels
+Hiệu ứng chuyển cảnh dạng kernel NumPy trên 2 frame uint8 (thay cho CompositeVideoClip + lambda)
+
+Mỗi hiệu ứng là 1 hàm thuần trên buffer frame:
+    - slide / push: ghép các lát cắt (slice) của 2 frame, không tính float
+    - fade / dissolve: alpha blend uint8 bằng cv2.addWeighted (SIMD, không đổi kiểu dữ liệu)
+    - wipe / mask: chỉ blend dải mép mềm, vùng đã lộ / chưa lộ copy slice
+    - zoom: 1 lần cv2.resize vùng cần thiết
+
+2 kiểu hiệu ứng (giữ nguyên thời lượng như bản moviepy cũ):
+    'overlap':  frame_a và frame_b chồng lên nhau trong `duration` giây
+                kernel(frame_a, frame_b, progress) → frame
+    'sequence': clip 1 chạy hết rồi mới tới clip 2 (dip qua đen), tổng 2 × `duration` giây
+                kernel(frame, progress, entering) → frame
+                (entering=False: nửa đầu, frame của clip 1; True: nửa sau, frame của clip 2)
+
+Benchmark từng hiệu ứng:
+    python src/transition_kernels.py --width 1280 --height 720 --frames 60
+"""
+
+import sys
+import json
+import time
+import argparse
+import functools
+
+import cv2
+import numpy as np
+
+DEFAULT_TRANSITION = 'fade'     # Hiệu ứng dùng khi tên không có trong TRANSITIONS
+EASING_SAMPLES = 1024           # Số mẫu của mỗi đường cong easing tính sẵn
+WIPE_FEATHER = 0.15             # Độ rộng mép mềm của wipe (tỷ lệ của khung)
+MASK_CACHE_SIZE = 16            # Số mask (theo độ phân giải × kiểu) giữ trong cache
+WIPE_PLAN_STEPS = 64            # Số mức progress của wipe (mỗi mức 1 kế hoạch blend tính sẵn, dùng lại giữa các transition)
+WIPE_PLAN_CACHE_SIZE = 64       # Số kế hoạch blend (kiểu × mức progress) giữ trong cache
+WIPE_STRIP_ROWS = 96            # Số dòng mỗi dải khi tìm vùng mép mềm của mask 2D (nhỏ = ít pixel blend thừa, nhiều lần gọi hơn)
+AREA_ZOOM_BELOW = 0.5           # Thu nhỏ dưới tỷ lệ này thì giảm nửa bằng INTER_AREA trước (chống răng cưa), còn lại INTER_LINEAR
+
+
+# ================= EASING (TÍNH SẴN) =================
+def _elastic_out(t):
+    # Vượt quá 1 rồi dao động tắt dần về 1
+    return np.where(t >= 1.0, 1.0, 1.0 - np.power(2.0, -10.0 * t) * np.cos(t * 10.0 * np.pi / 1.5))
+
+
+def _bounce_out(t):
+    # Nảy 3 lần trước khi dừng ở 1
+    n, d = 7.5625, 2.75
+    return np.select(
+        [t < 1 / d, t < 2 / d, t < 2.5 / d],
+        [n * t * t, n * (t - 1.5 / d) ** 2 + 0.75, n * (t - 2.25 / d) ** 2 + 0.9375],
+        n * (t - 2.625 / d) ** 2 + 0.984375
+    )
+
+
+_EASING_PROGRESS = np.linspace(0.0, 1.0, EASING_SAMPLES + 1)
+EASING_CURVES = {
+    'linear': _EASING_PROGRESS,
+    'in_quad': _EASING_PROGRESS ** 2,
+    'out_cubic': 1.0 - (1.0 - _EASING_PROGRESS) ** 3,
+    'smoothstep': _EASING_PROGRESS ** 2 * (3.0 - 2.0 * _EASING_PROGRESS),
+    'elastic_out': _elastic_out(_EASING_PROGRESS),
+    'bounce_out': _bounce_out(_EASING_PROGRESS),
+}
+
+
+def ease(curve, progress):
+    """Tra đường cong easing đã tính sẵn (không tính hàm mũ / lượng giác mỗi frame)"""
+    index = int(round(min(1.0, max(0.0, progress)) * EASING_SAMPLES))
+    return float(EASING_CURVES[curve][index])
+
+
+# ================= KERNEL CƠ BẢN =================
+def blend_frames(frame_a, frame_b, alpha, level_a=1.0, out=None):
+    """
+    Alpha blend uint8: a × (1 - alpha) × level_a + b × alpha, alpha ∈ [0, 1] là tỷ lệ của frame_b
+    level_a < 1 làm tối frame_a ngay trong lần blend (không cần dim_frame riêng)
+    out: buffer (hoặc view) ghi kết quả, None = cấp phát mới
+    """
+    alpha = min(1.0, max(0.0, alpha))
+    if alpha >= 1.0 or (alpha <= 0.0 and level_a >= 1.0):
+        source = frame_b if alpha >= 1.0 else frame_a
+        if out is None:
+            return source
+        out[...] = source
+        return out
+    return cv2.addWeighted(frame_a, (1.0 - alpha) * level_a, frame_b, alpha, 0.0, dst=out)
+
+
+def dim_frame(frame, level, out=None):
+    """Làm tối frame về đen: level 1 = giữ nguyên, 0 = đen"""
+    level = min(1.0, max(0.0, level))
+    if level >= 1.0 and out is None:
+        return frame
+    if level <= 0.0:
+        if out is None:
+            return np.zeros_like(frame)
+        out[...] = 0
+        return out
+    return cv2.convertScaleAbs(frame, dst=out, alpha=level)
+
+
+def shift_frame(frame, dx, dy, background=None):
+    """Dịch frame (dx, dy) pixel, phần trống lấy từ background (None = đen)"""
+    h, w = frame.shape[:2]
+    dx, dy = int(round(dx)), int(round(dy))
+    out = np.zeros_like(frame) if background is None else background.copy()
+    if abs(dx) >= w or abs(dy) >= h:
+        return out
+    out[max(0, dy):h + min(0, dy), max(0, dx):w + min(0, dx)] = \
+        frame[max(0, -dy):h - max(0, dy), max(0, -dx):w - max(0, dx)]
+    return out
+
+
+def slide_frames(frame_a, frame_b, progress, direction):
+    """
+    frame_b trượt vào phủ lên frame_a (frame_a đứng yên)
+    direction: 'left' = vào từ mép trái, 'right' = từ mép phải, 'up' = từ mép trên, 'down' = từ mép dưới
+    """
+    h, w = frame_a.shape[:2]
+    out = frame_a.copy()
+    if direction in ('left', 'right'):
+        offset = int(round(w * min(1.0, max(0.0, progress))))
+        if offset <= 0:
+            return out
+        if direction == 'left':
+            out[:, :offset] = frame_b[:, w - offset:]
+        else:
+            out[:, w - offset:] = frame_b[:, :offset]
+    else:
+        offset = int(round(h * min(1.0, max(0.0, progress))))
+        if offset <= 0:
+            return out
+        if direction == 'up':
+            out[:offset] = frame_b[h - offset:]
+        else:
+            out[h - offset:] = frame_b[:offset]
+    return out
+
+
+def push_frames(frame_a, frame_b, progress, direction):
+    """
+    frame_b đẩy frame_a ra khỏi khung (cả 2 cùng di chuyển)
+    direction: hướng chuyển động - 'left' = nội dung chạy sang trái (frame_b vào từ mép phải), ...
+    """
+    h, w = frame_a.shape[:2]
+    out = np.empty_like(frame_a)
+    if direction in ('left', 'right'):
+        offset = int(round(w * min(1.0, max(0.0, progress))))
+        if direction == 'left':
+            out[:, :w - offset] = frame_a[:, offset:]
+            out[:, w - offset:] = frame_b[:, :offset]
+        else:
+            out[:, offset:] = frame_a[:, :w - offset]
+            out[:, :offset] = frame_b[:, w - offset:]
+    else:
+        offset = int(round(h * min(1.0, max(0.0, progress))))
+        if direction == 'up':
+            out[:h - offset] = frame_a[offset:]
+            out[h - offset:] = frame_b[:offset]
+        else:
+            out[offset:] = frame_a[:h - offset]
+            out[:offset] = frame_b[h - offset:]
+    return out
+
+
+def resize_frame(frame, width, height, out=None):
+    """
+    cv2.resize cho kernel: thu nhỏ mạnh (dưới AREA_ZOOM_BELOW) thì giảm nửa bằng INTER_AREA trước
+    (hệ số nguyên 2 rất nhanh, INTER_AREA tỷ lệ lẻ chậm gấp nhiều lần), phần còn lại INTER_LINEAR
+    """
+    h, w = frame.shape[:2]
+    while width < w * AREA_ZOOM_BELOW and height < h * AREA_ZOOM_BELOW:
+        h, w = h // 2, w // 2
+        frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+    return cv2.resize(frame, (width, height), dst=out, interpolation=cv2.INTER_LINEAR)
+
+
+def zoom_frame(frame, scale, background=None):
+    """
+    Phóng to / thu nhỏ frame quanh tâm
+    scale ≥ 1: crop vùng giữa rồi resize về đủ khung; scale < 1: thu nhỏ đặt giữa background (None = đen)
+    Trả về chính frame nếu scale ≈ 1, ngược lại là buffer mới (kernel được ghi đè lên)
+    """
+    h, w = frame.shape[:2]
+    if abs(scale - 1.0) < 1e-3:
+        return frame
+    if scale > 1.0:
+        crop_w, crop_h = max(1, int(round(w / scale))), max(1, int(round(h / scale)))
+        x, y = (w - crop_w) // 2, (h - crop_h) // 2
+        return resize_frame(frame[y:y + crop_h, x:x + crop_w], w, h)
+
+    out = np.zeros_like(frame) if background is None else background.copy()
+    small_w, small_h = int(round(w * scale)), int(round(h * scale))
+    if small_w < 1 or small_h < 1:
+        return out
+    x, y = (w - small_w) // 2, (h - small_h) // 2
+    resize_frame(frame, small_w, small_h, out=out[y:y + small_h, x:x + small_w])
+    return out
+
+
+def _scratch(frame, *sources):
+    """frame làm buffer ghi kết quả được nếu là buffer mới (không phải 1 trong các frame đầu vào)"""
+    return None if any(frame is source for source in sources) else frame
+
+
+def mask_blend(frame_a, frame_b, alpha, out=None):
+    """
+    Alpha blend uint8 theo từng pixel: alpha uint8 (h, w) 0..255 là tỷ lệ của frame_b
+    a × (255 - alpha) / 255 + b × alpha / 255, toàn bộ bằng phép toán uint8 của cv2 (không đổi sang float)
+    """
+    weights = cv2.cvtColor(alpha, cv2.COLOR_GRAY2BGR) if frame_a.ndim == 3 else alpha
+    return cv2.add(cv2.multiply(frame_a, cv2.bitwise_not(weights), scale=1 / 255),
+                   cv2.multiply(frame_b, weights, scale=1 / 255), dst=out)
+
+
+# ================= WIPE / FEATHER MASK (CACHE THEO ĐỘ PHÂN GIẢI) =================
+@functools.lru_cache(maxsize=MASK_CACHE_SIZE)
+def wipe_ramp(width, height, kind):
+    """
+    Mask thứ tự lộ ảnh (uint8 0..255, pixel có giá trị nhỏ lộ trước), tính 1 lần cho mỗi độ phân giải
+    kind: 'horizontal' (trái → phải, shape (1, w)), 'diagonal' (góc trên trái → dưới phải), 'radial' (tâm → góc)
+    """
+    if kind == 'horizontal':
+        ramp = np.linspace(0.0, 1.0, width)[None, :]
+    elif kind == 'diagonal':
+        ramp = (np.linspace(0.0, 1.0, width)[None, :] + np.linspace(0.0, 1.0, height)[:, None]) / 2.0
+    elif kind == 'radial':
+        x = np.linspace(-1.0, 1.0, width)[None, :]
+        y = np.linspace(-1.0, 1.0, height)[:, None]
+        ramp = np.sqrt(x * x + y * y) / np.sqrt(2.0)
+    else:
+        raise ValueError(f"Unknown wipe kind: {kind}")
+    mask = np.round(ramp * 255).astype(np.uint8)
+    mask.setflags(write=False)
+    return mask
+
+
+@functools.lru_cache(maxsize=MASK_CACHE_SIZE)
+def wipe_strips(width, height, kind):
+    """
+    Chia mask wipe thành dải WIPE_STRIP_ROWS dòng, lưu mức mask nhỏ / lớn nhất của từng cột trong dải
+    (mask ngang chỉ phụ thuộc cột → 1 dải cả khung)
+    
+    Returns:
+        tuple: ((y0, y1, col_min, col_max), ...)
+    """
+    ramp = wipe_ramp(width, height, kind)
+    if ramp.shape[0] == 1:
+        return ((0, height, ramp[0], ramp[0]),)
+    return tuple(
+        (y0, min(height, y0 + WIPE_STRIP_ROWS),
+         ramp[y0:y0 + WIPE_STRIP_ROWS].min(axis=0), ramp[y0:y0 + WIPE_STRIP_ROWS].max(axis=0))
+        for y0 in range(0, height, WIPE_STRIP_ROWS)
+    )
+
+
+def ramp_alpha(progress, feather=WIPE_FEATHER, base=0.0):
+    """
+    LUT 256 mức (uint8 0..255, tỷ lệ của frame_b) theo mức mask, tính mỗi frame - giảm dần theo mức mask
+    base: phần crossfade toàn khung trộn thêm (0 = wipe thuần)
+    """
+    levels = np.arange(256, dtype=np.float32) / 255.0
+    alpha = np.clip((progress * (1.0 + feather) - levels) / feather, 0.0, 1.0)
+    return np.round((base * progress + (1.0 - base) * alpha) * 255).astype(np.uint8)
+
+
+@functools.lru_cache(maxsize=WIPE_PLAN_CACHE_SIZE)
+def wipe_plan(width, height, kind, step, feather=WIPE_FEATHER, base=0.0):
+    """
+    Kế hoạch blend 1 frame wipe ở độ phân giải output, tính 1 lần cho mỗi mức progress
+    (step / WIPE_PLAN_STEPS) rồi dùng lại cho mọi transition cùng kiểu
+    Mỗi dải được chia theo cột: đoạn cột có trọng số đồng nhất (đã lộ / chưa lộ / crossfade base)
+    chỉ copy slice hoặc addWeighted, riêng dải mép mềm mới blend theo mask từng pixel
+    
+    Returns:
+        tuple: ((y0, y1, x0, x1, trọng số), ...) - trọng số là float (tỷ lệ frame_b, vùng đồng nhất)
+               hoặc mask alpha uint8 (y1 - y0, x1 - x0) của dải mép mềm
+    """
+    ramp = wipe_ramp(width, height, kind)
+    lut = ramp_alpha(step / WIPE_PLAN_STEPS, feather, base)
+    plan = []
+    for y0, y1, col_min, col_max in wipe_strips(width, height, kind):
+        # LUT giảm dần → cột có lut[min] == lut[max] == mức đã lộ / chưa lộ là cột đồng nhất, còn lại (-1) thuộc mép mềm
+        high, low = lut[col_min], lut[col_max]
+        settled = (high == low) & ((high == lut[0]) | (high == lut[255]))
+        column_alpha = np.where(settled, high.astype(np.int16), -1)
+        bounds = [0, *(np.flatnonzero(np.diff(column_alpha)) + 1).tolist(), width]
+        for x0, x1 in zip(bounds[:-1], bounds[1:]):
+            alpha = int(column_alpha[x0])
+            if alpha >= 0:
+                plan.append((y0, y1, x0, x1, alpha / 255))
+                continue
+            if ramp.shape[0] == 1:
+                pixel_alpha = np.repeat(cv2.LUT(ramp[:, x0:x1], lut), y1 - y0, axis=0)
+            else:
+                pixel_alpha = cv2.LUT(ramp[y0:y1, x0:x1], lut)
+            pixel_alpha.setflags(write=False)
+            plan.append((y0, y1, x0, x1, pixel_alpha))
+    return tuple(plan)
+
+
+def wipe_frames(frame_a, frame_b, progress, kind, feather=WIPE_FEATHER, base=0.0):
+    """frame_b lộ dần theo mask wipe (mép mềm), theo kế hoạch blend tính sẵn của mức progress gần nhất"""
+    h, w = frame_a.shape[:2]
+    step = int(round(min(1.0, max(0.0, progress)) * WIPE_PLAN_STEPS))
+    out = np.empty_like(frame_a)
+    for y0, y1, x0, x1, weight in wipe_plan(w, h, kind, step, feather, base):
+        region = (slice(y0, y1), slice(x0, x1))
+        if isinstance(weight, float):
+            blend_frames(frame_a[region], frame_b[region], weight, out=out[region])
+        else:
+            mask_blend(frame_a[region], frame_b[region], weight, out=out[region])
+    return out
+
+
+def _dip_level(progress, entering, fade_span=1.0):
+    """
+    Độ sáng khi dip qua đen (fade_span tính theo tỷ lệ duration, > 1 = fade dài hơn clip → không tối/sáng hẳn)
+    Nửa đầu giảm dần về 0 ở cuối, nửa sau tăng dần từ 0 ở đầu
+    """
+    if fade_span <= 0:
+        return 1.0 if entering else 0.0
+    if entering:
+        return min(1.0, progress / fade_span)
+    return min(1.0, (1.0 - progress) / fade_span)
+
+
+# ================= HIỆU ỨNG (OVERLAP) =================
+def _slide(direction, curve='linear'):
+    def kernel(frame_a, frame_b, progress):
+        return slide_frames(frame_a, frame_b, ease(curve, progress), direction)
+    return kernel
+
+
+def _push(direction, curve='linear'):
+    def kernel(frame_a, frame_b, progress):
+        return push_frames(frame_a, frame_b, ease(curve, progress), direction)
+    return kernel
+
+
+def _wipe(kind, curve='linear', feather=WIPE_FEATHER, base=0.0):
+    def kernel(frame_a, frame_b, progress):
+        return wipe_frames(frame_a, frame_b, ease(curve, progress), kind, feather, base)
+    return kernel
+
+
+def _eased_fade(curve):
+    def kernel(frame_a, frame_b, progress):
+        return blend_frames(frame_a, frame_b, ease(curve, progress))
+    return kernel
+
+
+def _crossfade(frame_a, frame_b, progress):
+    return blend_frames(frame_a, frame_b, progress)
+
+
+def _soft_dissolve(frame_a, frame_b, progress):
+    # Bản cũ: opacity kéo dài 1.5 × duration → trong duration chỉ hoà tới 2/3
+    return blend_frames(frame_a, frame_b, progress / 1.5)
+
+
+def _double_fade(frame_a, frame_b, progress):
+    # 2 lớp: clip 1 tối dần trong 60% đầu, clip 2 hiện dần suốt hiệu ứng (tối ngay trong lần blend)
+    return blend_frames(frame_a, frame_b, progress, level_a=1.0 - 0.5 * min(1.0, progress / 0.6))
+
+
+def _zoom_in(frame_a, frame_b, progress):
+    # Clip 2 lớn dần từ 10% → 100% ở giữa khung, đè lên clip 1
+    return zoom_frame(frame_b, 0.1 + 0.9 * progress, background=frame_a)
+
+
+def _zoom_out(frame_a, frame_b, progress):
+    # Clip 1 phóng to 1× → 3× trong khi clip 2 hiện dần
+    zoomed = zoom_frame(frame_a, 1.0 + 2.0 * progress)
+    return blend_frames(zoomed, frame_b, progress, out=_scratch(zoomed, frame_a))
+
+
+def _fade_slide(frame_a, frame_b, progress):
+    # Clip 1 trôi sang trái 10%, clip 2 trôi vào từ phải 10%, hoà trộn
+    # Blend thẳng trên các lát cắt: giữa = cả 2 clip, mép trái = chỉ clip 1, mép phải = chỉ clip 2 (nền đen)
+    w = frame_a.shape[1]
+    shift_a = int(round(0.1 * w * progress))
+    shift_b = int(round(0.1 * w * (1.0 - progress)))
+    out = np.empty_like(frame_a)
+    if shift_b:
+        dim_frame(frame_a[:, shift_a:shift_a + shift_b], 1.0 - progress, out=out[:, :shift_b])
+    blend_frames(frame_a[:, shift_a + shift_b:], frame_b[:, :w - shift_a - shift_b], progress,
+                 out=out[:, shift_b:w - shift_a])
+    if shift_a:
+        dim_frame(frame_b[:, w - shift_a - shift_b:w - shift_b], progress, out=out[:, w - shift_a:])
+    return out
+
+
+def _elastic_fade(frame_a, frame_b, progress):
+    # Clip 2 phóng từ 90% lên quá cỡ rồi dao động về 100% (elastic), hiện dần lên clip 1
+    eased = ease('elastic_out', progress)
+    zoomed = zoom_frame(frame_b, 0.9 + 0.1 * eased, background=frame_a)
+    return blend_frames(frame_a, zoomed, min(1.0, eased), out=_scratch(zoomed, frame_a, frame_b))
+
+
+def _scale_fade(frame_a, frame_b, progress):
+    # Clip 1 phóng to dần 1× → 1.15× trong khi mờ sang clip 2
+    eased = ease('smoothstep', progress)
+    zoomed = zoom_frame(frame_a, 1.0 + 0.15 * eased)
+    return blend_frames(zoomed, frame_b, eased, out=_scratch(zoomed, frame_a))
+
+
+def _soft_zoom(frame_a, frame_b, progress):
+    # Clip 2 thu từ 1.1× về 1× (ease out) trong khi hiện dần
+    eased = ease('out_cubic', progress)
+    zoomed = zoom_frame(frame_b, 1.1 - 0.1 * eased)
+    return blend_frames(frame_a, zoomed, eased, out=_scratch(zoomed, frame_b))
+
+
+def _gentle_morph(frame_a, frame_b, progress):
+    # 2 clip cùng zoom nhẹ về phía nhau (1 → 1.05 và 1.05 → 1) rồi hoà trộn
+    eased = ease('smoothstep', progress)
+    zoomed_a = zoom_frame(frame_a, 1.0 + 0.05 * eased)
+    zoomed_b = zoom_frame(frame_b, 1.05 - 0.05 * eased)
+    return blend_frames(zoomed_a, zoomed_b, eased, out=_scratch(zoomed_a, frame_a))
+
+
+# ================= HIỆU ỨNG (SEQUENCE / DIP QUA ĐEN) =================
+def _dip(fade_span=1.0):
+    def kernel(frame, progress, entering):
+        return dim_frame(frame, _dip_level(progress, entering, fade_span))
+    return kernel
+
+
+def _dip_zoom(scale_out, scale_in):
+    """Dip qua đen kèm zoom: scale_out/scale_in = (bắt đầu, kết thúc) cho clip 1 / clip 2"""
+    def kernel(frame, progress, entering):
+        start, end = scale_in if entering else scale_out
+        zoomed = zoom_frame(frame, start + (end - start) * progress)
+        return dim_frame(zoomed, _dip_level(progress, entering), out=_scratch(zoomed, frame))
+    return kernel
+
+
+# Bảng hiệu ứng: tên → {'mode': 'overlap' | 'sequence', 'kernel': hàm}
+TRANSITIONS = {
+    # ===== HIỆU ỨNG GỐC =====
+    'fade': {'mode': 'sequence', 'kernel': _dip()},
+    'slide_left': {'mode': 'overlap', 'kernel': _slide('left')},
+    'slide_right': {'mode': 'overlap', 'kernel': _slide('right')},
+    'slide_up': {'mode': 'overlap', 'kernel': _slide('up')},
+    'slide_down': {'mode': 'overlap', 'kernel': _slide('down')},
+    'zoom_in': {'mode': 'overlap', 'kernel': _zoom_in},
+    'zoom_out': {'mode': 'overlap', 'kernel': _zoom_out},
+    'crossfade': {'mode': 'overlap', 'kernel': _crossfade},
+
+    # ===== HIỆU ỨNG FADE =====
+    'fade_in_out': {'mode': 'sequence', 'kernel': _dip(fade_span=0.7)},
+    'soft_fade': {'mode': 'sequence', 'kernel': _dip(fade_span=1.2)},
+    'double_fade': {'mode': 'overlap', 'kernel': _double_fade},
+    'fade_zoom': {'mode': 'sequence', 'kernel': _dip_zoom((1.0, 1.1), (0.9, 1.0))},
+    'fade_slide': {'mode': 'overlap', 'kernel': _fade_slide},
+    'dissolve': {'mode': 'overlap', 'kernel': _crossfade},
+    'soft_dissolve': {'mode': 'overlap', 'kernel': _soft_dissolve},
+    'blur_fade': {'mode': 'sequence', 'kernel': _dip_zoom((1.0, 0.9), (0.9, 1.0))},
+    'gentle_slide': {'mode': 'overlap', 'kernel': _slide('left', 'in_quad')},
+    'smooth_push': {'mode': 'overlap', 'kernel': _push('left', 'in_quad')},
+
+    # ===== PUSH =====
+    'push_left': {'mode': 'overlap', 'kernel': _push('left', 'smoothstep')},
+    'push_right': {'mode': 'overlap', 'kernel': _push('right', 'smoothstep')},
+    'push_up': {'mode': 'overlap', 'kernel': _push('up', 'smoothstep')},
+    'push_down': {'mode': 'overlap', 'kernel': _push('down', 'smoothstep')},
+
+    # ===== WIPE / MASK =====
+    'soft_wipe': {'mode': 'overlap', 'kernel': _wipe('horizontal', 'smoothstep')},
+    'fade_wipe': {'mode': 'overlap', 'kernel': _wipe('horizontal', 'smoothstep', feather=0.4, base=0.5)},
+    'gradient_fade': {'mode': 'overlap', 'kernel': _wipe('diagonal', 'smoothstep', feather=0.5)},
+    'feather_fade': {'mode': 'overlap', 'kernel': _wipe('radial', 'out_cubic', feather=0.35)},
+
+    # ===== FADE VỚI EASING / SCALE =====
+    'elastic_fade': {'mode': 'overlap', 'kernel': _elastic_fade},
+    'bounce_fade': {'mode': 'overlap', 'kernel': _eased_fade('bounce_out')},
+    'scale_fade': {'mode': 'overlap', 'kernel': _scale_fade},
+    'alpha_blend': {'mode': 'overlap', 'kernel': _eased_fade('smoothstep')},
+    'soft_zoom': {'mode': 'overlap', 'kernel': _soft_zoom},
+    'gentle_morph': {'mode': 'overlap', 'kernel': _gentle_morph},
+}
+
+
+def get_transition(transition_type):
+    """Spec của hiệu ứng (tên chưa có kernel → DEFAULT_TRANSITION, giống fallback cũ)"""
+    return TRANSITIONS.get(transition_type, TRANSITIONS[DEFAULT_TRANSITION])
+
+
+def transition_output_duration(transition_type, duration):
+    """Thời lượng clip chuyển cảnh: overlap = duration, sequence = 2 × duration"""
+    return duration * 2 if get_transition(transition_type)['mode'] == 'sequence' else duration
+
+
+def render_transition_frame(transition_type, frame_a, frame_b, progress):
+    """
+    Gọi kernel trực tiếp cho 1 frame (dùng cho benchmark / test nhanh)
+    Với hiệu ứng sequence, progress ∈ [0, 2): < 1 là nửa đầu (frame_a), ≥ 1 là nửa sau (frame_b)
+    """
+    spec = get_transition(transition_type)
+    if spec['mode'] == 'sequence':
+        if progress < 1.0:
+            return spec['kernel'](frame_a, progress, False)
+        return spec['kernel'](frame_b, min(1.0, progress - 1.0), True)
+    return spec['kernel'](frame_a, frame_b, min(1.0, max(0.0, progress)))
+
+
+# ================= BENCHMARK =================
+def benchmark_transitions(resolution=(1280, 720), frames=60, names=None, seed=1234):
+    """
+    Đo thời gian render mỗi frame của từng hiệu ứng trên 2 frame ngẫu nhiên
+
+    Returns:
+        dict: {tên: {'mode', 'frames', 'ms_per_frame', 'fps', 'vs_fallback', 'render_vs_fallback'}}
+              vs_fallback = ms/frame so với DEFAULT_TRANSITION (≤ 1 là không chậm hơn fallback)
+              render_vs_fallback = thời gian render cả hiệu ứng cùng duration so với fallback
+              (hiệu ứng sequence ra 2 × duration giây frame, overlap chỉ duration giây)
+    """
+    width, height = resolution
+    rng = np.random.default_rng(seed)
+    frame_a = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    frame_b = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+    results = {}
+    names = list(names or TRANSITIONS)
+    if DEFAULT_TRANSITION not in names:
+        names.insert(0, DEFAULT_TRANSITION)
+    for name in names:
+        spec = get_transition(name)
+        span = 2.0 if spec['mode'] == 'sequence' else 1.0
+        progresses = np.linspace(0.0, span, frames, endpoint=False)
+        start = time.perf_counter()
+        for progress in progresses:
+            render_transition_frame(name, frame_a, frame_b, float(progress))
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            'mode': spec['mode'],
+            'frames': frames,
+            'ms_per_frame': round(elapsed / frames * 1000, 3),
+            'fps': round(frames / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    fallback_ms = results[DEFAULT_TRANSITION]['ms_per_frame']
+    fallback_span = transition_output_duration(DEFAULT_TRANSITION, 1.0)
+    for name, result in results.items():
+        if fallback_ms <= 0:
+            result['vs_fallback'] = result['render_vs_fallback'] = None
+            continue
+        result['vs_fallback'] = round(result['ms_per_frame'] / fallback_ms, 2)
+        span = transition_output_duration(name, 1.0)
+        result['render_vs_fallback'] = round(result['ms_per_frame'] * span / (fallback_ms * fallback_span), 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark kernel chuyển cảnh')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=60, help='Số frame đo cho mỗi hiệu ứng')
+    parser.add_argument('--only', default=None, help='Chỉ đo các hiệu ứng này (phân cách bằng dấu phẩy)')
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else None
+    report = benchmark_transitions((args.width, args.height), args.frames, names)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,18 +15,28 @@ os.environ['PYTHONIOENCODING'] = 'utf-8'
 
 
 from moviepy.editor import *
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader
 import random
 import numpy as np
 import datetime
 import cv2
-from PIL import Image
+from PIL import Image, ImageOps
 import warnings
 import subprocess
 import time
 import tempfile
 import urllib.parse
+import io
+import threading
+import queue
+import multiprocessing
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import glob
+from image_score_cache import get_score_cache, cluster_near_duplicates
+from image_derivatives import DERIVATIVE_SIZES, generate_derivatives, select_image_source
+from transition_kernels import get_transition, transition_output_duration
 warnings.filterwarnings('ignore')
 
 # ================= AUDIO DOWNLOAD FUNCTIONS =================
@@ -480,7 +490,105 @@ TRANSITION_EFFECTS = [
 ]
 # =====================================================
 
+# ================= FACE DETECTOR REGISTRY =================
+# Model MediaPipe và Haar cascade được khởi tạo 1 lần cho mỗi thread (gunicorn --threads 8)
+# rồi dùng lại cho mọi ảnh, thay vì build graph / load XML cho từng ảnh
+MEDIAPIPE_REGISTRY_MIN_CONFIDENCE = 0.3   # Ngưỡng thấp nhất mà caller nào cũng dùng, caller tự lọc cao hơn
+HAAR_CASCADE_FILES = {
+    'haar_default': 'haarcascade_frontalface_default.xml',
+    'haar_alt': 'haarcascade_frontalface_alt.xml',
+    'haar_alt2': 'haarcascade_frontalface_alt2.xml',
+}
+
+_detector_local = threading.local()
+
+def get_mediapipe_face_detector(model_selection):
+    """
+    Lấy MediaPipe FaceDetection đã warm của thread hiện tại
+    
+    Args:
+        model_selection: 0 = short-range, 1 = full-range
+    
+    Returns:
+        FaceDetection hoặc None nếu không có mediapipe
+    """
+    detectors = getattr(_detector_local, 'mediapipe', None)
+    if detectors is None:
+        detectors = _detector_local.mediapipe = {}
+    
+    if model_selection not in detectors:
+        try:
+            import mediapipe as mp
+            detectors[model_selection] = mp.solutions.face_detection.FaceDetection(
+                model_selection=model_selection,
+                min_detection_confidence=MEDIAPIPE_REGISTRY_MIN_CONFIDENCE
+            )
+        except Exception:
+            detectors[model_selection] = None
+    
+    return detectors[model_selection]
+
+def get_haar_cascade(name):
+    """Lấy Haar CascadeClassifier đã load của thread hiện tại (None nếu không load được)"""
+    cascades = getattr(_detector_local, 'haar', None)
+    if cascades is None:
+        cascades = _detector_local.haar = {}
+    
+    if name not in cascades:
+        try:
+            cascade = cv2.CascadeClassifier(cv2.data.haarcascades + HAAR_CASCADE_FILES[name])
+            cascades[name] = None if cascade.empty() else cascade
+        except Exception:
+            cascades[name] = None
+    
+    return cascades[name]
+
+def run_mediapipe_face_detection(rgb_img, model_selection, min_confidence):
+    """
+    Chạy detector MediaPipe dùng chung và lọc theo ngưỡng của caller
+    
+    Returns:
+        list detection của MediaPipe (rỗng nếu không có face)
+    
+    Raises:
+        RuntimeError nếu mediapipe không khả dụng
+    """
+    detector = get_mediapipe_face_detector(model_selection)
+    if detector is None:
+        raise RuntimeError("MediaPipe không khả dụng")
+    
+    results = detector.process(rgb_img)
+    if not results.detections:
+        return []
+    return [d for d in results.detections if d.score[0] >= min_confidence]
+
+def warm_up_face_detectors():
+    """Khởi tạo trước toàn bộ detector cho thread/process hiện tại (gọi khi start worker)"""
+    for model_selection in (0, 1):
+        get_mediapipe_face_detector(model_selection)
+    for name in HAAR_CASCADE_FILES:
+        get_haar_cascade(name)
+
 # ================= AI FACE DETECTION & SCORING =================
+SCORER_VERSION = 8              # Tăng mỗi khi thay đổi thuật toán chấm điểm (vô hiệu hoá score cache cũ)
+SCORING_MAX_SIDE = 1200         # Cạnh dài tối đa của ảnh proxy dùng chung cho mọi bước chấm điểm
+SUBJECT_DETECTION_MAX_SIDE = 640  # Cạnh dài tối đa của proxy khi detect chủ thể để smart crop
+QUALITY_TENSOR_SIZE = (384, 384)  # Kích thước chuẩn hoá (W, H) cho batch độ sáng / màu (chỉ dùng giá trị trung bình)
+SHARPNESS_PROXY_SIDE = SCORING_MAX_SIDE  # Độ rõ đo trên proxy giữ tỷ lệ, cạnh dài cố định (không bóp về tensor vuông)
+SHARPNESS_VAR_DIVISOR = 65      # Laplacian var / 65 (max 15) - hiệu chỉnh cho proxy 1200px, xem calculate_image_quality_scores_batch
+SHARPNESS_MAX_SCORE = 15        # Điểm độ rõ tối đa
+SCORING_BATCH_SIZE = 8          # Số ảnh mỗi batch khi đo điểm (quality được vector hoá theo batch)
+SCORE_TIERS = ('header', 'quality', 'faces')  # Thứ tự tier chấm điểm (rẻ → đắt)
+MIN_ACCEPTABLE_SCORE = 40       # Tổng điểm tối thiểu để ảnh được chấp nhận
+FACE_SCORE_MAX = 40             # Điểm khuôn mặt tối đa (= MIN_ACCEPTABLE_SCORE nên tier quality không loại sớm theo điểm)
+FACE_HAAR_MODE = 'adaptive'     # 'adaptive' = chỉ chạy Haar khi MediaPipe không chắc, 'full' = luôn chạy đủ 6 pass
+FACE_CONFIDENT_THRESHOLD = 0.85 # MediaPipe conf ≥ ngưỡng này → bỏ qua Haar
+FACE_LOW_CONTRAST_STD = 40      # Độ lệch chuẩn gray < ngưỡng → thêm pass Haar trên ảnh CLAHE
+# Validate khuôn mặt đo trên proxy: quy đổi về thang ảnh gốc theo scale^exp (s = cạnh gốc / cạnh proxy)
+FACE_EDGE_SCALE_EXP = 1.0       # Tỷ lệ pixel cạnh trên proxy ≈ gốc × s → chia s
+FACE_GRADIENT_SCALE_EXP = 0.5   # Gradient Sobel / ngưỡng Canny trên proxy ≈ gốc × √s
+FACE_VALIDATION_MIN_AREA = 400  # Chỉ validate texture khi vùng mặt > 400 px (tính theo ảnh gốc)
+
 def check_file_readable(image_path):
     """
     Kiểm tra file có thể đọc được không
@@ -502,89 +610,241 @@ def check_file_readable(image_path):
     except Exception as e:
         return False, f"Lỗi đọc file: {str(e)}"
 
-def detect_faces_and_score(image_path):
+def read_image_header(image_path):
     """
-    🥇 SUPER AI Face Detection: MediaPipe + Haar Cascade hybrid approach
-    Sử dụng AI mạnh nhất để detect chính xác khuôn mặt
+    Lấy kích thước từ header ảnh (PIL chỉ đọc phần đầu file, chưa đọc hết bytes / decode pixel)
+    Dùng cho tier rẻ nhất của scoring, đọc + decode sau bằng decode_image_context nếu ảnh qua được tier header
+    
+    Returns:
+        dict: {
+            'path': đường dẫn ảnh,
+            'error': lỗi đọc file (None nếu OK),
+            'width', 'height': kích thước gốc từ header (như PIL),
+            'size_error': lỗi đọc header (None nếu OK),
+            'img': ảnh BGR proxy (cạnh dài <= max_side) hoặc None nếu không decode được,
+            'gray': ảnh xám của proxy,
+            'scale': hệ số từ toạ độ proxy → toạ độ ảnh gốc
+        }
     """
+    context = {
+        'path': image_path, 'error': None,
+        'width': 0, 'height': 0, 'size_error': None,
+        'img': None, 'gray': None, 'scale': 1.0
+    }
+    
+    # Kiểm tra file bằng stat (thay cho check_file_readable + đọc cả file)
     try:
-        # Đọc ảnh với xử lý encoding UTF-8
-        with open(image_path, 'rb') as f:
+        if not os.path.exists(image_path):
+            context['error'] = "File không tồn tại"
+            return context
+        if not os.path.isfile(image_path):
+            context['error'] = "Không phải file"
+            return context
+        if os.path.getsize(image_path) < 10:
+            context['error'] = "File rỗng hoặc bị hỏng"
+            return context
+    except Exception as e:
+        context['error'] = f"Lỗi đọc file: {str(e)}"
+        return context
+    
+    # Kích thước gốc từ header: Image.open đọc lazy trên file handle (không decode pixel)
+    try:
+        with Image.open(image_path) as header_img:
+            context['width'], context['height'] = header_img.size
+    except Exception as e:
+        context['size_error'] = f"Lỗi đọc ảnh: {str(e)}"
+    
+    return context
+
+def decode_image_context(context, max_side=SCORING_MAX_SIDE):
+    """
+    Đọc + decode + downscale ảnh 1 lần vào context đã đọc bằng read_image_header
+    Chỉ gọi cho ảnh qua được tier header (ảnh bị loại sớm không bị đọc hết file)
+    Ảnh lớn hơn bản thu nhỏ (derivative) đủ cho max_side luôn được decode từ bản đó (tạo ngay nếu chưa có):
+    cùng 1 ảnh luôn chấm trên cùng 1 nguồn, điểm trong score cache không phụ thuộc đã có derivative hay chưa
+    """
+    if context['error']:
+        return context
+    
+    long_side = max(context['width'], context['height'])
+    if any(max_side <= size < long_side for size in DERIVATIVE_SIZES):
+        try:
+            generate_derivatives(context['path'])
+        except Exception as e:
+            log(f"⚠️ Không tạo được bản thu nhỏ {os.path.basename(context['path'])}: {str(e)}")
+    
+    try:
+        derivative_path = select_image_source(context['path'], min_long_side=max_side)
+        with open(derivative_path, 'rb') as f:
             file_bytes = np.frombuffer(f.read(), np.uint8)
+        
+        # JPEG có thể decode thẳng ở 1/2, 1/4, 1/8 kích thước → nhanh hơn nhiều với ảnh 12MP
+        decode_flag = cv2.IMREAD_COLOR
+        # Bản thu nhỏ đã gần max_side → decode đủ độ phân giải
+        decode_long_side = long_side if derivative_path == context['path'] else 0
+        for factor, flag in [(8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)]:
+            if decode_long_side and decode_long_side / factor >= max_side:
+                decode_flag = flag
+                break
+        
+        img = cv2.imdecode(file_bytes, decode_flag)
+        if img is None and decode_flag != cv2.IMREAD_COLOR:
             img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+        if img is None:
+            return context
+        
+        # Downscale 1 lần về proxy
+        decoded_long = max(img.shape[:2])
+        if decoded_long > max_side:
+            proxy_scale = max_side / decoded_long
+            img = cv2.resize(img, (int(img.shape[1] * proxy_scale), int(img.shape[0] * proxy_scale)),
+                             interpolation=cv2.INTER_AREA)
+        
+        context['img'] = img
+        context['gray'] = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        context['scale'] = (long_side / max(img.shape[:2])) if long_side else 1.0
+    except Exception:
+        context['img'] = None
+        context['gray'] = None
+    
+    return context
+
+def load_image_context(image_path, max_side=SCORING_MAX_SIDE):
+    """
+    Đọc file + decode ảnh đúng 1 lần, downscale 1 lần, dùng chung cho mọi bước chấm điểm
+    
+    Returns:
+        dict context (xem read_image_header)
+    """
+    context = read_image_header(image_path)
+    if context['error']:
+        return context
+    return decode_image_context(context, max_side)
+
+def plan_haar_passes(mediapipe_detections, gray):
+    """
+    Chọn các pass Haar cần chạy dựa trên kết quả MediaPipe (adaptive detection)
+        - MediaPipe tự tin (conf ≥ FACE_CONFIDENT_THRESHOLD): bỏ qua Haar hoàn toàn
+        - MediaPipe thấy mặt nhưng không chắc: 1 pass xác nhận
+        - MediaPipe không thấy gì: pass rẻ (+ enhanced nếu ảnh tương phản thấp),
+          tự leo thang đủ các pass nếu pass rẻ thấy ứng viên
+    
+    Returns:
+        list: [(tên_cascade, 'normal'|'enhanced'), ...]
+    """
+    if FACE_HAAR_MODE == 'full':
+        return [(name, img_type) for name in HAAR_CASCADE_FILES for img_type in ('normal', 'enhanced')]
+    
+    if mediapipe_detections:
+        best_confidence = max(d['confidence'] for d in mediapipe_detections)
+        if best_confidence >= FACE_CONFIDENT_THRESHOLD:
+            return []
+        return [('haar_default', 'normal')]
+    
+    passes = [('haar_default', 'normal')]
+    if gray is not None and float(gray.std()) < FACE_LOW_CONTRAST_STD:
+        # Ảnh tối / tương phản thấp: CLAHE mới giúp Haar thấy mặt
+        passes.append(('haar_default', 'enhanced'))
+    return passes
+
+def escalate_haar_passes(face_passes):
+    """Danh sách đủ các pass Haar chưa chạy (dùng khi ảnh mơ hồ)"""
+    return [(name, img_type) for name in HAAR_CASCADE_FILES for img_type in ('normal', 'enhanced')
+            if f"{name}_{img_type}" not in face_passes]
+
+def haar_passes_escalated(face_passes, pending_passes):
+    """Kiểm tra đã leo thang đủ các pass Haar chưa"""
+    planned = set(face_passes) | {f"{name}_{img_type}" for name, img_type in pending_passes}
+    return len(planned) >= len(HAAR_CASCADE_FILES) * 2
+
+def format_face_passes(face_passes):
+    """Chuỗi ngắn gọn báo các pass đã chạy, vd: [pass MP:2 Haar:1/6]"""
+    mediapipe_count = sum(1 for p in face_passes if p.startswith('mediapipe'))
+    haar_count = len(face_passes) - mediapipe_count
+    return f"[pass MP:{mediapipe_count} Haar:{haar_count}/{len(HAAR_CASCADE_FILES) * 2}]"
+
+def detect_faces_and_score(image_path, image_context=None):
+    """
+    🥇 SUPER AI Face Detection: MediaPipe + Haar Cascade hybrid approach
+    Sử dụng AI mạnh nhất để detect chính xác khuôn mặt
+    
+    Args:
+        image_context: context từ load_image_context (None = tự đọc ảnh)
+    """
+    try:
+        if image_context is None:
+            image_context = load_image_context(image_path)
+        img = image_context['img']
             
         if img is None:
             return 0, 0, "Không thể đọc ảnh (format không hỗ trợ)"
         
+        # Detect trực tiếp trên proxy đã downscale trong context (toạ độ proxy)
         img_height, img_width = img.shape[:2]
         img_area = img_height * img_width
-        
-        # Resize if too large để optimize processing
+        img_resized = img
         original_scale = 1.0
-        if max(img.shape[:2]) > 1200:
-            scale = 1200 / max(img.shape[:2])
-            new_width = int(img.shape[1] * scale)
-            new_height = int(img.shape[0] * scale)
-            img_resized = cv2.resize(img, (new_width, new_height))
-            original_scale = 1 / scale
-        else:
-            img_resized = img.copy()
+        
+        # Ngưỡng 20px tính theo ảnh gốc
+        min_face_px = 20 / image_context['scale']
+        # Hệ số quy đổi số đo texture trên proxy về thang ảnh gốc (ngưỡng validate hiệu chỉnh cho ảnh gốc)
+        edge_scale = image_context['scale'] ** FACE_EDGE_SCALE_EXP
+        gradient_scale = image_context['scale'] ** FACE_GRADIENT_SCALE_EXP
+        min_validation_area = FACE_VALIDATION_MIN_AREA / image_context['scale'] ** 2
         
         all_detections = []
+        face_passes = []  # Các pass detector đã thực sự chạy (báo cáo CPU tiết kiệm được)
+        image_context['face_passes'] = face_passes
+        image_context['face_boxes'] = []
         
         # ========== METHOD 1: MediaPipe (Google's AI - Most Accurate) ==========
         try:
-            import mediapipe as mp
-            
-            mp_face_detection = mp.solutions.face_detection
-            
             # Test với cả 2 models của MediaPipe
             models = [
                 (0, 0.6, 'mediapipe_short'),    # Short-range model
                 (1, 0.6, 'mediapipe_full'),     # Full-range model
             ]
             
+            # Convert BGR to RGB for MediaPipe (1 lần cho cả 2 models)
+            img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
+            
             for model_sel, min_conf, method_name in models:
                 try:
-                    with mp_face_detection.FaceDetection(
-                        model_selection=model_sel, 
-                        min_detection_confidence=min_conf
-                    ) as face_detection:
-                        # Convert BGR to RGB for MediaPipe
-                        img_rgb = cv2.cvtColor(img_resized, cv2.COLOR_BGR2RGB)
-                        results_mp = face_detection.process(img_rgb)
-                        
-                        if results_mp.detections:
-                            for detection in results_mp.detections:
-                                # Get bounding box
-                                bbox = detection.location_data.relative_bounding_box
-                                h_res, w_res = img_resized.shape[:2]
-                                
-                                x = int(bbox.xmin * w_res * original_scale)
-                                y = int(bbox.ymin * h_res * original_scale) 
-                                w = int(bbox.width * w_res * original_scale)
-                                h = int(bbox.height * h_res * original_scale)
-                                
-                                confidence = detection.score[0]
+                    # Detector warm dùng chung (registry), không build graph mới cho từng ảnh
+                    detections_mp = run_mediapipe_face_detection(img_rgb, model_sel, min_conf)
+                    face_passes.append(method_name)
+                    
+                    if detections_mp:
+                        for detection in detections_mp:
+                            # Get bounding box
+                            bbox = detection.location_data.relative_bounding_box
+                            h_res, w_res = img_resized.shape[:2]
+                            
+                            x = int(bbox.xmin * w_res * original_scale)
+                            y = int(bbox.ymin * h_res * original_scale) 
+                            w = int(bbox.width * w_res * original_scale)
+                            h = int(bbox.height * h_res * original_scale)
+                            
+                            confidence = detection.score[0]
+                            
+                            # Basic validation
+                            face_area = w * h
+                            size_ratio = face_area / img_area
+                            
+                            if (0.001 <= size_ratio <= 0.5 and 
+                                w >= min_face_px and h >= min_face_px and
+                                x >= 0 and y >= 0 and
+                                x + w <= img_width and y + h <= img_height):
                                 
-                                # Basic validation
-                                face_area = w * h
-                                size_ratio = face_area / img_area
+                                detection_data = {
+                                    'bbox': (x, y, w, h),
+                                    'confidence': confidence,
+                                    'method': method_name,
+                                    'size_ratio': size_ratio,
+                                    'ai_type': 'mediapipe'
+                                }
                                 
-                                if (0.001 <= size_ratio <= 0.5 and 
-                                    w >= 20 and h >= 20 and
-                                    x >= 0 and y >= 0 and
-                                    x + w <= img_width and y + h <= img_height):
-                                    
-                                    detection_data = {
-                                        'bbox': (x, y, w, h),
-                                        'confidence': confidence,
-                                        'method': method_name,
-                                        'size_ratio': size_ratio,
-                                        'ai_type': 'mediapipe'
-                                    }
-                                    
-                                    all_detections.append(detection_data)
+                                all_detections.append(detection_data)
                 except Exception:
                     continue
         except ImportError:
@@ -592,64 +852,73 @@ def detect_faces_and_score(image_path):
         except Exception:
             pass
         
-        # ========== METHOD 2: Enhanced Haar Cascade (Backup) ==========
+        # ========== METHOD 2: Enhanced Haar Cascade (Backup, adaptive) ==========
         try:
-            gray = cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY)
+            gray = image_context['gray']
+            mediapipe_found = bool(all_detections)
+            haar_passes = plan_haar_passes(all_detections, gray)
+            enhanced = None
             
-            # CLAHE enhancement
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            enhanced = clahe.apply(gray)
-            
-            cascades = [
-                ('haar_default', cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'),
-                ('haar_alt', cv2.data.haarcascades + 'haarcascade_frontalface_alt.xml'),
-                ('haar_alt2', cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml'),
-            ]
-            
-            for name, path in cascades:
+            while haar_passes:
+                name, img_type = haar_passes.pop(0)
                 try:
-                    cascade = cv2.CascadeClassifier(path)
-                    if cascade.empty():
+                    # Cascade đã load sẵn trong registry
+                    cascade = get_haar_cascade(name)
+                    if cascade is None:
                         continue
                     
+                    if img_type == 'enhanced':
+                        if enhanced is None:
+                            # CLAHE enhancement (chỉ tính khi thật sự cần pass enhanced)
+                            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+                            enhanced = clahe.apply(gray)
+                        test_img = enhanced
+                    else:
+                        test_img = gray
+                    
                     # Conservative parameters để giảm false positive
-                    for img_type, test_img in [('normal', gray), ('enhanced', enhanced)]:
-                        faces = cascade.detectMultiScale(
-                            test_img,
-                            scaleFactor=1.08,
-                            minNeighbors=4,
-                            minSize=(25, 25),
-                            maxSize=(test_img.shape[1]//2, test_img.shape[0]//2)
-                        )
+                    faces = cascade.detectMultiScale(
+                        test_img,
+                        scaleFactor=1.08,
+                        minNeighbors=4,
+                        minSize=(25, 25),
+                        maxSize=(test_img.shape[1]//2, test_img.shape[0]//2)
+                    )
+                    face_passes.append(f"{name}_{img_type}")
+                    
+                    for face in faces:
+                        x, y, w, h = face
+                        
+                        # Scale back to original
+                        x_orig = int(x * original_scale)
+                        y_orig = int(y * original_scale)
+                        w_orig = int(w * original_scale)
+                        h_orig = int(h * original_scale)
                         
-                        for face in faces:
-                            x, y, w, h = face
+                        face_area = w_orig * h_orig
+                        size_ratio = face_area / img_area
+                        
+                        if (0.001 <= size_ratio <= 0.4 and
+                            w_orig >= min_face_px and h_orig >= min_face_px and
+                            x_orig >= 0 and y_orig >= 0 and
+                            x_orig + w_orig <= img_width and y_orig + h_orig <= img_height):
                             
-                            # Scale back to original
-                            x_orig = int(x * original_scale)
-                            y_orig = int(y * original_scale)
-                            w_orig = int(w * original_scale)
-                            h_orig = int(h * original_scale)
+                            confidence = 0.7 if name == 'haar_default' else 0.6
                             
-                            face_area = w_orig * h_orig
-                            size_ratio = face_area / img_area
+                            detection_data = {
+                                'bbox': (x_orig, y_orig, w_orig, h_orig),
+                                'confidence': confidence,
+                                'method': f"{name}_{img_type}",
+                                'size_ratio': size_ratio,
+                                'ai_type': 'haar'
+                            }
                             
-                            if (0.001 <= size_ratio <= 0.4 and
-                                w_orig >= 20 and h_orig >= 20 and
-                                x_orig >= 0 and y_orig >= 0 and
-                                x_orig + w_orig <= img_width and y_orig + h_orig <= img_height):
-                                
-                                confidence = 0.7 if name == 'haar_default' else 0.6
-                                
-                                detection_data = {
-                                    'bbox': (x_orig, y_orig, w_orig, h_orig),
-                                    'confidence': confidence,
-                                    'method': f"{name}_{img_type}",
-                                    'size_ratio': size_ratio,
-                                    'ai_type': 'haar'
-                                }
-                                
-                                all_detections.append(detection_data)
+                            all_detections.append(detection_data)
+                    
+                    # Ảnh mơ hồ: pass rẻ thấy ứng viên mà MediaPipe không thấy → leo thang đủ các pass
+                    if (len(faces) > 0 and not mediapipe_found and
+                            not haar_passes_escalated(face_passes, haar_passes)):
+                        haar_passes = escalate_haar_passes(face_passes)
                 except Exception:
                     continue
         except Exception:
@@ -665,20 +934,20 @@ def detect_faces_and_score(image_path):
             if (y + h <= img_height and x + w <= img_width and y >= 0 and x >= 0):
                 face_region = img[y:y+h, x:x+w]
                 
-                if face_region.size > 400:  # Only validate larger faces
+                if face_region.size > min_validation_area:  # Only validate larger faces
                     face_gray = cv2.cvtColor(face_region, cv2.COLOR_BGR2GRAY)
                     
                     # 1. Texture Analysis
                     texture_var = np.var(face_gray)
                     
-                    # 2. Edge Analysis
-                    edges = cv2.Canny(face_gray, 30, 100)
-                    edge_ratio = np.sum(edges > 0) / edges.size
+                    # 2. Edge Analysis (ngưỡng Canny và tỷ lệ cạnh quy đổi về thang ảnh gốc)
+                    edges = cv2.Canny(face_gray, 30 * gradient_scale, 100 * gradient_scale)
+                    edge_ratio = np.sum(edges > 0) / edges.size / edge_scale
                     
                     # 3. Gradient Analysis
                     sobelx = cv2.Sobel(face_gray, cv2.CV_64F, 1, 0, ksize=3)
                     sobely = cv2.Sobel(face_gray, cv2.CV_64F, 0, 1, ksize=3)
-                    gradient_strength = np.mean(np.sqrt(sobelx**2 + sobely**2))
+                    gradient_strength = np.mean(np.sqrt(sobelx**2 + sobely**2)) / gradient_scale
                     
                     # MediaPipe detections get more lenient validation (since they're more accurate)
                     if detection['ai_type'] == 'mediapipe':
@@ -748,11 +1017,21 @@ def detect_faces_and_score(image_path):
         else:
             final_faces = []
         
+        # Box chuẩn hoá 0-1 (độc lập độ phân giải) dùng chung cho collage và smart crop
+        image_context['face_boxes'] = [
+            [round(f['bbox'][0] / img_width, 4), round(f['bbox'][1] / img_height, 4),
+             round(f['bbox'][2] / img_width, 4), round(f['bbox'][3] / img_height, 4),
+             round(float(f['confidence']), 3)]
+            for f in final_faces
+        ]
+        
         # ========== SCORING ==========
         num_faces = len(final_faces)
         
+        passes_info = format_face_passes(face_passes)
+        
         if num_faces == 0:
-            return 0, 0, "❌ Không phát hiện khuôn mặt (super-AI detection)"
+            return 0, 0, f"❌ Không phát hiện khuôn mặt (super-AI detection) {passes_info}"
         
         # Advanced scoring
         if num_faces == 1:
@@ -786,7 +1065,7 @@ def detect_faces_and_score(image_path):
             
             face_score = base_score + ai_bonus + conf_bonus + multi_bonus
         
-        face_score = min(40, max(0, int(face_score)))
+        face_score = min(FACE_SCORE_MAX, max(0, int(face_score)))
         
         # Detailed report
         ai_types = [f['ai_type'] for f in final_faces]
@@ -803,6 +1082,7 @@ def detect_faces_and_score(image_path):
         detail = f"✅ {num_faces} faces ({'+'.join(ai_info)}, conf:{avg_conf:.2f})"
         if num_faces > 1:
             detail += f" [+{min(12, (num_faces - 1) * 4)} multi-bonus]"
+        detail += f" {passes_info}"
         
         return num_faces, face_score, detail
         
@@ -812,87 +1092,332 @@ def detect_faces_and_score(image_path):
     except Exception as e:
         return 0, 0, f"Lỗi AI detection: {str(e)[:50]}"
 
-def calculate_image_quality_score(image_path):
+def measure_sharpness(img):
+    """
+    Variance của Laplacian trên proxy giữ tỷ lệ, cạnh dài SHARPNESS_PROXY_SIDE
+    (ảnh nhỏ hơn được phóng lên → nhoè hơn ở cỡ hiển thị, điểm thấp hơn)
+    """
+    h, w = img.shape[:2]
+    scale = SHARPNESS_PROXY_SIDE / max(h, w)
+    if abs(scale - 1.0) > 1e-3:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))),
+                         interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+def calculate_image_quality_scores_batch(images):
+    """
+    Tính điểm chất lượng cho N ảnh trong 1 lượt vector hoá NumPy
+    
+    Độ sáng / màu chỉ dùng giá trị trung bình nên được tính trên tensor (N, H, W, 3) kích thước
+    QUALITY_TENSOR_SIZE. Độ rõ thì phụ thuộc tỷ lệ + độ phân giải nên đo riêng từng ảnh (measure_sharpness):
+        - Độ rõ: variance của cv2.Laplacian trên proxy cạnh dài SHARPNESS_PROXY_SIDE / SHARPNESS_VAR_DIVISOR, max 15
+          (bản gốc đo trên ảnh full-res với / 100; trên ảnh ~1200px, proxy 1200px cho var ≈ 0.65 × full-res
+          ở ảnh nét nên divisor 65 giữ nguyên điểm cho ảnh cỡ đó. Ảnh lớn hơn được chấm theo độ nét ở
+          cỡ proxy. Ảnh nhoè vẫn điểm thấp: ảnh 4000x3000 Gaussian blur k=25 → var ~24 → 0.4 điểm)
+        - Độ sáng: 15 điểm trong khoảng 80-180
+        - Cân bằng màu: 20 - std(mean B, G, R) / 5
+    
+    Args:
+        images: list ảnh BGR uint8 (phần tử None = ảnh không decode được)
+    
+    Returns:
+        tuple: (np.ndarray điểm shape (N,), list chi_tiết)
+    """
+    num_images = len(images)
+    scores = np.zeros(num_images, dtype=np.float64)
+    details = ["Không thể đọc ảnh (format không hỗ trợ)"] * num_images
+    
+    valid_indices = [i for i, img in enumerate(images) if img is not None]
+    if not valid_indices:
+        return scores, details
+    
+    # 1. Độ rõ (Sharpness) - 15 điểm: Laplacian trên proxy giữ tỷ lệ của từng ảnh
+    laplacian_var = np.array([measure_sharpness(images[i]) for i in valid_indices], dtype=np.float64)
+    sharpness_scores = np.minimum(SHARPNESS_MAX_SCORE, laplacian_var / SHARPNESS_VAR_DIVISOR)
+    
+    # Tensor chuẩn hoá độ phân giải thấp (N, H, W, 3) cho các chỉ số trung bình
+    tensor = np.stack([
+        cv2.resize(images[i], QUALITY_TENSOR_SIZE, interpolation=cv2.INTER_AREA)
+        for i in valid_indices
+    ]).astype(np.float32)
+    
+    # Grayscale theo hệ số BGR của OpenCV
+    gray = tensor @ np.array([0.114, 0.587, 0.299], dtype=np.float32)
+    
+    # 2. Độ sáng (Brightness) - 15 điểm, cao nhất khi brightness trong khoảng 80-180
+    brightness = gray.reshape(len(valid_indices), -1).mean(axis=1, dtype=np.float64)
+    brightness_scores = np.where(
+        (brightness >= 80) & (brightness <= 180),
+        15.0,
+        np.maximum(0, 15 - np.abs(brightness - 130) / 10)
+    )
+    
+    # 3. Cân bằng màu sắc - 20 điểm: độ lệch chuẩn của trung bình các kênh màu
+    channel_means = tensor.reshape(len(valid_indices), -1, 3).mean(axis=1, dtype=np.float64)
+    color_scores = 20 - np.minimum(20, channel_means.std(axis=1) / 5)
+    
+    totals = sharpness_scores + brightness_scores + color_scores
+    for j, i in enumerate(valid_indices):
+        scores[i] = totals[j]
+        details[i] = f"Rõ:{sharpness_scores[j]:.1f} Sáng:{brightness_scores[j]:.1f} Màu:{color_scores[j]:.1f}"
+    
+    return scores, details
+
+def calculate_image_quality_score(image_path, image_context=None):
     """
     Tính điểm chất lượng ảnh (độ rõ, độ sáng, màu sắc)
+    Dùng chung engine với calculate_image_quality_scores_batch (batch 1 ảnh)
+    
+    Args:
+        image_context: context từ load_image_context (None = tự đọc ảnh)
     
     Returns:
         tuple: (điểm_chất_lượng, chi_tiết)
     """
     try:
-        # Đọc ảnh với xử lý encoding UTF-8
-        with open(image_path, 'rb') as f:
-            file_bytes = np.frombuffer(f.read(), np.uint8)
-            img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-            
-        if img is None:
-            return 0, "Không thể đọc ảnh (format không hỗ trợ)"
-        
-        # 1. Độ rõ (Sharpness) - 15 điểm
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        sharpness_score = min(15, laplacian_var / 100)  # Normalize, max 15
-        
-        # 2. Độ sáng (Brightness) - 15 điểm  
-        brightness = np.mean(gray)
-        # Điểm cao nhất khi brightness trong khoảng 80-180
-        if 80 <= brightness <= 180:
-            brightness_score = 15
-        else:
-            brightness_score = max(0, 15 - abs(brightness - 130) / 10)
-        
-        # 3. Cân bằng màu sắc - 20 điểm
-        # Tính độ lệch chuẩn của các kênh màu
-        b, g, r = cv2.split(img)
-        color_balance = 20 - min(20, np.std([np.mean(b), np.mean(g), np.mean(r)]) / 5)
+        if image_context is None:
+            image_context = load_image_context(image_path)
         
-        total_quality = sharpness_score + brightness_score + color_balance
-        detail = f"Rõ:{sharpness_score:.1f} Sáng:{brightness_score:.1f} Màu:{color_balance:.1f}"
-        
-        return total_quality, detail
+        scores, details = calculate_image_quality_scores_batch([image_context['img']])
+        return float(scores[0]), details[0]
         
     except Exception as e:
         return 0, f"Lỗi quality: {str(e)}"
 
-def get_image_resolution_score(image_path):
+def calculate_resolution_score(width, height, target_resolution=None):
+    """
+    Tính điểm độ phân giải từ kích thước ảnh (không cần đọc file)
+    
+    Returns:
+        tuple: (điểm_độ_phân_giải, is_acceptable, reason)
+    """
+    target_w, target_h = target_resolution or RESOLUTION  # 1280x720
+    
+    # Kiểm tra ảnh có đạt độ phân giải tối thiểu không (ít nhất 80% của 720p)
+    min_acceptable_w = target_w * 0.8  # 1024
+    min_acceptable_h = target_h * 0.8  # 576
+    is_acceptable = (width >= min_acceptable_w and height >= min_acceptable_h)
+    
+    # Tạo lý do chi tiết
+    if not is_acceptable:
+        reason = f"Độ phân giải {width}x{height} < tiêu chuẩn tối thiểu {min_acceptable_w:.0f}x{min_acceptable_h:.0f} (80% của 720p)"
+    else:
+        reason = f"Độ phân giải {width}x{height} đạt chuẩn"
+    
+    # Tính điểm độ phân giải (0-10 điểm)
+    if width >= target_w and height >= target_h:
+        resolution_score = 10  # 720p hoặc cao hơn
+    elif width >= target_w * 0.8 and height >= target_h * 0.8:
+        resolution_score = 7   # 80% 720p
+    elif width >= target_w * 0.6 and height >= target_h * 0.6:
+        resolution_score = 4   # 60% 720p
+    else:
+        resolution_score = 1   # Quá nhỏ
+    
+    return resolution_score, is_acceptable, reason
+
+def get_image_resolution_score(image_path, image_context=None):
     """
     Kiểm tra độ phân giải ảnh và tính điểm
     
+    Args:
+        image_context: context từ load_image_context (None = đọc header bằng PIL)
+    
     Returns:
         tuple: (điểm_độ_phân_giải, width, height, is_acceptable, reason)
     """
     try:
-        with Image.open(image_path) as img:
-            width, height = img.size
-        
-        target_w, target_h = RESOLUTION  # 1280x720
-        
-        # Kiểm tra ảnh có đạt độ phân giải tối thiểu không (ít nhất 80% của 720p)
-        min_acceptable_w = target_w * 0.8  # 1024
-        min_acceptable_h = target_h * 0.8  # 576
-        is_acceptable = (width >= min_acceptable_w and height >= min_acceptable_h)
-        
-        # Tạo lý do chi tiết
-        if not is_acceptable:
-            reason = f"Độ phân giải {width}x{height} < tiêu chuẩn tối thiểu {min_acceptable_w:.0f}x{min_acceptable_h:.0f} (80% của 720p)"
-        else:
-            reason = f"Độ phân giải {width}x{height} đạt chuẩn"
-        
-        # Tính điểm độ phân giải (0-10 điểm)
-        if width >= target_w and height >= target_h:
-            resolution_score = 10  # 720p hoặc cao hơn
-        elif width >= target_w * 0.8 and height >= target_h * 0.8:
-            resolution_score = 7   # 80% 720p
-        elif width >= target_w * 0.6 and height >= target_h * 0.6:
-            resolution_score = 4   # 60% 720p
+        if image_context is not None:
+            if image_context['size_error']:
+                return 0, 0, 0, False, image_context['size_error']
+            width, height = image_context['width'], image_context['height']
         else:
-            resolution_score = 1   # Quá nhỏ
+            with Image.open(image_path) as img:
+                width, height = img.size
         
+        resolution_score, is_acceptable, reason = calculate_resolution_score(width, height)
         return resolution_score, width, height, is_acceptable, reason
         
     except Exception as e:
         return 0, 0, 0, False, f"Lỗi đọc ảnh: {str(e)}"
 
+def _tiered_rejection(record, target_resolution=None):
+    """
+    Xét các tier đã chạy trong record theo thứ tự rẻ → đắt, trả về tier đầu tiên loại ảnh
+    
+    - header: lỗi kích thước hoặc độ phân giải dưới chuẩn
+    - quality: chỉ loại ảnh không decode được. Không loại theo cận trên điểm: ảnh qua header
+      có resolution ≥ 7 và FACE_SCORE_MAX = MIN_ACCEPTABLE_SCORE, nên cận trên luôn ≥ 47
+      (một cận "thực tế" thấp hơn FACE_SCORE_MAX sẽ loại nhầm ảnh đạt điểm mặt tối đa)
+    - faces: tổng điểm cuối cùng < MIN_ACCEPTABLE_SCORE
+    
+    Returns:
+        (tier, lý_do) hoặc None nếu chưa bị loại
+    """
+    tiers = record.get('tiers', SCORE_TIERS)  # Record cũ (không có 'tiers') là record đầy đủ
+    
+    # Tier 1: header - chỉ cần kích thước ảnh
+    if record.get('size_error'):
+        return 'header', record['size_error']
+    resolution_score, resolution_ok, resolution_reason = calculate_resolution_score(
+        record['width'], record['height'], target_resolution)
+    if not resolution_ok:
+        return 'header', resolution_reason
+    
+    # Tier 2: quality trên thumbnail đã decode
+    if 'quality' in tiers and not record.get('decoded', True):
+        return 'quality', "Không thể đọc ảnh (format không hỗ trợ)"
+    
+    # Tier 3: face detection - điểm cuối cùng
+    if 'faces' in tiers:
+        total_score = record['face_score'] + record['quality_score'] + resolution_score
+        if total_score < MIN_ACCEPTABLE_SCORE:
+            return 'faces', f"Điểm thấp {total_score:.1f}/{MIN_ACCEPTABLE_SCORE}"
+    
+    return None
+
+def is_score_record_complete(record):
+    """Record đã chạy đủ mọi tier (dùng được cho bất kỳ độ phân giải đích nào)"""
+    return record is not None and 'faces' in record.get('tiers', SCORE_TIERS)
+
+def is_score_record_usable(record, target_resolution=None):
+    """Record từ cache dùng được nếu đã chạy đủ tier, hoặc đã bị loại sớm với độ phân giải đích này"""
+    if record is None:
+        return False
+    if is_score_record_complete(record):
+        return True
+    return target_resolution is not None and _tiered_rejection(record, target_resolution) is not None
+
+def measure_image_scores_batch(image_paths, target_resolution=None, max_tier=None):
+    """
+    Đo các chỉ số AI của nhiều ảnh theo từng tier rẻ → đắt:
+        1. header:  kích thước từ header (không decode)
+        2. quality: decode thumbnail + độ rõ/sáng/màu, vector hoá cho cả batch
+        3. faces:   MediaPipe + Haar face detection (từng ảnh)
+    
+    Args:
+        image_paths: danh sách đường dẫn ảnh
+        target_resolution: độ phân giải video đích, cho phép dừng sớm ở tier rẻ
+                           khi ảnh chắc chắn bị loại. None = chạy đủ mọi tier
+        max_tier: tier cuối cùng được chạy (vd 'header' khi hết thời gian chấm), None = tất cả
+    
+    Returns:
+        dict: {image_path: record}, record JSON được (dùng để lưu vào score cache):
+        {'tiers', 'num_faces', 'face_score', 'face_detail', 'face_passes', 'face_boxes',
+        'quality_score', 'quality_detail', 'decoded', 'width', 'height', 'size_error'} hoặc {'error': ...}
+    """
+    records = {}
+    contexts = {}
+    
+    # Tier 1: header (PIL chỉ đọc phần đầu file, chưa decode)
+    for image_path in image_paths:
+        image_context = read_image_header(image_path)
+        if image_context['error']:
+            records[image_path] = {'error': image_context['error']}
+            continue
+        
+        record = {
+            'tiers': ['header'],
+            'num_faces': 0, 'face_score': 0, 'face_detail': '',
+            'quality_score': 0.0, 'quality_detail': '', 'decoded': False,
+            'width': image_context['width'], 'height': image_context['height'],
+            'size_error': image_context['size_error']
+        }
+        records[image_path] = record
+        if target_resolution is not None and _tiered_rejection(record, target_resolution):
+            continue
+        contexts[image_path] = image_context
+    
+    if max_tier == 'header':
+        return records
+    
+    # Tier 2: decode thumbnail 1 lần + chất lượng (0-50 điểm) cho cả batch
+    quality_paths = list(contexts)
+    for image_path in quality_paths:
+        decode_image_context(contexts[image_path])
+    
+    quality_scores, quality_details = calculate_image_quality_scores_batch(
+        [contexts[path]['img'] for path in quality_paths]
+    )
+    
+    for image_path, quality_score, quality_detail in zip(quality_paths, quality_scores, quality_details):
+        record = records[image_path]
+        record['quality_score'] = float(quality_score)
+        record['quality_detail'] = quality_detail
+        record['decoded'] = contexts[image_path]['img'] is not None
+        record['tiers'].append('quality')
+        if target_resolution is not None and _tiered_rejection(record, target_resolution):
+            del contexts[image_path]
+    
+    if max_tier == 'quality':
+        return records
+    
+    # Tier 3: khuôn mặt (0-40 điểm) - đắt nhất, chỉ chạy với ảnh qua header và decode được
+    for image_path, image_context in contexts.items():
+        num_faces, face_score, face_detail = detect_faces_and_score(image_path, image_context)
+        record = records[image_path]
+        record['num_faces'] = int(num_faces)
+        record['face_score'] = int(face_score)
+        record['face_detail'] = face_detail
+        record['face_passes'] = list(image_context.get('face_passes', []))
+        record['face_boxes'] = list(image_context.get('face_boxes', []))
+        record['tiers'].append('faces')
+    
+    return records
+
+def measure_image_scores(image_path, target_resolution=None):
+    """
+    Đo các chỉ số AI của 1 ảnh (batch 1 ảnh của measure_image_scores_batch)
+    
+    Returns:
+        dict: record như measure_image_scores_batch
+    """
+    return measure_image_scores_batch([image_path], target_resolution)[image_path]
+
+def finalize_image_score(record, target_resolution=None):
+    """
+    Tính tổng điểm từ record đã đo (có thể lấy từ cache)
+    
+    Returns:
+        tuple: (tổng_điểm, chi_tiết, is_acceptable, rejection_reason)
+        rejection_reason ghi rõ tier đã loại ảnh, vd: "[tier header] Độ phân giải ..."
+    """
+    if record.get('error'):
+        read_error = record['error']
+        return 0, f"File error: {read_error}", False, f"[tier header] File không đọc được: {read_error}"
+    
+    if record.get('exception'):
+        return 0, f"Lỗi tính điểm: {record['exception']}", False, f"Lỗi xử lý: {record['exception']}"
+    
+    tiers = record.get('tiers', SCORE_TIERS)
+    face_score = record['face_score']
+    quality_score = record['quality_score']
+    width, height = record['width'], record['height']
+    
+    if record.get('size_error'):
+        resolution_score = 0
+    else:
+        resolution_score, _, _ = calculate_resolution_score(width, height, target_resolution)
+    
+    # Tổng điểm
+    total_score = face_score + quality_score + resolution_score
+    
+    # Tier đầu tiên loại ảnh (nếu có)
+    rejection = _tiered_rejection(record, target_resolution)
+    if rejection:
+        is_acceptable = False
+        rejection_reason = f"[tier {rejection[0]}] {rejection[1]}"
+    else:
+        is_acceptable = ('faces' in tiers and total_score >= MIN_ACCEPTABLE_SCORE)
+        rejection_reason = "Đạt tiêu chuẩn" if is_acceptable else "Chưa chấm đủ các tier"
+    
+    face_part = f"Face:{face_score}({record['face_detail']})" if 'faces' in tiers else "Face:-(bỏ qua)"
+    quality_part = f"Quality:{quality_score:.1f}({record['quality_detail']})" if 'quality' in tiers else "Quality:-(bỏ qua)"
+    detail = f"{face_part} {quality_part} Res:{resolution_score}({width}x{height})"
+    
+    return total_score, detail, is_acceptable, rejection_reason
+
 def calculate_total_image_score(image_path):
     """
     Tính tổng điểm ảnh từ tất cả tiêu chí
@@ -901,41 +1426,417 @@ def calculate_total_image_score(image_path):
         tuple: (tổng_điểm, chi_tiết, is_acceptable, rejection_reason)
     """
     try:
-        # Kiểm tra file có đọc được không
-        can_read, read_error = check_file_readable(image_path)
-        if not can_read:
-            return 0, f"File error: {read_error}", False, f"File không đọc được: {read_error}"
-        
-        # 1. Điểm khuôn mặt (0-40 điểm)
-        num_faces, face_score, face_detail = detect_faces_and_score(image_path)
-        
-        # 2. Điểm chất lượng (0-50 điểm)
-        quality_score, quality_detail = calculate_image_quality_score(image_path)
-        
-        # 3. Điểm độ phân giải (0-10 điểm)
-        resolution_score, width, height, resolution_ok, resolution_reason = get_image_resolution_score(image_path)
+        return finalize_image_score(measure_image_scores(image_path, RESOLUTION))
+    except Exception as e:
+        return 0, f"Lỗi tính điểm: {str(e)}", False, f"Lỗi xử lý: {str(e)}"
+
+def calculate_total_image_score_cached(image_path, score_cache=None):
+    """
+    Như calculate_total_image_score nhưng tra score cache trước (không decode ảnh nếu cache hit)
+    
+    Returns:
+        tuple: (tổng_điểm, chi_tiết, is_acceptable, rejection_reason, from_cache)
+    """
+    try:
+        record = score_cache.get(image_path, SCORER_VERSION) if score_cache else None
+        from_cache = is_score_record_usable(record, RESOLUTION)
         
-        # Tổng điểm
-        total_score = face_score + quality_score + resolution_score
+        if not from_cache:
+            record = measure_image_scores(image_path, RESOLUTION)
+            # Không cache lỗi đọc file (có thể chỉ là lỗi tạm thời)
+            if score_cache and not record.get('error'):
+                score_cache.put(image_path, SCORER_VERSION, record)
         
-        # Kiểm tra tiêu chí loại ảnh và tạo lý do chi tiết
-        rejection_reasons = []
+        return finalize_image_score(record) + (from_cache,)
+    except Exception as e:
+        return 0, f"Lỗi tính điểm: {str(e)}", False, f"Lỗi xử lý: {str(e)}", False
+
+# ================= PARALLEL BATCH SCORING =================
+SCORING_WORKERS = os.cpu_count() or 1     # Số process chấm điểm song song (theo số core của máy)
+SCORING_BACKUP_POOL_RATIO = 0.5           # Chấm trước số ảnh backup = 50% số ảnh sơ bộ
+SCORING_MIN_BACKUP_POOL = 4               # Tối thiểu 4 ảnh backup được chấm trước
+SCORING_DEADLINE_ROUND = 2                # Khi có deadline: mỗi đợt đo ~2 ảnh / worker rồi kiểm tra giờ
+NEAR_DUPLICATE_MAX_DISTANCE = 6          # Khoảng cách Hamming dHash tối đa (/64 bit) để coi 2 ảnh là gần trùng
+MATERIAL_SCORING_DEADLINE = 60            # Ngân sách (giây) cho AI chấm điểm khi chọn nguyên liệu (None = không giới hạn)
+
+_scoring_pool = None
+_scoring_pool_lock = threading.Lock()
+
+def _init_scoring_worker():
+    """Khởi tạo worker process: warm detector 1 lần cho cả vòng đời worker"""
+    warm_up_face_detectors()
+
+def get_scoring_pool():
+    """
+    Process pool dùng chung cho AI scoring (tạo 1 lần, dùng lại giữa các lần render)
+    Dùng 'spawn' để an toàn khi gọi từ thread của gunicorn
+    """
+    global _scoring_pool
+    with _scoring_pool_lock:
+        if _scoring_pool is None:
+            _scoring_pool = ProcessPoolExecutor(
+                max_workers=SCORING_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_scoring_worker
+            )
+        return _scoring_pool
+
+def _reset_scoring_pool():
+    """Huỷ pool bị hỏng (BrokenProcessPool) để lần sau tạo lại"""
+    global _scoring_pool
+    with _scoring_pool_lock:
+        if _scoring_pool is not None:
+            try:
+                _scoring_pool.shutdown(wait=False)
+            except Exception:
+                pass
+            _scoring_pool = None
+
+def _measure_image_batch_worker(image_paths, target_resolution=None):
+    """Chạy trong worker process: đo điểm 1 batch ảnh, không bao giờ raise"""
+    try:
+        return measure_image_scores_batch(image_paths, target_resolution)
+    except Exception:
+        # Batch lỗi → đo lại từng ảnh để chỉ ảnh hỏng bị đánh dấu exception
+        records = {}
+        for image_path in image_paths:
+            try:
+                records[image_path] = measure_image_scores(image_path, target_resolution)
+            except Exception as e:
+                records[image_path] = {'exception': str(e)}
+        return records
+
+def _split_scoring_batches(image_paths):
+    """Chia ảnh thành các batch ≤ SCORING_BATCH_SIZE, đủ nhiều để mọi worker đều có việc"""
+    batch_size = max(1, min(SCORING_BATCH_SIZE, -(-len(image_paths) // max(1, SCORING_WORKERS))))
+    return [image_paths[i:i + batch_size] for i in range(0, len(image_paths), batch_size)]
+
+def _measure_images_parallel(image_paths, target_resolution=None):
+    """
+    Đo điểm nhiều ảnh song song trong process pool, mỗi task là 1 batch ảnh
+    (fallback tuần tự nếu pool lỗi)
+    
+    Args:
+        target_resolution: truyền tường minh vì worker process không thấy RESOLUTION của process chính
+    """
+    image_paths = list(image_paths)
+    batches = _split_scoring_batches(image_paths)
+    
+    def measure_serial():
+        records = {}
+        for batch in batches:
+            records.update(_measure_image_batch_worker(batch, target_resolution))
+        return records
+    
+    if len(batches) <= 1 or SCORING_WORKERS <= 1:
+        return measure_serial()
+    
+    try:
+        pool = get_scoring_pool()
+        records = {}
+        for batch_records in pool.map(_measure_image_batch_worker, batches,
+                                      [target_resolution] * len(batches)):
+            records.update(batch_records)
+        return records
+    except Exception as e:
+        log(f"⚠️ Process pool lỗi ({str(e)}), chấm điểm tuần tự")
+        _reset_scoring_pool()
+        return measure_serial()
+
+def _score_images_cheap(image_paths):
+    """
+    Điểm "rẻ" khi hết thời gian chấm: chỉ chạy tier header (không decode ảnh)
+    Ảnh không bị tier header loại được tạm chấp nhận
+    
+    Returns:
+        dict: {image_path: (tổng_điểm, chi_tiết, is_acceptable, rejection_reason, from_cache)}
+    """
+    results = {}
+    for image_path, record in measure_image_scores_batch(image_paths, RESOLUTION, max_tier='header').items():
+        total_score, detail, _, rejection_reason = finalize_image_score(record)
+        if not record.get('error') and not _tiered_rejection(record, RESOLUTION):
+            results[image_path] = (total_score, detail, True, "[deadline] Hết thời gian chấm, chấp nhận theo header", False)
+        else:
+            results[image_path] = (total_score, detail, False, rejection_reason, False)
+    return results
+
+def score_images_batch(image_paths, score_cache=None, deadline_at=None, duplicates=None):
+    """
+    Chấm điểm nhiều ảnh cùng lúc: ảnh đã có trong cache lấy ngay,
+    ảnh chưa có được đo song song trong process pool
+    
+    Args:
+        deadline_at: mốc time.time() hết ngân sách chấm điểm (None = không giới hạn).
+                     Ảnh được đo theo thứ tự ưu tiên của image_paths, từng đợt nhỏ;
+                     hết giờ thì ảnh còn lại chỉ nhận điểm rẻ (tier header)
+        duplicates: dict {ảnh_đại_diện: [ảnh gần trùng, ...]} - điểm đo được của ảnh đại diện
+                    được lưu luôn cho các ảnh gần trùng (không chấm lại)
+    
+    Returns:
+        dict: {image_path: (tổng_điểm, chi_tiết, is_acceptable, rejection_reason, from_cache)}
+    """
+    records = {}
+    to_measure = []
+    
+    for image_path in dict.fromkeys(image_paths):
+        record = score_cache.get(image_path, SCORER_VERSION) if score_cache else None
+        if is_score_record_usable(record, RESOLUTION):
+            records[image_path] = (record, True)
+        else:
+            to_measure.append(image_path)
+    
+    cheap_results = {}
+    if to_measure:
+        batch_start = time.time()
+        
+        # Có deadline: đo từng đợt (mỗi worker ~SCORING_DEADLINE_ROUND ảnh) để kiểm tra giờ giữa các đợt
+        round_size = SCORING_WORKERS * SCORING_DEADLINE_ROUND if deadline_at is not None else len(to_measure)
+        measured = {}
+        measured_count = 0
+        while measured_count < len(to_measure):
+            if deadline_at is not None and time.time() >= deadline_at:
+                break
+            measured.update(_measure_images_parallel(to_measure[measured_count:measured_count + round_size], RESOLUTION))
+            measured_count += round_size
+        
+        log(f"⚡ Chấm song song {len(measured)} ảnh trong {time.time() - batch_start:.1f}s "
+            f"({min(SCORING_WORKERS, max(1, len(measured)))} workers)")
+        
+        # Số pass Haar thực chạy so với chế độ chạy đủ (CPU tiết kiệm nhờ adaptive detection)
+        face_records = [r for r in measured.values() if 'face_passes' in r]
+        if face_records:
+            haar_run = sum(1 for r in face_records for p in r['face_passes'] if p.startswith('haar'))
+            haar_full = len(face_records) * len(HAAR_CASCADE_FILES) * 2
+            log(f"🧠 Haar passes: {haar_run}/{haar_full} ({haar_full - haar_run} pass tiết kiệm)")
+        
+        for image_path, record in measured.items():
+            if score_cache and not record.get('error') and not record.get('exception'):
+                score_cache.put(image_path, SCORER_VERSION, record)
+                for duplicate_path in (duplicates or {}).get(image_path, []):
+                    if not is_score_record_usable(score_cache.get(duplicate_path, SCORER_VERSION), RESOLUTION):
+                        score_cache.put(duplicate_path, SCORER_VERSION, dict(record, duplicate_of=os.path.basename(image_path)))
+            records[image_path] = (record, False)
+        
+        remaining = to_measure[measured_count:]
+        if remaining:
+            log(f"⏰ Hết thời gian chấm điểm, {len(remaining)} ảnh dùng điểm rẻ (tier header)")
+            cheap_results = _score_images_cheap(remaining)
+    
+    # Face boxes đã đo → store phân tích của lần render (collage / crop không detect lại)
+    for image_path, (record, _) in records.items():
+        remember_face_analysis(image_path, record)
+    
+    # Điểm độ phân giải tính ở process chính theo RESOLUTION hiện tại
+    results = {path: finalize_image_score(record) + (from_cache,) for path, (record, from_cache) in records.items()}
+    results.update(cheap_results)
+    return results
+
+# ================= BACKGROUND SCORING (UPLOAD TIME) =================
+# Ảnh mới upload được đưa vào hàng đợi, 1 thread nền tạo bản thu nhỏ, gom thành batch và chấm
+# trong process pool, lưu vào score index của user → lúc render chỉ còn đọc điểm đã tính sẵn
+BACKGROUND_SCORING_BATCH = 16             # Số ảnh tối đa gom vào 1 batch nền
+
+_background_queue = queue.Queue()
+_background_thread = None
+_background_thread_lock = threading.Lock()
+_background_pending = set()               # Ảnh đang chờ trong hàng đợi (tránh enqueue trùng khi gallery poll)
+
+def _background_scoring_loop():
+    """Thread nền: lấy ảnh từ hàng đợi, chấm theo batch và lưu vào score index của user"""
+    while True:
+        batch = [_background_queue.get()]
+        while len(batch) < BACKGROUND_SCORING_BATCH:
+            try:
+                batch.append(_background_queue.get_nowait())
+            except queue.Empty:
+                break
         
-        if total_score < 40:
-            rejection_reasons.append(f"Điểm thấp {total_score:.1f}/40")
+        pending = []
+        try:
+            # Bỏ qua ảnh đã có điểm (vd: upload lại cùng 1 file)
+            for image_path, library_folder in batch:
+                score_cache = get_score_cache(library_folder)
+                if not os.path.exists(image_path):
+                    continue
+                # Bản thu nhỏ 360/720/1280 (xoay theo EXIF) - tạo trước để chấm điểm cũng dùng được
+                try:
+                    generate_derivatives(image_path)
+                except Exception as e:
+                    log(f"⚠️ Không tạo được bản thu nhỏ {os.path.basename(image_path)}: {str(e)}")
+                # Hash nội dung + dHash cho index ảnh gần trùng (tính ở đây để request tra điểm không phải hash file)
+                score_cache.get_perceptual_hash(image_path)
+                # Lúc upload chưa biết độ phân giải đích → chạy đủ mọi tier
+                if not is_score_record_complete(score_cache.get(image_path, SCORER_VERSION)):
+                    pending.append((image_path, score_cache))
+                else:
+                    score_cache.save()
             
-        if not resolution_ok:
-            rejection_reasons.append(resolution_reason)
-        
-        is_acceptable = (total_score >= 40 and resolution_ok)
-        rejection_reason = "; ".join(rejection_reasons) if rejection_reasons else "Đạt tiêu chuẩn"
-        
-        detail = f"Face:{face_score}({face_detail}) Quality:{quality_score:.1f}({quality_detail}) Res:{resolution_score}({width}x{height})"
-        
-        return total_score, detail, is_acceptable, rejection_reason
+            if pending:
+                measured = _measure_images_parallel([image_path for image_path, _ in pending])
+                touched_caches = {}
+                for image_path, score_cache in pending:
+                    record = measured.get(image_path) or {'exception': "Không có kết quả chấm điểm"}
+                    if record.get('error') or record.get('exception'):
+                        # Ghi nhận lỗi → lookup trả 'error' thay vì 'pending' và không enqueue lại tới khi file đổi
+                        score_cache.put_failure(image_path, SCORER_VERSION, record)
+                    else:
+                        score_cache.put(image_path, SCORER_VERSION, record)
+                    touched_caches[id(score_cache)] = score_cache
+                for score_cache in touched_caches.values():
+                    score_cache.save()
+                log(f"🧠 Background scoring: đã chấm {len(pending)} ảnh mới upload")
+        except Exception as e:
+            log(f"⚠️ Background scoring lỗi: {str(e)}")
+            # Lỗi cả batch (vd: pool hỏng): ghi nhận cho các ảnh chưa có kết quả để không bị enqueue lại mãi
+            for image_path, score_cache in pending:
+                if score_cache.get_indexed(image_path, SCORER_VERSION) is None:
+                    score_cache.put_failure(image_path, SCORER_VERSION, {'exception': str(e)})
+                    score_cache.save()
+        finally:
+            with _background_thread_lock:
+                for image_path, _ in batch:
+                    _background_pending.discard(image_path)
+            for _ in batch:
+                _background_queue.task_done()
+
+def enqueue_background_scoring(image_path, library_folder):
+    """
+    Đưa ảnh vừa upload vào hàng đợi chấm điểm nền (không block request)
+    
+    Args:
+        image_path: đường dẫn ảnh đã lưu
+        library_folder: thư mục thư viện của user (nơi chứa score index)
+    
+    Returns:
+        bool: False nếu ảnh đã nằm trong hàng đợi
+    """
+    global _background_thread
+    with _background_thread_lock:
+        if image_path in _background_pending:
+            return False
+        _background_pending.add(image_path)
+        if _background_thread is None or not _background_thread.is_alive():
+            _background_thread = threading.Thread(target=_background_scoring_loop,
+                                                  name='background-scoring', daemon=True)
+            _background_thread.start()
+    _background_queue.put((image_path, library_folder))
+    return True
+
+def lookup_image_scores(image_paths, library_folder, target_resolution=None):
+    """
+    Tra điểm ảnh từ score index (không chạy AI trong thread gọi - dùng cho API gallery)
+    Ảnh chưa có điểm được đưa vào hàng đợi chấm nền và trả về trạng thái 'pending'
+    
+    Args:
+        image_paths: danh sách đường dẫn ảnh trong thư viện
+        library_folder: thư mục thư viện của user (nơi chứa score index)
+        target_resolution: độ phân giải dùng để tính điểm resolution (None = RESOLUTION)
+    
+    Returns:
+        dict: {image_path: {'status': 'scored', 'score', 'acceptable', 'detail', 'reason'}
+                           hoặc {'status': 'error', 'detail', 'reason'} (chấm nền bị lỗi, chưa đổi file)
+                           hoặc {'status': 'pending'}}
+    """
+    score_cache = get_score_cache(library_folder)
+    target_resolution = target_resolution or RESOLUTION
+    results = {}
+    
+    for image_path in image_paths:
+        # Chỉ tra index theo path + size + mtime: hash nội dung file mới / đã đổi do thread nền tính
+        record = score_cache.get_indexed(image_path, SCORER_VERSION)
+        if is_score_record_usable(record, target_resolution):
+            total_score, detail, is_acceptable, rejection_reason = finalize_image_score(record, target_resolution)
+            results[image_path] = {
+                'status': 'scored',
+                'score': round(float(total_score), 1),
+                'acceptable': bool(is_acceptable),
+                'detail': detail,
+                'reason': rejection_reason
+            }
+            continue
         
-    except Exception as e:
-        return 0, f"Lỗi tính điểm: {str(e)}", False, f"Lỗi xử lý: {str(e)}"
+        failure = score_cache.get_failure(image_path, SCORER_VERSION)
+        if failure is not None:
+            _, detail, _, rejection_reason = finalize_image_score(failure, target_resolution)
+            results[image_path] = {'status': 'error', 'detail': detail, 'reason': rejection_reason}
+        else:
+            enqueue_background_scoring(image_path, library_folder)
+            results[image_path] = {'status': 'pending'}
+    
+    return results
+
+# ================= FACE ANALYSIS STORE (PER RENDER) =================
+# Mỗi ảnh chỉ detect khuôn mặt 1 lần trong 1 lần render: kết quả (box chuẩn hoá 0-1)
+# dùng chung cho chấm điểm, priority của collage và tâm smart crop
+# Thư viện của lần render được truyền tường minh (worker spawn không thấy INPUT_FOLDER đã đổi của process chính)
+_face_analysis_store = {}
+_face_analysis_lock = threading.Lock()
+_face_analysis_library = None  # Thư mục thư viện để tra score index (None = không tra, detect trực tiếp)
+
+def reset_face_analysis_store(library_folder=None):
+    """Xoá kết quả phân tích của lần render trước (gọi đầu mỗi lần render)
+    Args:
+        library_folder: thư mục thư viện ảnh của lần render (score index để lấy face boxes đã lưu)
+    """
+    global _face_analysis_library
+    with _face_analysis_lock:
+        _face_analysis_store.clear()
+        _face_analysis_library = library_folder
+
+def remember_face_analysis(image_path, record):
+    """Lưu face boxes từ score record (đã chạy tier faces) vào store"""
+    if not record or 'face_boxes' not in record:
+        return
+    with _face_analysis_lock:
+        _face_analysis_store[os.path.abspath(image_path)] = {
+            'faces': [tuple(box) for box in record['face_boxes']],
+            'num_faces': record.get('num_faces', len(record['face_boxes'])),
+            'face_score': record.get('face_score', 0)
+        }
+
+def seed_face_analysis_store(analyses, library_folder=None):
+    """Nạp face analysis có sẵn (vd: truyền từ process chính sang worker) vào store
+    Args:
+        library_folder: thư mục thư viện của lần render (None = giữ nguyên)
+    """
+    global _face_analysis_library
+    with _face_analysis_lock:
+        if library_folder is not None:
+            _face_analysis_library = library_folder
+        for image_path, analysis in (analyses or {}).items():
+            _face_analysis_store[os.path.abspath(image_path)] = analysis
+
+def get_face_analysis(image_path):
+    """
+    Kết quả phân tích khuôn mặt của ảnh: store của lần render → score index → detect 1 lần
+    
+    Returns:
+        dict: {'faces': [(x, y, w, h, confidence), ...] toạ độ chuẩn hoá 0-1, 'num_faces', 'face_score'}
+    """
+    key = os.path.abspath(image_path)
+    with _face_analysis_lock:
+        analysis = _face_analysis_store.get(key)
+    if analysis is not None:
+        return analysis
+    
+    library_folder = _face_analysis_library
+    record = get_score_cache(library_folder).get(image_path, SCORER_VERSION) if library_folder else None
+    if not record or 'face_boxes' not in record:
+        image_context = load_image_context(image_path)
+        num_faces, face_score, _ = detect_faces_and_score(image_path, image_context)
+        record = {'face_boxes': image_context.get('face_boxes', []), 'num_faces': num_faces, 'face_score': face_score}
+    
+    remember_face_analysis(image_path, record)
+    with _face_analysis_lock:
+        return _face_analysis_store[key]
+
+def get_subject_info(image_path, width, height):
+    """Thông tin chủ thể (như detect_main_subject) từ face analysis dùng chung, toạ độ theo width x height"""
+    faces = [
+        (int(x * width), int(y * height), int(w * width), int(h * height))
+        for x, y, w, h, _ in get_face_analysis(image_path)['faces']
+    ]
+    return subject_info_from_faces(faces, width, height)
 
 # =====================================================
 
@@ -1014,10 +1915,38 @@ def generate_preview_thumbnail(video_path, output_dir):
             'message': f'Error generating preview: {str(e)}'
         }
 
+def build_transition_audio(clip1, clip2, sequence, duration):
+    """
+    Âm thanh của clip chuyển cảnh (kernel chỉ dựng hình, tiếng lấy từ 2 clip đầu vào)
+    
+    Args:
+        sequence: True = dip qua đen (clip 1 hết rồi tới clip 2), False = 2 clip chồng nhau
+        duration: thời lượng hiệu ứng (giây)
+    
+    Returns:
+        AudioClip dài bằng clip chuyển cảnh, hoặc None nếu cả 2 clip không có tiếng
+    """
+    total = duration * 2 if sequence else duration
+    if sequence and clip1.audio is not None and clip2.audio is not None:
+        return concatenate_audioclips([clip1.audio.set_duration(duration),
+                                       clip2.audio.set_duration(duration)]).set_duration(total)
+    
+    tracks = []
+    if clip1.audio is not None:
+        tracks.append(clip1.audio.set_start(0))
+    if clip2.audio is not None:
+        tracks.append(clip2.audio.set_start(duration if sequence else 0))
+    if not tracks:
+        return None
+    return CompositeAudioClip(tracks).set_duration(total)
+
 def create_transition(clip1, clip2, transition_type, duration=1.0):
     """
     Tạo hiệu ứng chuyển cảnh giữa 2 clips
     
+    Mỗi frame được tính bằng kernel NumPy uint8 (transition_kernels) trên frame của 2 clip,
+    không dựng CompositeVideoClip / lambda của moviepy.
+    
     Args:
         clip1: Clip đầu tiên
         clip2: Clip thứ hai  
@@ -1025,115 +1954,38 @@ def create_transition(clip1, clip2, transition_type, duration=1.0):
         duration: Thời lượng hiệu ứng (giây)
     
     Returns:
-        Composite clip với hiệu ứng chuyển cảnh
+        VideoClip với hiệu ứng chuyển cảnh (hiệu ứng dạng sequence dài 2 × duration như bản cũ),
+        kèm âm thanh của 2 clip (build_transition_audio)
     """
     w, h = RESOLUTION
+    spec = get_transition(transition_type)
     
-    # ===== HIỆU ỨNG GỐC =====
-    if transition_type == "fade":
-        clip1_fade = clip1.crossfadeout(duration)
-        clip2_fade = clip2.crossfadein(duration)
-        return concatenate_videoclips([clip1_fade, clip2_fade])
+    def read_frame(clip, t):
+        # Frame uint8 RGB đúng kích thước output (kernel cần 2 buffer cùng shape)
+        frame = clip.get_frame(min(max(0.0, t), max(0.0, clip.duration - 1e-3)))
+        if frame.dtype != np.uint8:
+            frame = np.clip(frame, 0, 255).astype(np.uint8)
+        if frame.ndim == 2:
+            frame = np.dstack([frame] * 3)
+        if frame.shape[1] != w or frame.shape[0] != h:
+            frame = cv2.resize(frame[..., :3], (w, h), interpolation=cv2.INTER_AREA)
+        return frame[..., :3]
     
-    elif transition_type == "slide_left":
-        clip2_slide = clip2.set_position(lambda t: (-w + w*t/duration, 0) if t < duration else (0, 0))
-        return CompositeVideoClip([clip1, clip2_slide], size=RESOLUTION)
-        
-    elif transition_type == "slide_right":
-        clip2_slide = clip2.set_position(lambda t: (w - w*t/duration, 0) if t < duration else (0, 0))
-        return CompositeVideoClip([clip1, clip2_slide], size=RESOLUTION)
-        
-    elif transition_type == "slide_up":
-        clip2_slide = clip2.set_position(lambda t: (0, -h + h*t/duration) if t < duration else (0, 0))
-        return CompositeVideoClip([clip1, clip2_slide], size=RESOLUTION)
-        
-    elif transition_type == "slide_down":
-        clip2_slide = clip2.set_position(lambda t: (0, h - h*t/duration) if t < duration else (0, 0))
-        return CompositeVideoClip([clip1, clip2_slide], size=RESOLUTION)
-        
-    elif transition_type == "zoom_in":
-        clip2_zoom = clip2.resize(lambda t: 0.1 + 0.9*t/duration if t < duration else 1.0)
-        clip2_zoom = clip2_zoom.set_position('center')
-        return CompositeVideoClip([clip1, clip2_zoom], size=RESOLUTION)
-        
-    elif transition_type == "zoom_out":
-        clip1_zoom = clip1.resize(lambda t: 1.0 + 2.0*t/duration if t < duration else 3.0)
-        clip1_zoom = clip1_zoom.set_position('center')
-        return CompositeVideoClip([clip1_zoom, clip2], size=RESOLUTION)
-        
-    elif transition_type == "crossfade":
-        clip1_fade = clip1.fadeout(duration)
-        clip2_fade = clip2.fadein(duration)
-        return CompositeVideoClip([clip1_fade, clip2_fade], size=RESOLUTION)
+    if spec['mode'] == 'sequence':
+        # Clip 1 dip về đen rồi clip 2 hiện lên (giữ thời lượng 2 × duration như concatenate cũ)
+        def make_frame(t):
+            if t < duration:
+                return spec['kernel'](read_frame(clip1, t), t / duration, False)
+            return spec['kernel'](read_frame(clip2, t - duration), min(1.0, (t - duration) / duration), True)
+        
+        clip = VideoClip(make_frame, duration=transition_output_duration(transition_type, duration))
+        return clip.set_audio(build_transition_audio(clip1, clip2, True, duration))
     
-    # ===== 20 HIỆU ỨNG MỚI (ƯU TIÊN FADE) =====
-    elif transition_type == "fade_in_out":
-        # Fade in + fade out kết hợp với thời gian dài hơn
-        clip1_fade = clip1.fadeout(duration * 0.7)
-        clip2_fade = clip2.fadein(duration * 0.7)
-        return concatenate_videoclips([clip1_fade, clip2_fade])
-        
-    elif transition_type == "soft_fade":
-        # Fade mềm mại hơn với alpha thấp
-        clip1_soft = clip1.crossfadeout(duration * 1.2)
-        clip2_soft = clip2.crossfadein(duration * 1.2)
-        return concatenate_videoclips([clip1_soft, clip2_soft])
-        
-    elif transition_type == "double_fade":
-        # Fade 2 lớp với opacity khác nhau
-        clip1_fade1 = clip1.fadeout(duration * 0.6)
-        clip1_fade2 = clip1.fadeout(duration * 0.8)
-        clip2_fade = clip2.fadein(duration)
-        return CompositeVideoClip([clip1_fade1, clip1_fade2, clip2_fade], size=RESOLUTION)
-        
-    elif transition_type == "fade_zoom":
-        # Fade + zoom nhẹ
-        clip1_fade = clip1.fadeout(duration).resize(lambda t: 1.0 + 0.1*t/duration)
-        clip2_fade = clip2.fadein(duration).resize(lambda t: 0.9 + 0.1*t/duration)
-        return concatenate_videoclips([clip1_fade, clip2_fade])
-        
-    elif transition_type == "fade_slide":
-        # Fade + slide nhẹ
-        clip1_fade = clip1.fadeout(duration).set_position(lambda t: (-w*0.1*t/duration, 0))
-        clip2_fade = clip2.fadein(duration).set_position(lambda t: (w*0.1*(1-t/duration), 0) if t < duration else (0, 0))
-        return CompositeVideoClip([clip1_fade, clip2_fade], size=RESOLUTION)
-        
-    elif transition_type == "dissolve":
-        # Hòa tan với opacity gradient
-        clip1_dissolve = clip1.set_opacity(lambda t: 1.0 - t/duration if t < duration else 0)
-        clip2_dissolve = clip2.set_opacity(lambda t: t/duration if t < duration else 1)
-        return CompositeVideoClip([clip1_dissolve, clip2_dissolve], size=RESOLUTION)
-        
-    elif transition_type == "soft_dissolve":
-        # Hòa tan mềm với thời gian dài hơn
-        longer_duration = duration * 1.5
-        clip1_soft = clip1.set_opacity(lambda t: 1.0 - t/longer_duration if t < longer_duration else 0)
-        clip2_soft = clip2.set_opacity(lambda t: t/longer_duration if t < longer_duration else 1)
-        return CompositeVideoClip([clip1_soft, clip2_soft], size=RESOLUTION)
-        
-    elif transition_type == "blur_fade":
-        # Fade với blur (giả lập bằng resize)
-        clip1_blur = clip1.fadeout(duration).resize(lambda t: 1.0 - 0.1*t/duration)
-        clip2_blur = clip2.fadein(duration).resize(lambda t: 0.9 + 0.1*t/duration)
-        return concatenate_videoclips([clip1_blur, clip2_blur])
-        
-    elif transition_type == "gentle_slide":
-        # Slide mềm mại với easing
-        clip2_gentle = clip2.set_position(lambda t: (-w * (1 - (t/duration)**2), 0) if t < duration else (0, 0))
-        return CompositeVideoClip([clip1, clip2_gentle], size=RESOLUTION)
-        
-    elif transition_type == "smooth_push":
-        # Push mượt mà với easing
-        clip1_push = clip1.set_position(lambda t: (-w * (t/duration)**2, 0) if t < duration else (-w, 0))
-        clip2_push = clip2.set_position(lambda t: (w * (1 - (t/duration)**2), 0) if t < duration else (0, 0))
-        return CompositeVideoClip([clip1_push, clip2_push], size=RESOLUTION)
-    
-    # ===== FALLBACK CHO CÁC HIỆU ỨNG KHÁC =====
-    else:
-        # Fallback: fade đơn giản cho tất cả hiệu ứng còn lại
-        clip1_fade = clip1.crossfadeout(duration)
-        clip2_fade = clip2.crossfadein(duration)
-        return concatenate_videoclips([clip1_fade, clip2_fade])
+    def make_frame(t):
+        return spec['kernel'](read_frame(clip1, t), read_frame(clip2, t), min(1.0, t / duration))
+    
+    clip = VideoClip(make_frame, duration=duration)
+    return clip.set_audio(build_transition_audio(clip1, clip2, False, duration))
 
 def apply_transitions_to_clips(clips):
     """
@@ -1397,88 +2249,68 @@ def list_music_files():
     
     return music_files
 
-def detect_main_subject(image_path_or_array):
+def detect_main_subject(image_path_or_array, max_side=None):
     """
     AI detect chủ thể chính trong ảnh (faces, people, important objects)
+    Detect trên proxy cạnh dài ≤ max_side rồi quy đổi box về toạ độ ảnh nguồn
+    
+    Args:
+        image_path_or_array: đường dẫn ảnh hoặc mảng BGR
+        max_side: cạnh dài tối đa của proxy detect (None = SUBJECT_DETECTION_MAX_SIDE)
     
     Returns:
-        dict với thông tin vùng quan trọng: {
+        dict với thông tin vùng quan trọng (toạ độ ảnh nguồn): {
             'faces': [(x, y, w, h), ...],
             'main_region': (x, y, w, h),  # Vùng bao quanh tất cả subjects
             'crop_center': (cx, cy)       # Điểm trung tâm tối ưu để crop
         }
     """
+    max_side = max_side or SUBJECT_DETECTION_MAX_SIDE
     try:
-        # Load ảnh
+        # Load ảnh (từ file: decode thẳng ở độ phân giải rút gọn)
         if isinstance(image_path_or_array, str):
-            img = cv2.imread(image_path_or_array)
+            image_context = load_image_context(image_path_or_array, max_side)
+            img = image_context['img']
+            if img is None:
+                return None
+            h, w = (int(round(side * image_context['scale'])) for side in img.shape[:2])
         else:
             img = image_path_or_array
-            
-        if img is None:
-            return None
-            
-        h, w = img.shape[:2]
-        
-        # 1. Face Detection với OpenCV (fallback nếu không có MediaPipe)
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
-        
-        # 2. Nếu có MediaPipe, dùng để detect faces tốt hơn
+            if img is None:
+                return None
+            h, w = img.shape[:2]
+            if max(h, w) > max_side:
+                proxy_scale = max_side / max(h, w)
+                img = cv2.resize(img, (max(1, int(w * proxy_scale)), max(1, int(h * proxy_scale))),
+                                 interpolation=cv2.INTER_AREA)
+        
+        # Hệ số quy đổi toạ độ proxy → ảnh nguồn
+        proxy_h, proxy_w = img.shape[:2]
+        scale_x, scale_y = w / proxy_w, h / proxy_h
+        
+        # 1. Nếu có MediaPipe, dùng để detect faces tốt hơn (box tương đối → toạ độ nguồn)
         detected_faces = []
         try:
-            import mediapipe as mp
-            mp_face_detection = mp.solutions.face_detection
-            
-            with mp_face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.5) as face_detection:
-                rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                results = face_detection.process(rgb_img)
-                
-                if results.detections:
-                    for detection in results.detections:
-                        bbox = detection.location_data.relative_bounding_box
-                        x = int(bbox.xmin * w)
-                        y = int(bbox.ymin * h)
-                        face_w = int(bbox.width * w)
-                        face_h = int(bbox.height * h)
-                        detected_faces.append((x, y, face_w, face_h))
+            rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            for detection in run_mediapipe_face_detection(rgb_img, 1, 0.5):
+                bbox = detection.location_data.relative_bounding_box
+                x = int(bbox.xmin * w)
+                y = int(bbox.ymin * h)
+                face_w = int(bbox.width * w)
+                face_h = int(bbox.height * h)
+                detected_faces.append((x, y, face_w, face_h))
         except:
-            # Fallback to OpenCV faces nếu MediaPipe không có
-            detected_faces = [(x, y, w, h) for (x, y, w, h) in faces]
+            # 2. Fallback to OpenCV faces nếu MediaPipe không có
+            face_cascade = get_haar_cascade('haar_default')
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            faces = face_cascade.detectMultiScale(gray, 1.1, 4) if face_cascade is not None else []
+            detected_faces = [
+                (int(fx * scale_x), int(fy * scale_y), int(fw * scale_x), int(fh * scale_y))
+                for (fx, fy, fw, fh) in faces
+            ]
         
         # 3. Tính vùng quan trọng
-        if detected_faces:
-            # Có faces - tính bounding box bao quanh tất cả faces
-            min_x = min([x for x, y, w, h in detected_faces])
-            min_y = min([y for x, y, w, h in detected_faces])
-            max_x = max([x + w for x, y, w, h in detected_faces])
-            max_y = max([y + h for x, y, w, h in detected_faces])
-            
-            # Mở rộng vùng một chút để không crop quá sát
-            margin_x = int((max_x - min_x) * 0.3)
-            margin_y = int((max_y - min_y) * 0.3)
-            
-            main_x = max(0, min_x - margin_x)
-            main_y = max(0, min_y - margin_y)
-            main_w = min(w - main_x, max_x - min_x + 2 * margin_x)
-            main_h = min(h - main_y, max_y - min_y + 2 * margin_y)
-            
-            crop_center_x = main_x + main_w // 2
-            crop_center_y = main_y + main_h // 2
-            
-        else:
-            # Không có faces - dùng center crop
-            main_x, main_y = 0, 0
-            main_w, main_h = w, h
-            crop_center_x, crop_center_y = w // 2, h // 2
-        
-        return {
-            'faces': detected_faces,
-            'main_region': (main_x, main_y, main_w, main_h),
-            'crop_center': (crop_center_x, crop_center_y),
-            'image_size': (w, h)
-        }
+        return subject_info_from_faces(detected_faces, w, h)
         
     except Exception as e:
         # Fallback: center crop
@@ -1489,6 +2321,67 @@ def detect_main_subject(image_path_or_array):
             'image_size': (w if 'w' in locals() else 100, h if 'h' in locals() else 100)
         }
 
+def subject_info_from_faces(detected_faces, w, h):
+    """
+    Tính vùng quan trọng và tâm crop từ danh sách khuôn mặt
+    
+    Args:
+        detected_faces: [(x, y, w, h), ...] theo toạ độ ảnh w x h
+    
+    Returns:
+        dict như detect_main_subject
+    """
+    if detected_faces:
+        # Có faces - tính bounding box bao quanh tất cả faces
+        min_x = min([x for x, y, w, h in detected_faces])
+        min_y = min([y for x, y, w, h in detected_faces])
+        max_x = max([x + w for x, y, w, h in detected_faces])
+        max_y = max([y + h for x, y, w, h in detected_faces])
+        
+        # Mở rộng vùng một chút để không crop quá sát
+        margin_x = int((max_x - min_x) * 0.3)
+        margin_y = int((max_y - min_y) * 0.3)
+        
+        main_x = max(0, min_x - margin_x)
+        main_y = max(0, min_y - margin_y)
+        main_w = min(w - main_x, max_x - min_x + 2 * margin_x)
+        main_h = min(h - main_y, max_y - min_y + 2 * margin_y)
+        
+        crop_center_x = main_x + main_w // 2
+        crop_center_y = main_y + main_h // 2
+        
+    else:
+        # Không có faces - dùng center crop
+        main_x, main_y = 0, 0
+        main_w, main_h = w, h
+        crop_center_x, crop_center_y = w // 2, h // 2
+    
+    return {
+        'faces': detected_faces,
+        'main_region': (main_x, main_y, main_w, main_h),
+        'crop_center': (crop_center_x, crop_center_y),
+        'image_size': (w, h)
+    }
+
+EXIF_ORIENTATION_TAG = 0x0112           # Tag EXIF Orientation
+EXIF_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)  # Các orientation xoay 90° → đổi chiều rộng/cao
+
+def probe_image_dimensions(image_path):
+    """
+    Kích thước ảnh sau khi xoay theo EXIF, chỉ đọc header (không decode pixel)
+    
+    Returns:
+        tuple: (w, h) hoặc None nếu không đọc được
+    """
+    try:
+        with Image.open(image_path) as img:
+            w, h = img.size
+            if img.getexif().get(EXIF_ORIENTATION_TAG) in EXIF_TRANSPOSED_ORIENTATIONS:
+                w, h = h, w
+        return w, h
+    except Exception:
+        return None
+
 def analyze_image_for_collage(image_path):
     """
     Phân tích ảnh để đưa ra crop strategy phù hợp cho collage
@@ -1500,16 +2393,18 @@ def analyze_image_for_collage(image_path):
             'is_landscape': bool,
             'recommended_position': str,  # 'main', 'side', 'any'
             'crop_strategy': str,         # 'center', 'left_bias', 'right_bias'
-            'priority_score': float       # Điểm ưu tiên cho main position
+            'priority_score': float,      # Điểm ưu tiên cho main position
+            'dimensions': (w, h),         # Kích thước sau khi xoay theo EXIF
+            'faces': list                 # Face boxes chuẩn hoá (x, y, w, h, conf)
         }
     """
     try:
-        # Get image dimensions
-        img = cv2.imread(image_path)
-        if img is None:
+        # Get image dimensions (header probe, không decode ảnh)
+        dimensions = probe_image_dimensions(image_path)
+        if dimensions is None:
             return None
             
-        h, w = img.shape[:2]
+        w, h = dimensions
         aspect_ratio = w / h
         
         # Analyze image characteristics
@@ -1525,15 +2420,12 @@ def analyze_image_for_collage(image_path):
         elif is_square:
             priority_score += 0.1  # Square cũng ok cho main
         
-        # Face detection bonus (nếu có face thì ưu tiên main)
+        # Face detection bonus (nếu có face thì ưu tiên main) - dùng face analysis chung, không detect lại
+        faces = []
         try:
-            rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            mp_face_detection = mp.solutions.face_detection
-            
-            with mp_face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.3) as face_detection:
-                results = face_detection.process(rgb_img)
-                if results.detections and len(results.detections) > 0:
-                    priority_score += 0.2  # Có face = ưu tiên main
+            faces = get_face_analysis(image_path)['faces']
+            if faces:
+                priority_score += 0.2  # Có face = ưu tiên main
                     
         except Exception:
             pass  # Ignore face detection errors
@@ -1562,14 +2454,16 @@ def analyze_image_for_collage(image_path):
             'recommended_position': recommended_position,
             'crop_strategy': crop_strategy,
             'priority_score': priority_score,
-            'dimensions': (w, h)
+            'dimensions': (w, h),
+            'faces': faces                # Box chuẩn hoá 0-1 từ face analysis chung
         }
         
     except Exception as e:
         log(f"    ⚠️ Lỗi analyze image {image_path}: {str(e)}")
         return None
 
-def smart_resize_image_enhanced(img_clip, target_resolution=(1920, 1080), fill_mode='smart_crop', position_hint=None):
+def smart_resize_image_enhanced(img_clip, target_resolution=(1920, 1080), fill_mode='smart_crop', position_hint=None,
+                                source_path=None):
     """
     Enhanced smart resize với position-aware cropping
     
@@ -1578,6 +2472,7 @@ def smart_resize_image_enhanced(img_clip, target_resolution=(1920, 1080), fill_m
         target_resolution: tuple (width, height)
         fill_mode: 'smart_crop', 'center', 'left_bias', 'right_bias'
         position_hint: 'main', 'side' - hint về vị trí trong collage
+        source_path: đường dẫn ảnh gốc → dùng face analysis chung thay vì detect lại trên frame
     """
     target_w, target_h = target_resolution
     img_w, img_h = img_clip.w, img_clip.h
@@ -1585,84 +2480,84 @@ def smart_resize_image_enhanced(img_clip, target_resolution=(1920, 1080), fill_m
     if fill_mode == 'smart_crop':
         # Enhanced smart cropping với position awareness
         try:
-            temp_array = img_clip.get_frame(0)
-            bgr_array = cv2.cvtColor(temp_array, cv2.COLOR_RGB2BGR)
-            
-            # Detect subjects
-            subject_info = detect_main_subject(bgr_array)
-            
-            if subject_info and subject_info['crop_center']:
-                cx, cy = subject_info['crop_center']
-                
-                # Apply position-aware bias cho landscape images
-                if img_w > img_h * 1.3:  # Landscape image
-                    if position_hint == 'side' and len(subject_info['faces']) > 1:
-                        # Side position với nhiều faces → bias để tránh cắt qua subjects
-                        faces = subject_info['faces']
-                        if len(faces) >= 2:
-                            # Chọn face phù hợp với target aspect ratio
-                            target_aspect = target_w / target_h
-                            
-                            if target_aspect < 0.8:  # Target is tall (side position)
-                                # Chọn face ở edge để tránh cắt qua giữa
-                                leftmost = min(faces, key=lambda f: f[0] + f[2]/2)
-                                rightmost = max(faces, key=lambda f: f[0] + f[2]/2)
-                                
-                                left_center = leftmost[0] + leftmost[2]/2
-                                right_center = rightmost[0] + rightmost[2]/2
-                                
-                                # Chọn bias strategy dựa trên target position
-                                if right_center - left_center > img_w * 0.3:  # Faces cách xa nhau
-                                    # Bias về left nếu có space
-                                    if left_center > img_w * 0.3:
-                                        cx = left_center
-                                        log(f"    🎯 Applied LEFT bias for side position")
-                                    else:
-                                        cx = right_center  
-                                        log(f"    🎯 Applied RIGHT bias for side position")
-                
-                crop_coords = smart_crop_calculation(img_w, img_h, target_w, target_h, (cx, cy))
-                x1, y1, x2, y2 = crop_coords
-                
-                scale_w = target_w / img_w
-                scale_h = target_h / img_h
-                scale = max(scale_w, scale_h)
-                
-                resized_img = img_clip.resize(scale)
-                final_clip = resized_img.crop(x1=x1*scale, y1=y1*scale, x2=x2*scale, y2=y2*scale)
-                
-                return final_clip
-                
+            if source_path:
+                # Face analysis đã có từ lúc chấm điểm (box chuẩn hoá → toạ độ clip)
+                subject_info = get_subject_info(source_path, img_w, img_h)
             else:
-                # Fallback to smart bias for landscape without detected subjects
-                if img_w > img_h * 1.3:  # Landscape
-                    if position_hint == 'side':
-                        # Side position → left bias thường tốt hơn
-                        cx = img_w // 3
-                        log(f"    🎯 Applied LEFT bias fallback for landscape in side position")
-                    else:
-                        cx = img_w // 2  # Center for main position
-                else:
-                    cx = img_w // 2
-                    
-                cy = img_h // 2
-                crop_coords = smart_crop_calculation(img_w, img_h, target_w, target_h, (cx, cy))
-                x1, y1, x2, y2 = crop_coords
-                
-                scale_w = target_w / img_w
-                scale_h = target_h / img_h
-                scale = max(scale_w, scale_h)
+                temp_array = img_clip.get_frame(0)
+                bgr_array = cv2.cvtColor(temp_array, cv2.COLOR_RGB2BGR)
                 
-                resized_img = img_clip.resize(scale)
-                final_clip = resized_img.crop(x1=x1*scale, y1=y1*scale, x2=x2*scale, y2=y2*scale)
-                
-                return final_clip
+                # Detect subjects
+                subject_info = detect_main_subject(bgr_array)
+            
+            crop_center = smart_crop_centre(img_w, img_h, target_w, target_h, subject_info, position_hint)
+            crop_coords = smart_crop_calculation(img_w, img_h, target_w, target_h, crop_center)
+            
+            # Resize + crop 1 lần thành frame cuối (không tính lại mỗi frame)
+            return rasterize_image_clip(img_clip, target_resolution, crop_coords)
                 
         except Exception as e:
             log(f"    ❌ Enhanced smart crop error: {str(e)}, fallback to center")
             
     # Fallback to original smart_resize_image
-    return smart_resize_image(img_clip, target_resolution, 'smart_crop')
+    return smart_resize_image(img_clip, target_resolution, 'smart_crop', source_path=source_path)
+
+def smart_crop_centre(img_w, img_h, target_w, target_h, subject_info, position_hint=None):
+    """
+    Tâm crop có xét vị trí ô trong collage (bias trái/phải cho ảnh ngang ở ô 'side')
+    
+    Args:
+        img_w, img_h: kích thước ảnh nguồn
+        target_w, target_h: kích thước ô đích
+        subject_info: kết quả detect_main_subject / get_subject_info (hoặc None)
+        position_hint: 'main', 'side', 'any' - hint về vị trí trong collage
+    
+    Returns:
+        (cx, cy) theo toạ độ ảnh nguồn
+    """
+    if subject_info and subject_info['crop_center']:
+        cx, cy = subject_info['crop_center']
+        
+        # Apply position-aware bias cho landscape images
+        if img_w > img_h * 1.3:  # Landscape image
+            if position_hint == 'side' and len(subject_info['faces']) > 1:
+                # Side position với nhiều faces → bias để tránh cắt qua subjects
+                faces = subject_info['faces']
+                if len(faces) >= 2:
+                    # Chọn face phù hợp với target aspect ratio
+                    target_aspect = target_w / target_h
+                    
+                    if target_aspect < 0.8:  # Target is tall (side position)
+                        # Chọn face ở edge để tránh cắt qua giữa
+                        leftmost = min(faces, key=lambda f: f[0] + f[2]/2)
+                        rightmost = max(faces, key=lambda f: f[0] + f[2]/2)
+                        
+                        left_center = leftmost[0] + leftmost[2]/2
+                        right_center = rightmost[0] + rightmost[2]/2
+                        
+                        # Chọn bias strategy dựa trên target position
+                        if right_center - left_center > img_w * 0.3:  # Faces cách xa nhau
+                            # Bias về left nếu có space
+                            if left_center > img_w * 0.3:
+                                cx = left_center
+                                log(f"    🎯 Applied LEFT bias for side position")
+                            else:
+                                cx = right_center  
+                                log(f"    🎯 Applied RIGHT bias for side position")
+        return (cx, cy)
+    
+    # Fallback to smart bias for landscape without detected subjects
+    if img_w > img_h * 1.3:  # Landscape
+        if position_hint == 'side':
+            # Side position → left bias thường tốt hơn
+            cx = img_w // 3
+            log(f"    🎯 Applied LEFT bias fallback for landscape in side position")
+        else:
+            cx = img_w // 2  # Center for main position
+    else:
+        cx = img_w // 2
+    
+    return (cx, img_h // 2)
 
 def smart_crop_calculation(source_w, source_h, target_w, target_h, crop_center=None):
     """
@@ -1706,7 +2601,48 @@ def smart_crop_calculation(source_w, source_h, target_w, target_h, crop_center=N
     
     return (x1, y1, x2, y2)
 
-def smart_resize_image(img_clip, target_resolution=(1920, 1080), fill_mode='smart_crop'):
+def rasterize_image_clip(img_clip, target_resolution, crop_box=None, placement=None):
+    """
+    Resize + crop ảnh tĩnh 1 lần thành frame uint8 đúng kích thước đích, bọc lại thành ImageClip
+    (moviepy resize/crop trên ImageClip bị tính lại cho mỗi frame output)
+    
+    Args:
+        img_clip: ImageClip gốc
+        target_resolution: (w, h) của frame kết quả
+        crop_box: (x1, y1, x2, y2) vùng lấy từ ảnh gốc (None = cả ảnh)
+        placement: (x, y, w, h) đặt ảnh vào vùng này trên nền đen (None = phủ kín frame)
+    
+    Returns:
+        ImageClip kích thước target_resolution
+    """
+    target_w, target_h = target_resolution
+    place_x, place_y, place_w, place_h = placement or (0, 0, target_w, target_h)
+    
+    def resolve(frame, dtype):
+        if crop_box is not None:
+            x1, y1, x2, y2 = crop_box
+            frame = frame[max(0, int(y1)):int(np.ceil(y2)), max(0, int(x1)):int(np.ceil(x2))]
+        interpolation = cv2.INTER_AREA if frame.shape[1] > place_w else cv2.INTER_CUBIC
+        resized = cv2.resize(frame, (place_w, place_h), interpolation=interpolation)
+        if placement is None:
+            return resized.astype(dtype, copy=False)
+        canvas = np.zeros((target_h, target_w) + resized.shape[2:], dtype=dtype)
+        canvas[place_y:place_y + place_h, place_x:place_x + place_w] = resized
+        return canvas
+    
+    frame = img_clip.get_frame(0)
+    raster = ImageClip(resolve(np.clip(frame, 0, 255) if frame.dtype != np.uint8 else frame, np.uint8))
+    
+    # Giữ mask (ảnh PNG trong suốt)
+    if getattr(img_clip, 'mask', None) is not None:
+        mask_frame = img_clip.mask.get_frame(0).astype(np.float32)
+        raster = raster.set_mask(ImageClip(resolve(mask_frame, np.float32), ismask=True))
+    
+    if img_clip.duration is not None:
+        raster = raster.set_duration(img_clip.duration)
+    return raster
+
+def smart_resize_image(img_clip, target_resolution=(1920, 1080), fill_mode='smart_crop', source_path=None):
     """
     Resize ảnh thông minh với AI-powered cropping
     
@@ -1714,6 +2650,7 @@ def smart_resize_image(img_clip, target_resolution=(1920, 1080), fill_mode='smar
         img_clip: ImageClip object
         target_resolution: tuple (width, height) - resolution đích
         fill_mode: 'letterbox', 'crop', 'stretch', 'smart_crop' (AI-powered)
+        source_path: đường dẫn ảnh gốc → dùng face analysis chung thay vì detect lại trên frame
     
     Returns:
         ImageClip đã được resize
@@ -1724,34 +2661,27 @@ def smart_resize_image(img_clip, target_resolution=(1920, 1080), fill_mode='smar
     if fill_mode == 'smart_crop':
         # AI Smart Cropping
         try:
-            # Lấy frame đầu tiên của ImageClip để analyze
-            temp_array = img_clip.get_frame(0)  # RGB array
-            
-            # Convert RGB to BGR cho OpenCV
-            bgr_array = cv2.cvtColor(temp_array, cv2.COLOR_RGB2BGR)
-            
-            # Detect chủ thể chính
-            subject_info = detect_main_subject(bgr_array)
+            if source_path:
+                # Face analysis đã có từ lúc chấm điểm (box chuẩn hoá → toạ độ clip)
+                subject_info = get_subject_info(source_path, img_w, img_h)
+            else:
+                # Lấy frame đầu tiên của ImageClip để analyze
+                temp_array = img_clip.get_frame(0)  # RGB array
+                
+                # Convert RGB to BGR cho OpenCV
+                bgr_array = cv2.cvtColor(temp_array, cv2.COLOR_RGB2BGR)
+                
+                # Detect chủ thể chính
+                subject_info = detect_main_subject(bgr_array)
             
             if subject_info and subject_info['crop_center']:
                 # Có detect được subject - crop thông minh
                 cx, cy = subject_info['crop_center']
                 crop_coords = smart_crop_calculation(img_w, img_h, target_w, target_h, (cx, cy))
-                x1, y1, x2, y2 = crop_coords
-                
-                # Scale để fill đầy target resolution
-                scale_w = target_w / img_w
-                scale_h = target_h / img_h
-                scale = max(scale_w, scale_h)
-                
-                # Resize trước
-                resized_img = img_clip.resize(scale)
+                x1, y1, x2, y2 = crop_coords
                 
-                # Sau đó crop
-                final_clip = resized_img.crop(
-                    x1=x1*scale, y1=y1*scale, 
-                    x2=x2*scale, y2=y2*scale
-                )
+                # Resize + crop 1 lần thành frame cuối (không tính lại mỗi frame)
+                final_clip = rasterize_image_clip(img_clip, target_resolution, (x1, y1, x2, y2))
                 
                 log(f"    🎯 Smart crop: detected {len(subject_info['faces'])} faces, center=({cx},{cy})")
                 return final_clip
@@ -1775,16 +2705,11 @@ def smart_resize_image(img_clip, target_resolution=(1920, 1080), fill_mode='smar
         # Resize ảnh
         new_w = int(img_w * scale)
         new_h = int(img_h * scale)
-        resized_img = img_clip.resize((new_w, new_h))
-        
-        # Tạo nền đen và đặt ảnh vào giữa
-        black_bg = ColorClip(size=target_resolution, color=(0, 0, 0))
-        final_clip = CompositeVideoClip([
-            black_bg,
-            resized_img.set_position('center')
-        ], size=target_resolution)
         
-        return final_clip
+        # Đặt ảnh vào giữa nền đen ngay trên frame (không cần composite mỗi frame)
+        return rasterize_image_clip(img_clip, target_resolution, placement=(
+            (target_w - new_w) // 2, (target_h - new_h) // 2, new_w, new_h
+        ))
         
     elif fill_mode == 'crop':
         # Cắt ảnh để vừa khung hình (có thể mất một phần ảnh)
@@ -1792,22 +2717,235 @@ def smart_resize_image(img_clip, target_resolution=(1920, 1080), fill_mode='smar
         scale_h = target_h / img_h
         scale = max(scale_w, scale_h)  # Chọn scale lớn hơn để fill đầy
         
-        # Resize và crop
-        resized_img = img_clip.resize(scale)
-        
-        # Crop về đúng kích thước
-        return resized_img.crop(
-            x_center=resized_img.w/2, 
-            y_center=resized_img.h/2,
-            width=target_w, 
-            height=target_h
-        )
+        # Crop giữa về đúng kích thước, resize 1 lần
+        crop_coords = smart_crop_calculation(img_w, img_h, target_w, target_h)
+        return rasterize_image_clip(img_clip, target_resolution, crop_coords)
         
     else:  # stretch
         # Kéo dãn ảnh để vừa khung hình (có thể bị biến dạng)
-        return img_clip.resize(target_resolution)
+        return rasterize_image_clip(img_clip, target_resolution)
+
+# ================= VIDEO FRAME SAMPLER & CROP CACHE =================
+VIDEO_SAMPLE_POINTS = (0.1, 0.3, 0.5, 0.7, 0.9)   # Vị trí lấy mẫu (tỷ lệ trong mỗi segment)
+VIDEO_REFRAME_MODE = 'track'      # 'track' = khung crop di chuyển theo chủ thể, 'static' = 1 crop cố định
+VIDEO_TRACK_KEYFRAME_INTERVAL = 0.5  # Khoảng cách (giây) giữa các keyframe detect khi tracking
+VIDEO_TRACK_SMOOTHING = 5         # Cửa sổ làm mượt (số keyframe) cho đường đi của khung crop
+VIDEO_TRACK_MIN_KEYFRAMES = 2     # Cần ít nhất 2 keyframe có mặt người mới tracking
+
+_video_crop_cache = {}   # {(video_path, start, end): {'crop_center', 'keyframes', 'total_faces'}} - toạ độ video gốc
+_video_crop_cache_lock = threading.Lock()
+
+def _video_crop_key(video_path, segment):
+    start, end = segment
+    return (os.path.abspath(video_path), round(start, 3), round(end, 3))
+
+def reset_video_crop_cache():
+    """Xoá crop centre của lần render trước (gọi đầu mỗi lần render)"""
+    with _video_crop_cache_lock:
+        _video_crop_cache.clear()
+
+def sample_video_frames(video_path, video_size, sample_times, max_side=None):
+    """
+    Decode các frame độ phân giải thấp tại nhiều thời điểm trong 1 lượt đọc tuần tự
+    (ffmpeg scale sẵn xuống proxy, thời điểm được đọc theo thứ tự tăng dần → reader chỉ tiến, không seek lùi)
+    
+    Args:
+        video_path: đường dẫn video gốc
+        video_size: (w, h) của video gốc
+        sample_times: các thời điểm (giây, theo video gốc)
+        max_side: cạnh dài tối đa của frame proxy (None = SUBJECT_DETECTION_MAX_SIDE)
+    
+    Returns:
+        dict: {t: frame RGB proxy}
+    """
+    max_side = max_side or SUBJECT_DETECTION_MAX_SIDE
+    video_w, video_h = video_size
+    # target_resolution của reader là (cao, rộng), None = giữ tỷ lệ
+    proxy_resolution = (None, max_side) if video_w >= video_h else (max_side, None)
+    
+    frames = {}
+    reader = FFMPEG_VideoReader(video_path, target_resolution=proxy_resolution)
+    try:
+        last_time = max(0, reader.duration - 1.0 / reader.fps) if reader.duration else None
+        for t in sorted(set(sample_times)):
+            if last_time is not None:
+                t = min(t, last_time)
+            try:
+                frames[t] = reader.get_frame(t)
+            except Exception:
+                continue
+    finally:
+        reader.close()
+    return frames
+
+def _segment_sample_times(segment):
+    """Thời điểm lấy mẫu của 1 segment: 5 điểm cố định, hoặc keyframe thưa đều nhau khi tracking"""
+    start, end = segment
+    times = [start + p * (end - start) for p in VIDEO_SAMPLE_POINTS]
+    if VIDEO_REFRAME_MODE == 'track':
+        times += list(np.arange(start + VIDEO_TRACK_KEYFRAME_INTERVAL / 2, end, VIDEO_TRACK_KEYFRAME_INTERVAL))
+    return sorted(set(float(t) for t in times))
+
+def plan_video_crop_centres(video_path, video_size, segments):
+    """
+    Tính crop centre cho tất cả segment sẽ cắt từ 1 video (1 lượt decode cho cả video)
+    và lưu vào cache theo (video, segment)
+    
+    Args:
+        video_path: đường dẫn video gốc
+        video_size: (w, h) của video gốc
+        segments: [(start, end), ...] theo giây của video gốc
+    
+    Returns:
+        dict: {(start, end): {'crop_center', 'keyframes', 'total_faces'}}
+        keyframes: [(t tính từ đầu segment, cx, cy, số_mặt), ...]
+    """
+    video_w, video_h = video_size
+    results = {}
+    pending = []
+    
+    with _video_crop_cache_lock:
+        for segment in segments:
+            cached = _video_crop_cache.get(_video_crop_key(video_path, segment))
+            if cached is not None:
+                results[segment] = cached
+            else:
+                pending.append(segment)
+    
+    if not pending:
+        return results
+    
+    # Thời điểm lấy mẫu của mọi segment (theo video gốc)
+    segment_times = {segment: _segment_sample_times(segment) for segment in pending}
+    all_times = [t for times in segment_times.values() for t in times]
+    
+    sample_start = time.time()
+    try:
+        frames = sample_video_frames(video_path, video_size, all_times)
+    except Exception as e:
+        log(f"      ⚠️ Không sample được frame video: {str(e)}")
+        frames = {}
+    
+    # Detect 1 lần cho mỗi thời điểm, quy đổi về toạ độ video gốc
+    centres_by_time = {}
+    sampled_times = sorted(frames)
+    for t in sampled_times:
+        frame = frames[t]
+        subject_info = detect_main_subject(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        if subject_info and subject_info['crop_center']:
+            proxy_h, proxy_w = frame.shape[:2]
+            cx, cy = subject_info['crop_center']
+            centres_by_time[t] = (cx * video_w / proxy_w, cy * video_h / proxy_h, len(subject_info['faces']))
+    
+    for segment, times in segment_times.items():
+        keyframes = []
+        total_faces = 0
+        for t in times:
+            # Thời điểm thật đã đọc có thể bị kẹp ở cuối video
+            nearest = min(sampled_times, key=lambda st: abs(st - t)) if sampled_times else None
+            if nearest is not None and abs(nearest - t) < 1.0 and nearest in centres_by_time:
+                cx, cy, faces = centres_by_time[nearest]
+                keyframes.append((t - segment[0], cx, cy, faces))
+                total_faces += faces
+        
+        crop_center = None
+        if keyframes:
+            crop_center = (int(sum(k[1] for k in keyframes) // len(keyframes)),
+                           int(sum(k[2] for k in keyframes) // len(keyframes)))
+        
+        result = {'crop_center': crop_center, 'keyframes': keyframes, 'total_faces': total_faces}
+        results[segment] = result
+        with _video_crop_cache_lock:
+            _video_crop_cache[_video_crop_key(video_path, segment)] = result
+    
+    log(f"      🎞️ Sample {len(frames)} frame cho {len(pending)} segment trong {time.time() - sample_start:.1f}s")
+    return results
+
+def _crop_video_to_target(video_clip, target_resolution, crop_center, total_faces):
+    """Resize + crop video về target theo crop centre (toạ độ video gốc)"""
+    target_w, target_h = target_resolution
+    video_w, video_h = video_clip.w, video_clip.h
+    avg_cx, avg_cy = crop_center
+    
+    scale_w = target_w / video_w
+    scale_h = target_h / video_h
+    scale = max(scale_w, scale_h)  # Scale để fill đầy
+    
+    # Resize trước
+    resized_video = video_clip.resize(scale)
+    
+    # Tính toán crop region
+    crop_coords = smart_crop_calculation(video_w, video_h, target_w, target_h, (avg_cx, avg_cy))
+    x1, y1, x2, y2 = crop_coords
+    
+    # Crop video
+    final_video = resized_video.crop(
+        x1=x1*scale, y1=y1*scale,
+        x2=x2*scale, y2=y2*scale
+    )
+    
+    log(f"      🎯 Smart crop video: {total_faces} faces detected, center=({avg_cx},{avg_cy})")
+    return final_video
+
+def build_crop_path(keyframes, video_size, target_resolution, fps, duration):
+    """
+    Đường đi của khung crop cho từng frame: keyframe có mặt người → làm mượt → nội suy theo thời gian
+    
+    Returns:
+        tuple: (x1 array, y1 array, crop_w, crop_h) theo toạ độ video gốc, hoặc None nếu không đủ keyframe
+    """
+    face_keyframes = [k for k in keyframes if k[3] > 0]
+    if len(face_keyframes) < VIDEO_TRACK_MIN_KEYFRAMES:
+        return None
+    
+    video_w, video_h = video_size
+    target_w, target_h = target_resolution
+    scale = max(target_w / video_w, target_h / video_h)
+    crop_w = min(video_w, int(round(target_w / scale)))
+    crop_h = min(video_h, int(round(target_h / scale)))
+    
+    key_times = np.array([k[0] for k in face_keyframes], dtype=np.float64)
+    key_cx = np.array([k[1] for k in face_keyframes], dtype=np.float64)
+    key_cy = np.array([k[2] for k in face_keyframes], dtype=np.float64)
+    
+    # Làm mượt bằng trung bình trượt (pad ở 2 đầu để không kéo đường về 0)
+    window = min(VIDEO_TRACK_SMOOTHING, len(face_keyframes))
+    if window > 1:
+        kernel = np.ones(window) / window
+        pad_left, pad_right = window // 2, window - 1 - window // 2
+        key_cx = np.convolve(np.pad(key_cx, (pad_left, pad_right), mode='edge'), kernel, mode='valid')
+        key_cy = np.convolve(np.pad(key_cy, (pad_left, pad_right), mode='edge'), kernel, mode='valid')
+    
+    # Nội suy tâm crop cho từng frame, giới hạn khung trong video
+    frame_times = np.arange(max(1, int(np.ceil(duration * fps)))) / fps
+    cx = np.interp(frame_times, key_times, key_cx)
+    cy = np.interp(frame_times, key_times, key_cy)
+    x1 = np.clip(np.round(cx - crop_w / 2), 0, video_w - crop_w).astype(np.int32)
+    y1 = np.clip(np.round(cy - crop_h / 2), 0, video_h - crop_h).astype(np.int32)
+    return x1, y1, crop_w, crop_h
+
+def _track_crop_video(video_clip, target_resolution, crop_path):
+    """Áp dụng khung crop di chuyển: cắt mảng (slicing) + 1 lần cv2.resize mỗi frame"""
+    x1, y1, crop_w, crop_h = crop_path
+    target_w, target_h = target_resolution
+    fps = video_clip.fps
+    last_index = len(x1) - 1
+    
+    def reframe(get_frame, t):
+        frame = get_frame(t)
+        index = min(last_index, max(0, int(round(t * fps))))
+        window = frame[y1[index]:y1[index] + crop_h, x1[index]:x1[index] + crop_w]
+        interpolation = cv2.INTER_AREA if crop_w > target_w else cv2.INTER_LINEAR
+        return cv2.resize(window, (target_w, target_h), interpolation=interpolation)
+    
+    return video_clip.fl(reframe)
+
+def get_video_crop_centre(video_path, video_size, segment):
+    """Crop centre của 1 segment (lấy từ cache, chưa có thì sample riêng segment đó)"""
+    return plan_video_crop_centres(video_path, video_size, [segment])[segment]
 
-def smart_resize_video(video_clip, target_resolution=(1920, 1080), target_fps=24, fill_mode='smart_crop'):
+def smart_resize_video(video_clip, target_resolution=(1920, 1080), target_fps=24, fill_mode='smart_crop',
+                       source_path=None, segment=None):
     """
     Resize video thông minh với AI-powered cropping
     
@@ -1816,6 +2954,8 @@ def smart_resize_video(video_clip, target_resolution=(1920, 1080), target_fps=24
         target_resolution: tuple (width, height) - resolution đích
         target_fps: int - FPS đích cho smooth playback
         fill_mode: 'letterbox', 'crop', 'smart_crop' (AI-powered)
+        source_path, segment: video gốc và (start, end) của clip → dùng crop centre đã cache
+                              (sample 1 lượt cho cả video) thay vì get_frame nhiều lần
     
     Returns:
         VideoFileClip đã được resize mượt mà
@@ -1831,6 +2971,25 @@ def smart_resize_video(video_clip, target_resolution=(1920, 1080), target_fps=24
     if fill_mode == 'smart_crop':
         # AI Smart Cropping cho video
         try:
+            if source_path and segment:
+                crop_info = get_video_crop_centre(source_path, (video_w, video_h), segment)
+                
+                # Tracking: khung crop đi theo chủ thể (quan trọng với video dọc 720x1280)
+                if VIDEO_REFRAME_MODE == 'track':
+                    crop_path = build_crop_path(crop_info['keyframes'], (video_w, video_h), target_resolution,
+                                                video_clip.fps, video_clip.duration)
+                    if crop_path is not None:
+                        log(f"      🎯 Tracked crop video: {len(crop_path[0])} frames, "
+                            f"{sum(1 for k in crop_info['keyframes'] if k[3] > 0)} keyframes có mặt người")
+                        return _track_crop_video(video_clip, target_resolution, crop_path)
+                
+                if crop_info['crop_center']:
+                    avg_cx, avg_cy = crop_info['crop_center']
+                    return _crop_video_to_target(video_clip, target_resolution, (avg_cx, avg_cy),
+                                                 crop_info['total_faces'])
+                log(f"      ⚠️ Smart crop video fallback: no subjects detected, using center crop")
+                return smart_resize_video(video_clip, target_resolution, target_fps, 'crop')
+            
             # Sample một vài frame để analyze
             sample_times = [0.1, 0.3, 0.5, 0.7, 0.9]  # 5 điểm thời gian
             sample_times = [t * video_clip.duration for t in sample_times if t * video_clip.duration < video_clip.duration]
@@ -1857,25 +3016,7 @@ def smart_resize_video(video_clip, target_resolution=(1920, 1080), target_fps=24
                 avg_cy = sum([cy for cx, cy in all_centers]) // len(all_centers)
                 
                 # Smart crop với center đã tính toán
-                scale_w = target_w / video_w
-                scale_h = target_h / video_h
-                scale = max(scale_w, scale_h)  # Scale để fill đầy
-                
-                # Resize trước
-                resized_video = video_clip.resize(scale)
-                
-                # Tính toán crop region
-                crop_coords = smart_crop_calculation(video_w, video_h, target_w, target_h, (avg_cx, avg_cy))
-                x1, y1, x2, y2 = crop_coords
-                
-                # Crop video
-                final_video = resized_video.crop(
-                    x1=x1*scale, y1=y1*scale,
-                    x2=x2*scale, y2=y2*scale
-                )
-                
-                log(f"      🎯 Smart crop video: {total_faces} faces detected, center=({avg_cx},{avg_cy})")
-                return final_video
+                return _crop_video_to_target(video_clip, target_resolution, (avg_cx, avg_cy), total_faces)
                 
             else:
                 # Fallback to center crop
@@ -1942,157 +3083,560 @@ def smart_resize_video(video_clip, target_resolution=(1920, 1080), target_fps=24
     else:
         return resized_video
 
-def create_image_collage(image_paths, duration=4.0):
-    """Tạo collage từ nhiều ảnh với intelligent positioning và smart crop"""
-    try:
-        num_images = len(image_paths)
-        log(f"    Tạo collage từ {num_images} ảnh với intelligent positioning")
-        
-        # Professional margin và spacing
-        margin = max(10, min(RESOLUTION) // 100)  # Dynamic margin based on resolution
-        spacing = margin // 2  # Spacing giữa các ảnh
-        
-        if num_images == 1:
-            # Ảnh đơn - sử dụng smart resize để vừa khung hình
-            img = ImageClip(image_paths[0])
-            collage = smart_resize_image_enhanced(img, RESOLUTION, 'smart_crop')
-            log(f"    ✅ Ảnh đơn với enhanced smart crop")
-            
+def compose_static_frame(placed_cells, size):
+    """
+    Dán các ô đã rasterize lên 1 frame RGB duy nhất (nền đen, margin/spacing giữ nguyên)
+    
+    Args:
+        placed_cells: [(ImageClip, (x, y)), ...] theo thứ tự vẽ
+        size: (w, h) của frame kết quả
+    
+    Returns:
+        np.ndarray uint8 (h, w, 3)
+    """
+    canvas_w, canvas_h = size
+    canvas = np.zeros((canvas_h, canvas_w, 3), dtype=np.uint8)
+    
+    for cell_clip, (x, y) in placed_cells:
+        frame = cell_clip.get_frame(0)
+        if frame.ndim == 2:
+            frame = np.dstack([frame] * 3)
+        frame = frame[..., :3]
+        cell_h, cell_w = frame.shape[:2]
+        
+        # Phần ô nằm trong canvas
+        x0, y0 = max(0, int(x)), max(0, int(y))
+        x1, y1 = min(canvas_w, int(x) + cell_w), min(canvas_h, int(y) + cell_h)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        region = frame[y0 - int(y):y1 - int(y), x0 - int(x):x1 - int(x)]
+        
+        if getattr(cell_clip, 'mask', None) is not None:
+            # Ảnh trong suốt: alpha blend 1 lần lên nền (giống CompositeVideoClip)
+            alpha = cell_clip.mask.get_frame(0)[y0 - int(y):y1 - int(y), x0 - int(x):x1 - int(x), None]
+            blended = region * alpha + canvas[y0:y1, x0:x1] * (1.0 - alpha)
+            canvas[y0:y1, x0:x1] = np.clip(blended, 0, 255).astype(np.uint8)
+        else:
+            canvas[y0:y1, x0:x1] = np.clip(region, 0, 255).astype(np.uint8, copy=False)
+    
+    return canvas
+
+# ================= COLLAGE LAYOUT ENGINE =================
+# Mỗi layout là danh sách ô (x, y, w, h, hint) chuẩn hoá 0-1 trên vùng khả dụng (sau khi trừ margin)
+# hint: 'main' = ô nổi bật (ưu tiên ảnh priority cao), 'side' = ô phụ, 'any' = không ưu tiên
+COLLAGE_LAYOUTS = {
+    1: {
+        'full': [(0, 0, 1, 1, 'main')],
+    },
+    2: {
+        'split_columns': [(0, 0, 0.5, 1, 'main'), (0.5, 0, 0.5, 1, 'main')],
+        'split_rows': [(0, 0, 1, 0.5, 'main'), (0, 0.5, 1, 0.5, 'main')],
+    },
+    3: {
+        'featured_left': [(0, 0, 0.65, 1, 'main'), (0.65, 0, 0.35, 0.5, 'side'), (0.65, 0.5, 0.35, 0.5, 'side')],
+        'featured_top': [(0, 0, 1, 0.6, 'main'), (0, 0.6, 0.5, 0.4, 'side'), (0.5, 0.6, 0.5, 0.4, 'side')],
+        'columns': [(0, 0, 1 / 3, 1, 'main'), (1 / 3, 0, 1 / 3, 1, 'side'), (2 / 3, 0, 1 / 3, 1, 'side')],
+    },
+    4: {
+        'grid': [(0, 0, 0.5, 0.5, 'main'), (0.5, 0, 0.5, 0.5, 'any'),
+                 (0, 0.5, 0.5, 0.5, 'any'), (0.5, 0.5, 0.5, 0.5, 'any')],
+        'featured_left': [(0, 0, 0.6, 1, 'main'), (0.6, 0, 0.4, 1 / 3, 'side'),
+                          (0.6, 1 / 3, 0.4, 1 / 3, 'side'), (0.6, 2 / 3, 0.4, 1 / 3, 'side')],
+        'featured_top': [(0, 0, 1, 0.6, 'main'), (0, 0.6, 1 / 3, 0.4, 'side'),
+                         (1 / 3, 0.6, 1 / 3, 0.4, 'side'), (2 / 3, 0.6, 1 / 3, 0.4, 'side')],
+    },
+    5: {
+        'featured_left_grid': [(0, 0, 0.5, 1, 'main'), (0.5, 0, 0.25, 0.5, 'side'), (0.75, 0, 0.25, 0.5, 'side'),
+                               (0.5, 0.5, 0.25, 0.5, 'side'), (0.75, 0.5, 0.25, 0.5, 'side')],
+        'featured_top_grid': [(0, 0, 1, 0.5, 'main'), (0, 0.5, 0.5, 0.25, 'side'), (0.5, 0.5, 0.5, 0.25, 'side'),
+                              (0, 0.75, 0.5, 0.25, 'side'), (0.5, 0.75, 0.5, 0.25, 'side')],
+        'rows_2_3': [(0, 0, 0.5, 0.55, 'main'), (0.5, 0, 0.5, 0.55, 'main'), (0, 0.55, 1 / 3, 0.45, 'side'),
+                     (1 / 3, 0.55, 1 / 3, 0.45, 'side'), (2 / 3, 0.55, 1 / 3, 0.45, 'side')],
+    },
+}
+COLLAGE_PRIORITY_WEIGHT = 0.5   # Trọng số đặt ảnh priority cao vào ô 'main' (so với chi phí crop mất ảnh)
+
+# Mọi cách gán ảnh → ô cho từng số ảnh: _COLLAGE_ASSIGNMENTS[n][p, i] = ô của ảnh i (5! = 120 cách)
+_COLLAGE_ASSIGNMENTS = {
+    n: np.array(list(itertools.permutations(range(n))), dtype=np.intp) for n in COLLAGE_LAYOUTS
+}
+
+def layout_cell_rects(template, target_resolution):
+    """
+    Đổi layout chuẩn hoá thành toạ độ pixel, giữ margin quanh khung và spacing giữa các ô
+    (layout 1 ô phủ kín khung hình, không margin)
+    
+    Returns:
+        list: [(x, y, w, h), ...] theo thứ tự ô trong template
+    """
+    target_w, target_h = target_resolution
+    if len(template) == 1:
+        return [(0, 0, target_w, target_h)]
+    
+    # Professional margin và spacing
+    margin = max(10, min(target_resolution) // 100)  # Dynamic margin based on resolution
+    spacing = margin // 2  # Spacing giữa các ảnh
+    
+    # Mỗi ô chiếm phần của (vùng khả dụng + spacing) rồi trừ spacing ở mép phải/dưới
+    span_w = target_w - 2 * margin + spacing
+    span_h = target_h - 2 * margin + spacing
+    rects = []
+    for x, y, w, h, _ in template:
+        left, top = margin + round(x * span_w), margin + round(y * span_h)
+        right, bottom = margin + round((x + w) * span_w) - spacing, margin + round((y + h) * span_h) - spacing
+        rects.append((left, top, max(1, right - left), max(1, bottom - top)))
+    return rects
+
+def choose_collage_layout(aspect_ratios, priorities, target_resolution):
+    """
+    Chọn layout + cách gán ảnh vào ô có chi phí thấp nhất cho N ảnh
+    
+    Chi phí (vector hoá trên mọi hoán vị):
+        Σ |log(tỷ lệ ảnh / tỷ lệ ô)| × diện tích ô   (phần ảnh bị crop mất)
+        - COLLAGE_PRIORITY_WEIGHT × priority × diện tích ô 'main'
+    
+    Returns:
+        (tên_layout, rects, assignment) - assignment[i] = chỉ số ô của ảnh i
+    """
+    num_images = len(aspect_ratios)
+    log_aspects = np.log(np.asarray(aspect_ratios, dtype=np.float64))
+    priorities = np.asarray(priorities, dtype=np.float64)
+    assignments = _COLLAGE_ASSIGNMENTS[num_images]
+    image_index = np.arange(num_images)[None, :]
+    frame_area = float(target_resolution[0] * target_resolution[1])
+    
+    best = None
+    for layout_name, template in COLLAGE_LAYOUTS[num_images].items():
+        rects = layout_cell_rects(template, target_resolution)
+        cell_sizes = np.array([(w, h) for _, _, w, h in rects], dtype=np.float64)
+        cell_areas = cell_sizes[:, 0] * cell_sizes[:, 1] / frame_area
+        is_main = np.array([hint == 'main' for *_, hint in template], dtype=np.float64)
+        
+        # cost_matrix[i, j] = chi phí đặt ảnh i vào ô j
+        crop_cost = np.abs(log_aspects[:, None] - np.log(cell_sizes[:, 0] / cell_sizes[:, 1])[None, :])
+        cost_matrix = crop_cost * cell_areas[None, :] - COLLAGE_PRIORITY_WEIGHT * priorities[:, None] * (cell_areas * is_main)[None, :]
+        
+        costs = cost_matrix[image_index, assignments].sum(axis=1)
+        best_index = int(np.argmin(costs))
+        if best is None or costs[best_index] < best[0]:
+            best = (costs[best_index], layout_name, rects, assignments[best_index])
+    
+    return best[1], best[2], best[3]
+
+def load_collage_source(image_path, cell_size):
+    """
+    Decode ảnh cho 1 ô collage: bản thu nhỏ nhỏ nhất phủ kín ô, JPEG decode rút gọn (PIL draft), xoay theo EXIF
+    
+    Returns:
+        np.ndarray RGB hoặc RGBA (ảnh trong suốt)
+    """
+    with Image.open(select_image_source(image_path, cell_size)) as img:
+        orientation = img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+        # draft làm việc trên ảnh chưa xoay → đảo kích thước yêu cầu nếu ảnh sẽ xoay 90°
+        draft_size = cell_size[::-1] if orientation in EXIF_TRANSPOSED_ORIENTATIONS else cell_size
+        img.draft('RGB', tuple(draft_size))
+        img = ImageOps.exif_transpose(img)
+        has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+        return np.asarray(img.convert('RGBA' if has_alpha else 'RGB'))
+
+def rasterize_collage_cells(sources, crop_boxes, rects, target_resolution):
+    """
+    1 lượt crop + resize cho mọi ô, ghi thẳng vào frame collage (nền đen)
+    
+    Args:
+        sources: ảnh đã decode (RGB/RGBA) theo ô
+        crop_boxes: (x1, y1, x2, y2) vùng lấy từ mỗi ảnh
+        rects: (x, y, w, h) vị trí ô trên frame
+    
+    Returns:
+        np.ndarray uint8 (h, w, 3)
+    """
+    target_w, target_h = target_resolution
+    canvas = np.zeros((target_h, target_w, 3), dtype=np.uint8)
+    
+    for source, (x1, y1, x2, y2), (x, y, w, h) in zip(sources, crop_boxes, rects):
+        region = source[max(0, int(y1)):int(np.ceil(y2)), max(0, int(x1)):int(np.ceil(x2))]
+        interpolation = cv2.INTER_AREA if region.shape[1] > w else cv2.INTER_CUBIC
+        resized = cv2.resize(region, (w, h), interpolation=interpolation)
+        
+        if resized.shape[2] == 4:
+            # Ảnh trong suốt: alpha blend lên nền đen
+            alpha = resized[..., 3:4].astype(np.float32) / 255.0
+            canvas[y:y + h, x:x + w] = (resized[..., :3] * alpha).astype(np.uint8)
         else:
-            # Phân tích từng ảnh để intelligent positioning
-            image_analyses = []
-            for i, img_path in enumerate(image_paths):
-                analysis = analyze_image_for_collage(img_path)
-                if analysis:
-                    analysis['original_index'] = i
-                    analysis['path'] = img_path
-                    image_analyses.append(analysis)
-                    log(f"    📊 Ảnh {i+1}: {analysis['dimensions'][0]}x{analysis['dimensions'][1]}, "
-                        f"priority={analysis['priority_score']:.2f}, pos={analysis['recommended_position']}")
-            
-            # Sort ảnh theo priority score (cao nhất lên đầu cho main position)
+            canvas[y:y + h, x:x + w] = resized
+    
+    return canvas
+
+def render_collage_frame(image_paths, target_resolution):
+    """
+    Dựng collage từ nhiều ảnh với intelligent positioning và smart crop, rasterize thành 1 frame tĩnh
+    
+    Layout được chọn từ COLLAGE_LAYOUTS theo số ảnh và tỷ lệ từng ảnh (choose_collage_layout),
+    sau đó mọi ô được crop + resize trong 1 lượt.
+    
+    Args:
+        image_paths: đường dẫn các ảnh trong collage
+        target_resolution: (w, h) - truyền tường minh vì worker process không thấy RESOLUTION của process chính
+    
+    Returns:
+        np.ndarray uint8 (h, w, 3) hoặc None nếu lỗi
+    """
+    try:
+        log(f"    Tạo collage từ {len(image_paths)} ảnh với intelligent positioning")
+        
+        # Phân tích từng ảnh (header + face analysis chung, không decode)
+        image_analyses = []
+        for i, img_path in enumerate(image_paths):
+            analysis = analyze_image_for_collage(img_path)
+            if analysis:
+                analysis['path'] = img_path
+                image_analyses.append(analysis)
+                log(f"    📊 Ảnh {i+1}: {analysis['dimensions'][0]}x{analysis['dimensions'][1]}, "
+                    f"priority={analysis['priority_score']:.2f}, pos={analysis['recommended_position']}")
+        
+        if not image_analyses:
+            raise Exception("Không đọc được ảnh nào trong nhóm")
+        
+        if len(image_analyses) > MAX_IMAGES_PER_FRAME:
+            # Giữ các ảnh priority cao nhất
             image_analyses.sort(key=lambda x: x['priority_score'], reverse=True)
-            sorted_paths = [analysis['path'] for analysis in image_analyses]
-            
-            # Load images theo thứ tự đã sort
-            images = []
-            for img_path in sorted_paths:
-                img = ImageClip(img_path)
-                images.append(img)
-            
-            # Available space sau khi trừ margin
-            available_w = RESOLUTION[0] - (2 * margin)
-            available_h = RESOLUTION[1] - (2 * margin)
-            
-            if num_images == 2:
-                # 2 ảnh - modern split layout với spacing
-                cell_w = (available_w - spacing) // 2
-                cell_h = available_h
-                
-                # Enhanced crop với position hints
-                img1 = smart_resize_image_enhanced(images[0], (cell_w, cell_h), 'smart_crop', 'main').set_position((margin, margin))
-                img2 = smart_resize_image_enhanced(images[1], (cell_w, cell_h), 'smart_crop', 'main').set_position((margin + cell_w + spacing, margin))
-                
-                collage = CompositeVideoClip([img1, img2], size=RESOLUTION)
-                log(f"    ✅ Layout 2 ảnh với intelligent positioning")
-                
-            elif num_images == 3:
-                # 3 ảnh - Featured + sidebar layout với intelligent positioning
-                main_w = int(available_w * 0.65)  # 65% cho ảnh chính (tương tự test)
-                side_w = available_w - main_w - spacing
-                side_h = (available_h - spacing) // 2
-                
-                # Ảnh có priority cao nhất → main position (trái)
-                # 2 ảnh còn lại → side positions (phải)
-                img1 = smart_resize_image_enhanced(images[0], (main_w, available_h), 'smart_crop', 'main').set_position((margin, margin))
-                img2 = smart_resize_image_enhanced(images[1], (side_w, side_h), 'smart_crop', 'side').set_position((margin + main_w + spacing, margin))
-                img3 = smart_resize_image_enhanced(images[2], (side_w, side_h), 'smart_crop', 'side').set_position((margin + main_w + spacing, margin + side_h + spacing))
-                
-                collage = CompositeVideoClip([img1, img2, img3], size=RESOLUTION)
-                log(f"    ✅ Layout 3 ảnh: Main={image_analyses[0]['priority_score']:.2f}, "
-                    f"Side1={image_analyses[1]['priority_score']:.2f}, Side2={image_analyses[2]['priority_score']:.2f}")
-                
-            elif num_images == 4:
-                # 4 ảnh - Perfect grid 2x2 với intelligent positioning
-                cell_w = (available_w - spacing) // 2
-                cell_h = (available_h - spacing) // 2
-                
-                positions = [
-                    (margin, margin),  # Top-left (highest priority)
-                    (margin + cell_w + spacing, margin),  # Top-right
-                    (margin, margin + cell_h + spacing),  # Bottom-left
-                    (margin + cell_w + spacing, margin + cell_h + spacing)  # Bottom-right
-                ]
-                
-                clips = []
-                for i, img in enumerate(images[:4]):
-                    # First position gets priority hint as main
-                    position_hint = 'main' if i == 0 else 'any'
-                    clip = smart_resize_image_enhanced(img, (cell_w, cell_h), 'smart_crop', position_hint).set_position(positions[i])
-                    clips.append(clip)
-                
-                collage = CompositeVideoClip(clips, size=RESOLUTION)
-                log(f"    ✅ Grid 2x2 với ảnh priority cao nhất ở top-left")
-                
-            else:  # 4 ảnh - Grid 2x2 layout
-                # Giới hạn tối đa 4 ảnh để tránh phức tạp
-                images = images[:4]  # Chỉ lấy 4 ảnh tốt nhất (đã sorted theo priority)
-                
-                # Layout 2x2 grid
-                cell_w = (available_w - spacing) // 2
-                cell_h = (available_h - spacing) // 2
-                
-                positions = [
-                    (margin, margin),  # Top-left
-                    (margin + cell_w + spacing, margin),  # Top-right
-                    (margin, margin + cell_h + spacing),  # Bottom-left
-                    (margin + cell_w + spacing, margin + cell_h + spacing)  # Bottom-right
-                ]
-                
-                clips = []
-                for i in range(min(4, len(images))):
-                    # Ảnh đầu tiên (priority cao nhất) dùng main hint, còn lại dùng side hint
-                    hint = 'main' if i == 0 else 'side'
-                    clip = smart_resize_image_enhanced(images[i], (cell_w, cell_h), 'smart_crop', hint).set_position(positions[i])
-                    clips.append(clip)
-                
-                collage = CompositeVideoClip(clips, size=RESOLUTION)
-                log(f"    ✅ Grid 2x2 với ảnh priority cao nhất ở top-left (tối đa 4 ảnh)")
+            log(f"    ⚠️ Nhóm {len(image_analyses)} ảnh > {MAX_IMAGES_PER_FRAME}, bỏ {len(image_analyses) - MAX_IMAGES_PER_FRAME} ảnh priority thấp")
+            image_analyses = image_analyses[:MAX_IMAGES_PER_FRAME]
+        
+        num_images = len(image_analyses)
+        layout_name, rects, assignment = choose_collage_layout(
+            [analysis['aspect_ratio'] for analysis in image_analyses],
+            [analysis['priority_score'] for analysis in image_analyses],
+            target_resolution
+        )
+        template = COLLAGE_LAYOUTS[num_images][layout_name]
+        
+        # Decode ảnh cho từng ô (bản thu nhỏ phủ kín ô) + tính vùng smart crop
+        sources, crop_boxes, cell_rects = [], [], []
+        for analysis, cell_index in zip(image_analyses, assignment):
+            x, y, cell_w, cell_h = rects[cell_index]
+            source = load_collage_source(analysis['path'], (cell_w, cell_h))
+            source_h, source_w = source.shape[:2]
             
-            log(f"    ✅ Intelligent collage {num_images} ảnh với smart positioning và enhanced cropping")
-        
-        collage = collage.set_duration(duration)
-        log(f"    ✅ Collage hoàn thành ({duration}s)")
-        
-        # 🔧 CLEANUP: Close all individual image clips để tránh memory leak
-        try:
-            for img in images:
-                if hasattr(img, 'close'):
-                    img.close()
-            log(f"    🧹 Cleaned up {len(images)} image clips")
-        except Exception as cleanup_error:
-            log(f"    ⚠️ Cleanup warning: {str(cleanup_error)}")
+            subject_info = get_subject_info(analysis['path'], source_w, source_h)
+            crop_center = smart_crop_centre(source_w, source_h, cell_w, cell_h, subject_info, template[cell_index][4])
+            
+            sources.append(source)
+            crop_boxes.append(smart_crop_calculation(source_w, source_h, cell_w, cell_h, crop_center))
+            cell_rects.append(rects[cell_index])
         
-        return collage
+        # Rasterize 1 lần: toàn bộ collage thành 1 frame tĩnh
+        frame = rasterize_collage_cells(sources, crop_boxes, cell_rects, target_resolution)
+        log(f"    ✅ Collage {num_images} ảnh, layout '{layout_name}' (1 frame tĩnh)")
+        return frame
         
     except Exception as e:
         log(f"    ❌ Lỗi tạo collage: {str(e)}")
         # Fallback: chỉ dùng ảnh đầu tiên với smart resize
         try:
-            img = ImageClip(image_paths[0])
-            result = smart_resize_image(img, RESOLUTION, 'smart_crop').set_duration(duration)
+            img = ImageClip(select_image_source(image_paths[0], target_resolution))
+            result = smart_resize_image(img, target_resolution, 'smart_crop', source_path=image_paths[0])
+            frame = compose_static_frame([(result, (0, 0))], target_resolution)
             img.close()  # Clean up fallback image
-            return result
+            result.close()
+            return frame
         except Exception as fallback_error:
             log(f"    ❌ Fallback error: {str(fallback_error)}")
             return None
 
-def _process_ai_scoring_and_replacement(preliminary_images, image_files, video_files, selected_videos, find_file_path_func):
-    """Helper function for AI scoring and replacement logic (used in RANDOM selection)"""
+# ================= KEN BURNS (PAN/ZOOM ẢNH TĨNH) =================
+KEN_BURNS_ENABLED = True          # Bật pan/zoom nhẹ cho clip ảnh (ảnh đơn + collage)
+KEN_BURNS_MAX_ZOOM = 1.12         # Zoom tối đa (1.0 = thấy toàn bộ ảnh nguồn)
+KEN_BURNS_MAX_SOURCE_SIDE = 2048  # Cạnh dài tối đa của frame nguồn được cache cho pan/zoom
+KEN_BURNS_MODES = ('zoom_in', 'zoom_out', 'pan')
+
+def ken_burns_source_resolution(target_resolution):
+    """
+    Kích thước frame nguồn cho pan/zoom: lớn hơn frame output KEN_BURNS_MAX_ZOOM lần
+    (ở mức zoom tối đa vẫn 1 pixel nguồn ≈ 1 pixel output), giới hạn bởi KEN_BURNS_MAX_SOURCE_SIDE
+    """
+    target_w, target_h = target_resolution
+    scale = min(KEN_BURNS_MAX_ZOOM, KEN_BURNS_MAX_SOURCE_SIDE / max(target_w, target_h))
+    scale = max(1.0, scale)
+    return (int(round(target_w * scale)), int(round(target_h * scale)))
+
+def plan_ken_burns_matrices(source_size, target_resolution, duration, fps=FPS, mode=None):
+    """
+    Tính trước ma trận affine (nguồn → output) cho từng frame của hiệu ứng pan/zoom
+    
+    Args:
+        source_size: (w, h) của frame nguồn đã cache
+        target_resolution: (w, h) của frame output
+        duration, fps: số frame = ceil(duration × fps)
+        mode: 'zoom_in', 'zoom_out', 'pan' (None = random)
+    
+    Returns:
+        np.ndarray float32 (số_frame, 2, 3)
+    """
+    source_w, source_h = source_size
+    target_w, target_h = target_resolution
+    num_frames = max(1, int(np.ceil(duration * fps)))
+    mode = mode or random.choice(KEN_BURNS_MODES)
+    
+    # Đường cong easing (smoothstep) tính 1 lần cho cả clip
+    progress = np.linspace(0.0, 1.0, num_frames)
+    eased = progress * progress * (3.0 - 2.0 * progress)
+    
+    # Vị trí khung nhìn: 0 = sát trái/trên, 1 = sát phải/dưới phần dư của ảnh nguồn
+    end_x, end_y = random.uniform(0.2, 0.8), random.uniform(0.3, 0.7)
+    if mode == 'zoom_in':
+        zoom = 1.0 + (KEN_BURNS_MAX_ZOOM - 1.0) * eased
+        pos_x = 0.5 + (end_x - 0.5) * eased
+        pos_y = 0.5 + (end_y - 0.5) * eased
+    elif mode == 'zoom_out':
+        zoom = KEN_BURNS_MAX_ZOOM - (KEN_BURNS_MAX_ZOOM - 1.0) * eased
+        pos_x = end_x + (0.5 - end_x) * eased
+        pos_y = end_y + (0.5 - end_y) * eased
+    else:  # pan ngang ở zoom cố định
+        zoom = np.full(num_frames, KEN_BURNS_MAX_ZOOM)
+        start_x = random.choice((0.15, 0.85))
+        pos_x = start_x + ((1.0 - start_x) - start_x) * eased
+        pos_y = np.full(num_frames, 0.5)
+    
+    # Khung nhìn (x, y, w, h) trên ảnh nguồn → ma trận scale + translate
+    window_w = source_w / zoom
+    window_h = source_h / zoom
+    window_x = pos_x * (source_w - window_w)
+    window_y = pos_y * (source_h - window_h)
+    scale_x = target_w / window_w
+    scale_y = target_h / window_h
+    
+    matrices = np.zeros((num_frames, 2, 3), dtype=np.float32)
+    matrices[:, 0, 0] = scale_x
+    matrices[:, 0, 2] = -window_x * scale_x
+    matrices[:, 1, 1] = scale_y
+    matrices[:, 1, 2] = -window_y * scale_y
+    return matrices
+
+def ken_burns_clip(source_frame, target_resolution, duration, fps=FPS, mode=None):
+    """
+    Clip pan/zoom từ 1 frame nguồn đã cache: mỗi frame output = 1 lần cv2.warpAffine
+    với ma trận đã tính trước (không resize lại ảnh mỗi frame)
+    
+    Args:
+        source_frame: np.ndarray uint8 (h, w, 3) - thường lớn hơn output (ken_burns_source_resolution)
+        target_resolution: (w, h) của clip kết quả
+    
+    Returns:
+        VideoClip
+    """
+    target_w, target_h = target_resolution
+    source_h, source_w = source_frame.shape[:2]
+    matrices = plan_ken_burns_matrices((source_w, source_h), target_resolution, duration, fps, mode)
+    last_frame = {'index': None, 'frame': None}
+    
+    def make_frame(t):
+        index = min(len(matrices) - 1, max(0, int(t * fps + 1e-6)))
+        # Transition / concat có thể hỏi lại cùng 1 frame → dùng lại kết quả
+        if last_frame['index'] != index:
+            last_frame['frame'] = cv2.warpAffine(source_frame, matrices[index], (target_w, target_h),
+                                                 flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+            last_frame['index'] = index
+        return last_frame['frame']
+    
+    return VideoClip(make_frame, duration=duration)
+
+def make_still_clip(frame, duration, target_resolution):
+    """Clip cho 1 frame ảnh/collage: pan/zoom nếu bật KEN_BURNS_ENABLED, ngược lại ImageClip tĩnh"""
+    if KEN_BURNS_ENABLED:
+        return ken_burns_clip(frame, target_resolution, duration)
+    if frame.shape[1::-1] != tuple(target_resolution):
+        frame = cv2.resize(frame, tuple(target_resolution), interpolation=cv2.INTER_AREA)
+    return ImageClip(frame).set_duration(duration)
+
+def get_still_source_resolution(target_resolution):
+    """Độ phân giải dựng frame ảnh/collage (lớn hơn output nếu có pan/zoom)"""
+    return ken_burns_source_resolution(target_resolution) if KEN_BURNS_ENABLED else tuple(target_resolution)
+
+def create_image_collage(image_paths, duration=4.0):
+    """
+    Tạo collage từ nhiều ảnh với intelligent positioning và smart crop
+    
+    Collage được rasterize 1 lần thành 1 frame tĩnh, moviepy không phải composite lại
+    từng ô ở mỗi frame output (pan/zoom chỉ là 1 warpAffine / frame trên frame đó).
+    """
+    frame = render_collage_frame(image_paths, get_still_source_resolution(RESOLUTION))
+    if frame is None:
+        return None
+    return make_still_clip(frame, duration, RESOLUTION)
+
+# ================= PARALLEL COLLAGE BUILDING =================
+def collect_face_analyses(image_paths, library_folder):
+    """
+    Face analysis đã có sẵn (store của lần render hoặc score index) cho các ảnh - không detect mới
+    
+    Args:
+        library_folder: thư mục thư viện ảnh (score index)
+    
+    Returns:
+        dict: {image_path: analysis} - ảnh chưa có analysis sẽ được worker tự detect
+    """
+    analyses = {}
+    score_cache = get_score_cache(library_folder)
+    for image_path in image_paths:
+        key = os.path.abspath(image_path)
+        with _face_analysis_lock:
+            analysis = _face_analysis_store.get(key)
+        if analysis is None:
+            remember_face_analysis(image_path, score_cache.get(image_path, SCORER_VERSION))
+            with _face_analysis_lock:
+                analysis = _face_analysis_store.get(key)
+        if analysis is not None:
+            analyses[image_path] = analysis
+    return analyses
+
+def _render_collage_worker(image_paths, target_resolution, face_analyses, library_folder):
+    """
+    Chạy trong worker process: nạp face analysis + thư mục thư viện từ process chính rồi dựng frame collage
+    (worker spawn chỉ thấy giá trị mặc định của INPUT_FOLDER nên thư viện phải truyền tường minh)
+    """
+    seed_face_analysis_store(face_analyses, library_folder)
+    return render_collage_frame(image_paths, target_resolution)
+
+def create_image_collages_parallel(groups, durations):
+    """
+    Dựng nhiều collage song song trong process pool, worker trả về frame tĩnh
+    (fallback tuần tự nếu pool lỗi)
+    
+    Args:
+        groups: [[image_path, ...], ...] - mỗi nhóm là 1 collage
+        durations: thời lượng (giây) tương ứng từng nhóm
+    
+    Returns:
+        list: clip ảnh (hoặc None nếu nhóm lỗi) theo đúng thứ tự groups
+    """
+    groups = [list(group) for group in groups]
+    if not groups:
+        return []
+    
+    # Worker dựng frame ở độ phân giải nguồn (lớn hơn output nếu có pan/zoom)
+    target_resolution = get_still_source_resolution(RESOLUTION)
+    frames = None
+    
+    if len(groups) > 1 and SCORING_WORKERS > 1:
+        try:
+            pool = get_scoring_pool()
+            analyses = [collect_face_analyses(group, INPUT_FOLDER) for group in groups]
+            frames = list(pool.map(_render_collage_worker, groups, [target_resolution] * len(groups),
+                                   analyses, [INPUT_FOLDER] * len(groups)))
+            log(f"🧩 Dựng {len(groups)} collage song song ({SCORING_WORKERS} workers)")
+        except Exception as e:
+            log(f"⚠️ Process pool lỗi ({str(e)}), dựng collage tuần tự")
+            _reset_scoring_pool()
+            frames = None
+    
+    if frames is None:
+        frames = [render_collage_frame(group, target_resolution) for group in groups]
+    
+    return [
+        make_still_clip(frame, duration, RESOLUTION) if frame is not None else None
+        for frame, duration in zip(frames, durations)
+    ]
+
+
+def build_near_duplicate_clusters(image_files, find_file_path_func, score_cache, deadline_at=None):
+    """
+    Gộp ảnh gần trùng (ảnh chụp liên tiếp, ảnh upload lại) theo dHash lưu trong index thư viện
+    Ảnh đại diện mỗi cụm = file lớn nhất (thường là bản chất lượng cao nhất)
+    
+    Args:
+        deadline_at: mốc time.time() hết ngân sách chấm điểm (None = không giới hạn).
+                     dHash đã có trong index luôn được dùng; ảnh chưa index chỉ được hash
+                     khi còn thời gian, hết giờ thì đứng riêng 1 cụm (không dedup)
+    
+    Returns:
+        dict: {ảnh_đại_diện: [ảnh gần trùng khác, ...]} (thứ tự theo image_files)
+    """
+    paths = {img: find_file_path_func(img) for img in image_files}
+    hashes = {}
+    skipped = 0
+    for img, path in paths.items():
+        if not path:
+            hashes[img] = None
+        elif (deadline_at is None or score_cache.has_perceptual_hash(path) or
+              time.time() < deadline_at):
+            hashes[img] = score_cache.get_perceptual_hash(path)
+        else:
+            hashes[img] = None
+            skipped += 1
+    if skipped:
+        log(f"⏰ Hết thời gian, {skipped} ảnh chưa có dHash không được gộp ảnh gần trùng")
+    
+    def file_size(img):
+        try:
+            return os.path.getsize(paths[img])
+        except (OSError, TypeError):
+            return 0
+    
+    clusters = {}
+    for cluster in cluster_near_duplicates(hashes, NEAR_DUPLICATE_MAX_DISTANCE):
+        representative = max(cluster, key=file_size)
+        clusters[representative] = [img for img in cluster if img != representative]
+    
+    duplicate_count = len(image_files) - len(clusters)
+    if duplicate_count:
+        log(f"🧬 Gộp {len(image_files)} ảnh thành {len(clusters)} cụm ({duplicate_count} ảnh gần trùng)")
+    return clusters
+
+def _process_ai_scoring_and_replacement(preliminary_images, image_files, video_files, selected_videos, find_file_path_func,
+                                       deadline_at=None, duplicate_clusters=None):
+    """Helper function for AI scoring and replacement logic (used in RANDOM selection)
+    Args:
+        deadline_at: mốc time.time() hết ngân sách chấm điểm (None = không giới hạn)
+        duplicate_clusters: dict {ảnh_đại_diện: [ảnh gần trùng]} từ build_near_duplicate_clusters
+    """
     selected_images = []
     rejected_images = []
     available_backup_images = [img for img in image_files if img not in preliminary_images]
     
+    # Score cache bền vững của thư viện (key = hash nội dung + SCORER_VERSION)
+    score_cache = get_score_cache(INPUT_FOLDER)
+    duplicate_clusters = duplicate_clusters or {}
+    
+    # Chấm song song 1 lần: ảnh sơ bộ + pool ảnh backup dự phòng (chọn ngẫu nhiên)
+    # Thứ tự ưu tiên khi có deadline: ảnh sơ bộ trước, backup sau
+    random.shuffle(available_backup_images)
+    backup_pool_size = max(SCORING_MIN_BACKUP_POOL, int(len(preliminary_images) * SCORING_BACKUP_POOL_RATIO))
+    speculative_backups = available_backup_images[:backup_pool_size]
+    log(f"🤖 Chấm điểm song song {len(preliminary_images)} ảnh sơ bộ + {len(speculative_backups)} ảnh backup")
+    
+    scores = {}
+    
+    def score_batch(image_list):
+        paths = {img: find_file_path_func(img) for img in image_list if img not in scores}
+        duplicates = {
+            paths[img]: [find_file_path_func(dup) for dup in duplicate_clusters[img]]
+            for img in paths if duplicate_clusters.get(img)
+        }
+        batch_scores = score_images_batch(list(paths.values()), score_cache, deadline_at, duplicates)
+        for img, path in paths.items():
+            scores[img] = batch_scores[path]
+    
+    score_batch(preliminary_images + speculative_backups)
+    
+    def is_fully_scored(img):
+        return not scores[img][3].startswith('[deadline]')
+    
+    def pick_backup_image():
+        """Ưu tiên ảnh backup đã chấm đủ và đạt chuẩn, chấm thêm 1 đợt nếu hết"""
+        scored = [img for img in available_backup_images if img in scores]
+        acceptable = [img for img in scored if scores[img][2]]
+        if not acceptable:
+            unscored = [img for img in available_backup_images if img not in scores]
+            if unscored:
+                score_batch(unscored[:backup_pool_size])
+                scored = [img for img in available_backup_images if img in scores]
+                acceptable = [img for img in scored if scores[img][2]]
+        # Ảnh đạt chuẩn sau khi chấm đủ tốt hơn ảnh chỉ được chấp nhận tạm vì hết giờ
+        fully_acceptable = [img for img in acceptable if is_fully_scored(img)]
+        return random.choice(fully_acceptable or acceptable or scored or available_backup_images)
+    
     for i, image_file in enumerate(preliminary_images):
         log(f"📸 Đánh giá ảnh {i+1}/{len(preliminary_images)}: {image_file}")
         
@@ -2101,12 +3645,12 @@ def _process_ai_scoring_and_replacement(preliminary_images, image_files, video_f
         max_attempts = 3  # Tối đa thay thế 3 lần
         
         while replacement_attempts <= max_attempts:
-            image_path = find_file_path_func(current_image)
+            # Điểm đã được chấm sẵn trong batch
+            if current_image not in scores:
+                score_batch([current_image])
+            total_score, detail, is_acceptable, rejection_reason, from_cache = scores[current_image]
             
-            # AI chấm điểm
-            total_score, detail, is_acceptable, rejection_reason = calculate_total_image_score(image_path)
-            
-            log(f"   Điểm: {total_score:.1f}/100 - {detail}")
+            log(f"   Điểm: {total_score:.1f}/100 - {detail}{' [cache]' if from_cache else ''}")
             
             if is_acceptable:
                 selected_images.append(current_image)
@@ -2120,7 +3664,7 @@ def _process_ai_scoring_and_replacement(preliminary_images, image_files, video_f
                 # Tìm ảnh thay thế
                 if replacement_attempts <= max_attempts and available_backup_images:
                     log(f"   🔄 Thử thay thế lần {replacement_attempts}/{max_attempts}")
-                    current_image = random.choice(available_backup_images)
+                    current_image = pick_backup_image()
                     available_backup_images.remove(current_image)
                     log(f"   📸 Thử ảnh thay thế: {current_image}")
                 else:
@@ -2133,6 +3677,22 @@ def _process_ai_scoring_and_replacement(preliminary_images, image_files, video_f
                         selected_images.append(image_file)
                     break
     
+    cache_hits = sum(1 for result in scores.values() if result[4])
+    deadline_scored = sum(1 for img in scores if not is_fully_scored(img))
+    if deadline_scored:
+        log(f"⏰ {deadline_scored} ảnh chỉ có điểm rẻ do hết ngân sách chấm điểm")
+    
+    # Thống kê ảnh bị loại theo tier (header/quality loại sớm = không tốn face detection)
+    if rejected_images:
+        tier_counts = {}
+        for _, reason in rejected_images:
+            tier = reason.split(']')[0].replace('[tier ', '') if reason.startswith('[tier ') else 'khác'
+            tier_counts[tier] = tier_counts.get(tier, 0) + 1
+        log(f"🪜 Loại theo tier: {', '.join(f'{tier}={count}' for tier, count in tier_counts.items())}")
+    # Lưu điểm mới chấm xuống disk cho lần render sau
+    score_cache.save()
+    log(f"💾 Score cache: {cache_hits} ảnh dùng điểm đã lưu")
+    
     # Đảm bảo tối thiểu video nếu có
     if len(selected_videos) == 0 and len(video_files) > 0:
         log("Không có video nào được chọn, thêm 1 video tối thiểu")
@@ -2143,10 +3703,13 @@ def _process_ai_scoring_and_replacement(preliminary_images, image_files, video_f
     
     return selected_images, rejected_images
 
-def select_random_materials(image_files, video_files, find_file_path_func, skip_ai_scoring=False):
+def select_random_materials(image_files, video_files, find_file_path_func, skip_ai_scoring=False,
+                            scoring_deadline=MATERIAL_SCORING_DEADLINE):
     """Chọn nguyên liệu ngẫu nhiên với AI chấm điểm và lọc ảnh chất lượng thấp
     Args:
         skip_ai_scoring: Nếu True, bỏ qua AI scoring và dùng hết files (cho manual selection)
+        scoring_deadline: ngân sách (giây) cho AI chấm điểm, hết giờ thì ảnh còn lại
+                          dùng điểm cache hoặc điểm rẻ (tier header). None = không giới hạn
     """
     total_materials = len(image_files) + len(video_files)
     
@@ -2183,6 +3746,17 @@ def select_random_materials(image_files, video_files, find_file_path_func, skip_
     
     # ========== RANDOM SELECTION LOGIC (CŨ) ==========
     
+    # Ngân sách chấm điểm tính từ đây: gồm cả dHash của ảnh chưa index khi gộp ảnh gần trùng
+    deadline_at = time.time() + scoring_deadline if scoring_deadline is not None else None
+    if scoring_deadline is not None:
+        log(f"⏱️ Ngân sách chấm điểm: {scoring_deadline}s")
+    
+    # Gộp ảnh gần trùng: mỗi cụm chỉ còn 1 ảnh đại diện (đa dạng hơn + chấm ít ảnh hơn)
+    duplicate_clusters = build_near_duplicate_clusters(image_files, find_file_path_func,
+                                                       get_score_cache(INPUT_FOLDER), deadline_at)
+    image_files = list(duplicate_clusters)
+    total_materials = len(image_files) + len(video_files)
+    
     # Bước 1: Logic chọn số lượng nguyên liệu cho random selection
     if not skip_ai_scoring:
         # RANDOM SELECTION: Logic chọn số lượng như cũ
@@ -2238,7 +3812,8 @@ def select_random_materials(image_files, video_files, find_file_path_func, skip_
         # RANDOM SELECTION: Áp dụng AI scoring như cũ
         log("🤖 RANDOM SELECTION: Bắt đầu AI chấm điểm và lọc ảnh...")
         selected_images, rejected_images = _process_ai_scoring_and_replacement(
-            preliminary_images, image_files, video_files, selected_videos, find_file_path_func
+            preliminary_images, image_files, video_files, selected_videos, find_file_path_func,
+            deadline_at=deadline_at, duplicate_clusters=duplicate_clusters
         )
     
     log(f"Kết quả cuối: {len(selected_images)} ảnh, {len(selected_videos)} video")
@@ -2326,10 +3901,14 @@ def select_music(auto_random=False):
 
 
 
-def create_memories_video(username=None, custom_music_path=None):
+def create_memories_video(username=None, custom_music_path=None, scoring_deadline=MATERIAL_SCORING_DEADLINE):
     # 🕐 BẮT ĐẦU TIMER CHO TOÀN BỘ QUY TRÌNH
     video_timer.start("Tạo Video Kỷ Niệm với GPU Acceleration")
     
+    # Face analysis mới cho lần render này (dùng chung cho chấm điểm, collage, crop)
+    reset_face_analysis_store(INPUT_FOLDER)
+    reset_video_crop_cache()
+    
     # Set OUTPUT_FOLDER to user's memories directory
     global OUTPUT_FOLDER
     original_output_folder = OUTPUT_FOLDER
@@ -2527,7 +4106,10 @@ def create_memories_video(username=None, custom_music_path=None):
     else:
         log("🎲 RANDOM SELECTION: Bắt đầu chọn nguyên liệu ngẫu nhiên")
     
-    selected_images, selected_videos = select_random_materials(image_files, video_files, find_file_path_func, skip_ai_scoring=skip_ai_scoring)
+    selected_images, selected_videos = select_random_materials(
+        image_files, video_files, find_file_path_func,
+        skip_ai_scoring=skip_ai_scoring, scoring_deadline=scoring_deadline
+    )
     video_timer.phase_update(f"Đã chọn {len(selected_images)} ảnh và {len(selected_videos)} video")
 
     clips = []
@@ -2541,6 +4123,7 @@ def create_memories_video(username=None, custom_music_path=None):
     estimated_video_duration = 0
     video_data = []  # Lưu thông tin video để xử lý 2 bước
     original_video_clips = []  # Lưu original clips để cleanup sau cùng
+    planned_segments = []  # Lên kế hoạch mọi segment trước, resize sau khi đã có crop centre
     
     # BƯỚC 1: Xử lý cơ bản - 1 clip mỗi video
     video_timer.phase_start("Xử lý video và AI smart cropping")
@@ -2574,11 +4157,8 @@ def create_memories_video(username=None, custom_music_path=None):
                     start_time = random.uniform(0, max_start)
                     end_time = min(start_time + clip_duration, original_duration)
                     
-                    # Cắt clip
-                    sub_clip = video_clip.subclip(start_time, end_time)
-                    sub_clip = smart_resize_video(sub_clip, RESOLUTION, FPS)
-                    
-                    video_clips.append(sub_clip)
+                    # Lên kế hoạch cắt clip (cắt + smart crop sau khi plan xong mọi segment)
+                    planned_segments.append({'video': video_data[-1], 'start': start_time, 'end': end_time})
                     estimated_video_duration += (end_time - start_time)
                     
                     # Lưu segment đã dùng
@@ -2587,8 +4167,7 @@ def create_memories_video(username=None, custom_music_path=None):
                     log(f"    Clip {i+1}.1: {start_time:.1f}s-{end_time:.1f}s ({end_time-start_time:.1f}s)")
                 else:
                     # Video ngắn: Dùng nguyên
-                    sub_clip = smart_resize_video(video_clip, RESOLUTION, FPS)
-                    video_clips.append(sub_clip)
+                    planned_segments.append({'video': video_data[-1], 'start': 0, 'end': original_duration, 'whole': True})
                     estimated_video_duration += original_duration
                     
                     # Đánh dấu toàn bộ video đã dùng
@@ -2668,11 +4247,8 @@ def create_memories_video(username=None, custom_music_path=None):
                         start_time = random.uniform(avail_start, max_start)
                         end_time = min(start_time + clip_duration, avail_end)
                         
-                        # Cắt clip bổ sung
-                        sub_clip = video_clip.subclip(start_time, end_time)
-                        sub_clip = smart_resize_video(sub_clip, RESOLUTION, FPS)
-                        
-                        video_clips.append(sub_clip)
+                        # Lên kế hoạch cắt clip bổ sung
+                        planned_segments.append({'video': video_info, 'start': start_time, 'end': end_time})
                         estimated_video_duration += (end_time - start_time)
                         
                         # Cập nhật used_segments
@@ -2690,17 +4266,38 @@ def create_memories_video(username=None, custom_music_path=None):
                         log(f"  + Video {video_data.index(video_info) + 1}: Clip sẽ vượt {MAX_VIDEO_MATERIALS_DURATION}s, bỏ qua")
                         break
         
-        log(f"Tổng cuối: {estimated_video_duration:.1f}s từ {len(video_clips)} clips")
+        log(f"Tổng cuối: {estimated_video_duration:.1f}s từ {len(planned_segments)} clips")
         
         # Cập nhật số video thực tế được xử lý (có thể thay đổi sau Bước 2)
         processed_videos = len([v for v in video_data if len(v['used_segments']) > 0])
-        log(f"• KẾT QUẢ: {len(video_clips)} clips từ {processed_videos} video nguyên liệu")
+        log(f"• KẾT QUẢ: {len(planned_segments)} clips từ {processed_videos} video nguyên liệu")
         log(f"• THỜI LƯỢNG VIDEO: {estimated_video_duration:.1f}s/{MAX_VIDEO_MATERIALS_DURATION}s")
     else:
         # Nếu không có BƯỚC 2, vẫn cần log kết quả
-        log(f"• KẾT QUẢ: {len(video_clips)} clips từ {processed_videos} video nguyên liệu")
+        log(f"• KẾT QUẢ: {len(planned_segments)} clips từ {processed_videos} video nguyên liệu")
         log(f"• THỜI LƯỢNG VIDEO: {estimated_video_duration:.1f}s/{MAX_VIDEO_MATERIALS_DURATION}s")
     
+    # Crop centre cho mọi segment đã plan: mỗi video chỉ decode 1 lượt tuần tự ở độ phân giải thấp
+    for video_info in video_data:
+        segments = [(seg['start'], seg['end']) for seg in planned_segments if seg['video'] is video_info]
+        if segments:
+            try:
+                plan_video_crop_centres(video_info['path'], (video_info['clip'].w, video_info['clip'].h), segments)
+            except Exception as e:
+                log(f"    ⚠️ Lỗi sample video {video_info['file']}: {str(e)}")
+    
+    # Cắt + smart crop theo thứ tự đã plan (crop centre lấy từ cache)
+    for seg in planned_segments:
+        try:
+            video_clip = seg['video']['clip']
+            sub_clip = video_clip if seg.get('whole') else video_clip.subclip(seg['start'], seg['end'])
+            sub_clip = smart_resize_video(sub_clip, RESOLUTION, FPS,
+                                          source_path=seg['video']['path'], segment=(seg['start'], seg['end']))
+            video_clips.append(sub_clip)
+        except Exception as e:
+            log(f"    ❌ Lỗi xử lý clip {seg['video']['file']} ({seg['start']:.1f}s-{seg['end']:.1f}s): {str(e)}")
+            estimated_video_duration -= (seg['end'] - seg['start'])
+    
     # Đếm số video bị loại bỏ và bù nguyên liệu
     removed_videos_count = len(selected_videos) - processed_videos
     
@@ -2750,9 +4347,13 @@ def create_memories_video(username=None, custom_music_path=None):
             # Đủ thời gian, làm ảnh đơn
             log(f"Đủ thời gian ({time_per_single_image:.1f}s/ảnh), tạo ảnh đơn")
             
-            for i, image_file in enumerate(selected_images):
-                image_path = find_file_path_func(image_file)
-                single_clip = create_image_collage([image_path], time_per_single_image)
+            single_clips = create_image_collages_parallel(
+                [[find_file_path_func(image_file)] for image_file in selected_images],
+                [time_per_single_image] * len(selected_images)
+            )
+            for i, (image_file, single_clip) in enumerate(zip(selected_images, single_clips)):
+                if single_clip is None:
+                    continue
                 
                 clips.append(single_clip)
                 total_duration += time_per_single_image
@@ -2908,9 +4509,13 @@ def create_memories_video(username=None, custom_music_path=None):
                 
                 # Tạo clips từ groups với thời gian tương ứng
                 clips_with_duration = []
-                for i, (group, duration) in enumerate(zip(collage_clips, clip_durations)):
-                    group_paths = [find_file_path_func(img) for img in group]
-                    collage_clip = create_image_collage(group_paths, duration)
+                built_collages = create_image_collages_parallel(
+                    [[find_file_path_func(img) for img in group] for group in collage_clips],
+                    clip_durations
+                )
+                for i, (group, duration, collage_clip) in enumerate(zip(collage_clips, clip_durations, built_collages)):
+                    if collage_clip is None:
+                        continue
                     clips_with_duration.append((collage_clip, duration, len(group)))
                     clips.append(collage_clip)
                     total_duration += duration
@@ -2942,19 +4547,26 @@ def create_memories_video(username=None, custom_music_path=None):
                     single_time = 5.0
                     remaining_after_singles = remaining_time - (single_count * single_time)
                     
+                    # Ảnh đơn + nhóm ghép phần còn lại (nếu đủ thời gian) dựng song song trong 1 đợt
+                    groups = [[find_file_path_func(selected_images[i])] for i in range(single_count)]
+                    durations = [single_time] * single_count
+                    with_remaining_group = bool(remaining_images) and remaining_after_singles >= 1.8
+                    if with_remaining_group:
+                        groups.append([find_file_path_func(img) for img in remaining_images])
+                        durations.append(remaining_after_singles)
+                    built_clips = create_image_collages_parallel(groups, durations)
+                    
                     # Tạo ảnh đơn
                     for i in range(single_count):
-                        image_path = find_file_path_func(selected_images[i])
-                        single_clip = create_image_collage([image_path], single_time)
-                        clips.append(single_clip)
+                        if built_clips[i] is None:
+                            continue
+                        clips.append(built_clips[i])
                         total_duration += single_time
                         log(f"  => Ảnh đơn {i+1}: {selected_images[i]} ({single_time:.1f}s)")
                     
                     # Ghép phần còn lại nếu có và đủ thời gian
-                    if remaining_images and remaining_after_singles >= 1.8:
-                        group_paths = [find_file_path_func(img) for img in remaining_images]
-                        collage_clip = create_image_collage(group_paths, remaining_after_singles)
-                        clips.append(collage_clip)
+                    if with_remaining_group and built_clips[-1] is not None:
+                        clips.append(built_clips[-1])
                         total_duration += remaining_after_singles
                         log(f"  => Nhóm ghép: {len(remaining_images)} ảnh ({remaining_after_singles:.1f}s)")
 